@@ -1,39 +1,40 @@
 # bot/Discord/zia.py
 import discord  # Import the discord library for interacting with the Discord API.
-import requests  # Import the requests library for making HTTP requests to the AI endpoints.
+import asyncio  # Import the asyncio library for running AI calls without blocking the event loop.
 import os  # Import the os library for interacting with the operating system (e.g., file paths).
 import json  # Import the json library for working with JSON data.
 import sys  # Import the sys library for system-specific parameters and functions.
-import datetime  # Import the datetime library for working with dates and times.
 
 # Define paths to configuration and secret files.  These are used throughout the script.
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Get the directory of the current file.
 ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))  # Get the root directory of the project.
-DISCORD_SECRETS_PATH = os.path.join(ROOT_DIR, "secrets", "connects", "discord.json")  # Path to the Discord secrets file (token, channel IDs).
-ROUTE_PATH = os.path.join(ROOT_DIR, "secrets", "config", "route.json")  # Path to the route configuration file (AI endpoints, model).
-PERSONA_PATH = os.path.join(ROOT_DIR, "config", "persona.json")  # Path to the persona configuration file (AI personality).
-MEMORY_DIR = os.path.join(ROOT_DIR, "secrets", "db")  # Path to the directory where conversation memory will be stored.
-APP_PATH = os.path.join(ROOT_DIR, "config", "app.json")  # Path to the application configuration file (memory limits, token limits).
-
-# Create the memory directory if it doesn't exist.  This ensures that the bot can store conversation history.
-os.makedirs(MEMORY_DIR, exist_ok=True)
-
-# Load application configuration from app.json.  This file contains settings for memory and token limits.
-try:
-    with open(APP_PATH, "r") as f:
-        app_config = json.load(f)
-except Exception as e:
-    # If the file fails to load, print a warning and use default values. This prevents the bot from crashing.
-    print(f"⚠️ Failed to load app.json, using defaults: {e}")
-    app_config = {
-        "memory": {"log_limit": 100, "load_limit": 10},  # Configure memory log and load limits.
-        "tokens": {"max_tokens": 100}  # Configure the maximum number of tokens for AI responses.
-    }
-
-# Extract configuration values from the loaded app_config.
-LOG_LIMIT = app_config["memory"]["log_limit"]  # Maximum number of messages to store in memory.
-LOAD_LIMIT = app_config["memory"]["load_limit"]  # Maximum number of messages to load from memory for context.
-MAX_TOKENS = app_config["tokens"]["max_tokens"]  # Maximum number of tokens allowed in the AI response.
+sys.path.insert(0, ROOT_DIR)  # Make the shared bot.core package importable when run as a script.
+
+from bot.core.runtime import shared_runtime, load_config, project_root  # Configs, memory, AI client, caches and scheduler shared with other adapters.
+from bot.core.turns import TurnPipeline  # The turn pipeline shared by all platforms.
+from bot.core.streaming import ProgressiveReply, split_message, streaming_options, DISCORD_MESSAGE_LIMIT  # Streamed replies.
+from bot.core.sharding import (  # AutoShardedClient mode, optionally split across worker processes.
+    InferencePool, ShardSupervisor, recommended_shards, run_until_terminated, sharding_options, worker_assignment,
+)
+
+# Sharding settings, read before the runtime is built because they decide how it is shared.
+SHARDING = sharding_options(load_config(os.path.join(project_root(ROOT_DIR), "config", "app.json"), {}))
+MULTI_PROCESS = SHARDING["enabled"] and SHARDING["workers"] > 1  # A supervisor process plus one process per slice of shards.
+WORKER = worker_assignment()  # This worker's shards and the inference pool's address, when started by the supervisor.
+
+# Load app.json, route.json and persona.json and build the shared components.  Standalone this creates them for this
+# process; inside the gateway (bot/gateway/zia.py) the other adapters use the same ones.  With worker processes the
+# memory files are shared between processes, but each channel belongs to one worker, so the memory cache stays on;
+# workers send their model calls to the supervisor's inference pool.
+RUNTIME = shared_runtime(ROOT_DIR, shared=MULTI_PROCESS, pinned=True, pool=WORKER["pool"] if WORKER else None)
+if WORKER:
+    RUNTIME.worker = WORKER["worker"]  # The supervisor re-indexes docs and archives memory; workers only answer.
+app_config = RUNTIME.app_config  # Memory, token, context, cache and scheduler settings.
+STREAMING = streaming_options(app_config)  # Whether replies are edited in place while the model streams.
+SCHEDULER = RUNTIME.scheduler  # Per-channel turn queue with coalescing and load shedding.
+METRICS = RUNTIME.metrics  # Per-stage timings and counters, exported in the Prometheus format.
+TURNS = TurnPipeline(RUNTIME, "discord")  # Answers a channel's message: memory, docs, prompt, reply cache, model call, save.
+DISCORD_SECRETS_PATH = os.path.join(RUNTIME.root_dir, "secrets", "connects", "discord.json")  # Path to the Discord secrets file (token, channel IDs).
 
 # Load Discord secrets from discord.json.  This file contains the bot token and a list of channel IDs.
 try:
@@ -44,167 +45,85 @@ except Exception as e:
     print(f"❌ Failed to load Discord secrets: {e}")
     sys.exit(1)
 
-# Extract the bot token and channel IDs from the loaded discord_secrets.
+# Extract the bot token from the loaded discord_secrets.  Channel IDs (DC_ID_*) and their personas (DC_PERSONA_*) are
+# compiled into the runtime's routing table, which is rebuilt when discord.json or the configs change.
 TOKEN = discord_secrets.get("DT_01")  # Bot token for authentication.
-CHANNEL_IDS = [int(discord_secrets[k]) for k in discord_secrets if k.startswith("DC_ID_")]  # List of channel IDs where the bot should respond.
 
 # Validate the loaded secrets.  The bot requires a valid token and at least one channel ID to run.
 if not TOKEN:
     print("❌ Missing DT_01 in discord.json")
     sys.exit(1)
-if not CHANNEL_IDS:
+if not RUNTIME.table.channels("discord"):
     print("❌ No DC_ID_* entries found in discord.json")
     sys.exit(1)
 
-# Load route configuration from route.json.  This file contains the AI endpoint URLs and the model name.
-try:
-    with open(ROUTE_PATH, "r") as f:
-        route_config = json.load(f)
-except Exception as e:
-    # If the file fails to load, print an error and exit the program. The bot requires a valid route configuration.
-    print(f"❌ Failed to load route config: {e}")
-    sys.exit(1)
-
-# Extract the AI endpoint URLs and model name from the loaded route_config.
-ENDPOINTS = route_config.get("endpoints", [])  # List of AI endpoint URLs.
-MODEL = route_config.get("model", "qwen3-v1-4b")  # Name of the AI model.
-
-# Validate the loaded route configuration.  The bot requires at least one endpoint configured.
-if not ENDPOINTS:
-    print("❌ No endpoints configured in route.json")
-    sys.exit(1)
-
-# Load persona configuration from persona.json.  This file defines the AI's personality.
-try:
-    with open(PERSONA_PATH, "r") as f:
-        persona_config = json.load(f)
-except Exception as e:
-    # If the file fails to load, print a warning and use a built-in default persona.
-    print(f"⚠️ Persona config not found or invalid, using built-in default: {e}")
-    persona_config = {
-        "default": {
-            "role": "system",
-            "content": "You are ZIA, a friendly indie dev lounge AI. Keep replies short and casual."
-        }
-    }
-
-# Function to load conversation memory from a file.
-def load_memory(channel_id):
+# Function to call the AI endpoint.
+async def call_ai(message_content, channel_id):
     """
-    Loads conversation history from a JSON file.
+    Calls the AI endpoint to get a response without blocking the event loop.
 
     Args:
+        message_content: The user's message.
         channel_id: The ID of the Discord channel.
 
     Returns:
-        A list of message dictionaries.  Returns an empty list if the file does not exist.
+        The AI's response.
     """
-    path = os.path.join(MEMORY_DIR, f"{channel_id}.json")  # Path to the memory file for the channel.
-    if not os.path.exists(path):
-        return []  # Return an empty list if the file does not exist.
-    with open(path, "r") as f:
-        history = json.load(f)  # Load the conversation history from the file.
-    return history[-LOAD_LIMIT:]  # Return the last LOAD_LIMIT messages.
+    return await TURNS.call(channel_id, message_content)  # Memory, docs, prompt, reply cache, model, save, summary and metrics, as on every platform.
 
-# Function to save conversation memory to a file.
-def save_memory(channel_id, role, content):
+# Function to stream the AI response.
+async def stream_ai(message_content, channel_id):
     """
-    Saves a message to the conversation history file.
-
-    Args:
-        channel_id: The ID of the Discord channel.
-        role: The role of the message sender ("user" or "assistant").
-        content: The content of the message.
-    """
-    path = os.path.join(MEMORY_DIR, f"{channel_id}.json")  # Path to the memory file for the channel.
-    history = []  # Initialize an empty list to store the conversation history.
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            history = json.load(f)  # Load the existing conversation history.
-    history.append({  # Append the new message to the history.
-        "role": role,  # The role of the message sender.
-        "content": content,  # The content of the message.
-        "timestamp": datetime.datetime.now().isoformat()  # The timestamp of the message.
-    })
-    history = history[-LOG_LIMIT:]  # Keep only the last LOG_LIMIT messages.
-    with open(path, "w") as f:
-        json.dump(history, f, indent=2)  # Save the updated conversation history to the file.
-
-# Function to get the persona for a specific channel.
-def get_persona_for_channel(channel_id: int):
-    """
-    Gets the persona for a specific channel.
+    Streams the AI response chunk by chunk, saving the conversation once the stream ends.
 
     Args:
+        message_content: The user's message.
         channel_id: The ID of the Discord channel.
 
-    Returns:
-        A dictionary containing the persona information.
-    """
-    persona_name = None
-    for key, value in discord_secrets.items():
-        if key.startswith("DC_ID_"):
-            persona_key = key.replace("DC_ID_", "DC_PERSONA_")  # Construct the key for the persona name.
-            persona_name = discord_secrets.get(persona_key, "default")  # Get the persona name from the secrets.
-            print(f"Channel {value} → Persona: {persona_name}")  # Print the channel ID and persona name.
-            break
-    if not persona_name:
-        persona_name = "default"  # Use the default persona if no channel-specific persona is found.
-    return persona_config.get(persona_name, persona_config["default"])  # Return the persona configuration.
+    Yields:
+        Chunks of the AI's response as the model generates them.
+    """
+    async for chunk in TURNS.stream(channel_id, message_content):  # Relay chunks from the best available endpoint (or the reply cache).
+        yield chunk
 
-# Function to call the AI endpoint.
-def call_ai(message_content, channel_id):
+# Function to send a reply that is edited while the model streams.
+async def send_streamed_reply(channel, chunks):
     """
-    Calls the AI endpoint to get a response.
+    Posts a placeholder, then edits it with the accumulated reply.
 
-    Args:
-        message_content: The user's message.
-        channel_id: The ID of the Discord channel.
+    Edits are coalesced to one per edit_interval seconds to stay under Discord's rate limits,
+    and replies longer than 2000 characters continue in follow-up messages.
 
-    Returns:
-        The AI's response.
+    Args:
+        channel: The Discord channel to reply in.
+        chunks: Async iterator of reply chunks.
     """
-    persona = get_persona_for_channel(channel_id)  # Get the persona for the channel.
-    memory = load_memory(channel_id)  # Load the conversation memory.
-    messages = [persona] + memory + [{"role": "user", "content": message_content}]  # Construct the message list.
-
-    for endpoint in ENDPOINTS:  # Iterate over the list of AI endpoints.
-        try:
-            # First attempt with model
-            payload = {
-                "model": MODEL,
-                "messages": messages,
-                "max_tokens": MAX_TOKENS
-            }
-            response = requests.post(endpoint, json=payload, timeout=10)
-
-            # Retry without model if failed
-            if response.status_code != 200:
-                print(f"⚠️ Endpoint {endpoint} returned {response.status_code}, retrying without model...")
-                payload.pop("model", None)
-                response = requests.post(endpoint, json=payload, timeout=10)
-
-            if response.status_code == 200:
-                reply = response.json()["choices"][0]["message"]["content"]
-
-                # Persist the conversation to memory.
-                save_memory(channel_id, "user", message_content)
-                save_memory(channel_id, "assistant", reply)
-                return reply
-            else:
-                print(f"⚠️ Endpoint {endpoint} still failed with {response.status_code}")
-                continue
-
-        except Exception as e:
-            print(f"⚠️ Failed on {endpoint}: {e}")
-            continue
-
-    return "⚠️ All endpoints failed, please try again later."
+    progress = ProgressiveReply(DISCORD_MESSAGE_LIMIT, STREAMING["edit_interval"]["discord"], STREAMING["placeholder"])
+    sent = [await channel.send(STREAMING["placeholder"])]  # Messages posted for this reply so far.
+
+    async def apply(updates):
+        with METRICS.stage("discord", "send"):
+            for index, text in updates:
+                if index < len(sent):
+                    await sent[index].edit(content=text)
+                else:
+                    sent.append(await channel.send(text))
+
+    async for chunk in chunks:
+        if progress.feed(chunk):
+            await apply(progress.updates())
+    await apply(progress.updates(final=True))  # Final edit without the typing cursor.
 
 # Create a Discord client.
 intents = discord.Intents.default()
 intents.message_content = True  # Enable message content intent.
-client = discord.Client(intents=intents)
+if WORKER:
+    # A worker connects only its own shards; Discord routes each guild (and so each channel) to exactly one of them.
+    client = discord.AutoShardedClient(intents=intents, shard_count=WORKER["shard_count"], shard_ids=WORKER["shards"])
+elif SHARDING["enabled"]:
+    client = discord.AutoShardedClient(intents=intents, shard_count=SHARDING["shard_count"])  # All shards in this process.
+else:
+    client = discord.Client(intents=intents)
 
 # Define an event handler for the on_ready event.
 @client.event
@@ -213,7 +132,28 @@ async def on_ready():
     This function is called when the bot is ready.
     """
     print(f"✅ Logged in as {client.user}")  # Print a message indicating that the bot has logged in.
-    print(f"Listening on channels: {CHANNEL_IDS}")  # Print a message indicating the channels the bot is listening on.
+    if SHARDING["enabled"]:
+        print(f"Running shards {sorted(client.shards)} of {client.shard_count}")  # Print the shards this process handles.
+    print(f"Listening on channels: {sorted(RUNTIME.table.channels('discord'))}")  # Print the channels the bot is listening on.
+
+# Function to answer one turn of a channel.
+async def reply_to(channel_id, messages):
+    """
+    Answers the messages queued for a channel in one turn.
+
+    Args:
+        channel_id: The ID of the Discord channel.
+        messages: The Discord messages of this turn, oldest first (more than one when they were coalesced).
+    """
+    channel = messages[-1].channel  # All messages of a turn come from the same channel.
+    content = "\n".join(m.content for m in messages)  # Messages sent during the previous reply are answered together.
+    if STREAMING["enabled"]:
+        await send_streamed_reply(channel, stream_ai(content, channel_id))
+        return
+    reply = await call_ai(content, channel_id)  # Call the AI endpoint to get a response.
+    with METRICS.stage("discord", "send"):
+        for page in split_message(reply, DISCORD_MESSAGE_LIMIT):  # Respect Discord's 2000-character limit.
+            await channel.send(page)  # Send the AI's response to the channel.
 
 # Define an event handler for the on_message event.
 @client.event
@@ -225,14 +165,56 @@ async def on_message(message):
         return
     if message.content.strip().startswith("!"):  # Ignore messages that start with an exclamation mark.
         return
-    if message.channel.id not in CHANNEL_IDS:  # Ignore messages sent in channels that are not in the list of allowed channels.
+    if not RUNTIME.table.listens("discord", message.channel.id):  # Ignore channels that are not in the list of allowed channels (a set lookup).
         return
-    reply = call_ai(message.content, message.channel.id)  # Call the AI endpoint to get a response.
-    await message.channel.send(reply)  # Send the AI's response to the channel.
+    # Turns in a channel run one at a time so memory is saved in order, and a full queue sheds messages with a busy reply.
+    if not SCHEDULER.submit(message.channel.id, message, reply_to):  # Queue the message behind the channel's current turn.
+        busy = SCHEDULER.busy_reply(message.channel.id)  # The queue is full: say so, at most once per cooldown.
+        if busy:
+            await message.channel.send(busy)
+
+# Function to run the bot.  The gateway runs it next to the other adapters.
+async def serve():
+    """
+    Connects to Discord and handles messages until the connection closes or the task is cancelled.
+    """
+    try:
+        if not RUNTIME.hosted:
+            await RUNTIME.start()  # Config hot reload, plus the /metrics port and profiler if app.json turns them on (the gateway starts its own).
+        async with client:
+            await client.start(TOKEN)  # Run the bot using the Discord token.
+    finally:
+        if not RUNTIME.hosted:
+            await RUNTIME.aclose()  # Flush memory and close the AI client's connections (the gateway does this itself).
+
+# Function to run the worker processes.  Used instead of serve() when sharding.workers is above 1.
+async def supervise():
+    """
+    Serves the shared inference pool and runs one worker process per slice of the shards until cancelled.
+    """
+    supervisor = None
+    pool = InferencePool(RUNTIME, SHARDING["pool_host"], SHARDING["pool_port"])
+    try:
+        await RUNTIME.start()  # Config reload for the pool's clients, docs re-index, memory archiver, metrics.
+        url = await pool.start()
+        shard_count = SHARDING["shard_count"] or await asyncio.to_thread(recommended_shards, TOKEN, SHARDING["workers"])
+        shard_count = max(shard_count, SHARDING["workers"])  # Every worker needs at least one shard.
+        supervisor = ShardSupervisor(
+            os.path.abspath(__file__), SHARDING["workers"], shard_count, url, SHARDING["start_delay"], SHARDING["restart_delay"]
+        )
+        await supervisor.run()
+    finally:
+        if supervisor is not None:
+            await supervisor.stop()  # Workers flush their memory before they exit.
+        await pool.stop()
+        await RUNTIME.aclose()
 
 # Run the bot.
 if __name__ == "__main__":
     try:
-        client.run(TOKEN)  # Run the bot using the Discord token.
+        if MULTI_PROCESS and not WORKER:
+            asyncio.run(run_until_terminated(supervise()))  # This process only supervises; the workers connect to Discord.
+        else:
+            asyncio.run(run_until_terminated(serve()))  # SIGTERM (e.g. from the supervisor) still flushes memory.
     except KeyboardInterrupt:
         print("🛑 Shutting down Discord bot...")  # Print a message indicating that the bot is shutting down.
@@ -0,0 +1,2 @@
+# bot/core/__init__.py
+# Shared building blocks used by the Discord, Slack and web handlers.
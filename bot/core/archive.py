@@ -0,0 +1,244 @@
+# bot/core/archive.py
+import os
+import json
+import time
+import zipfile
+import threading
+
+from bot.core.locks import file_lock
+
+# Archive settings used when app.json has no "archive" block (or leaves a key out).
+DEFAULT_ARCHIVE_OPTIONS = {
+    "enabled": False,
+    "idle_days": 30,  # Scopes without a new message for this long are archived.
+    "interval": 3600,  # Seconds between archive passes in the bots (0: only bot/tools/archive_memory.py archives).
+    "path": "archive",  # Folder of the segments, relative to the memory directory.
+    "compression": "lzma",  # "lzma", "bzip2" or "deflate".
+    "batch": 200,  # Scopes archived per segment write (and per lock hold).
+    "repack_ratio": 0.5,  # Rewrite a segment once this share of it belongs to scopes that were restored.
+}
+
+COMPRESSION = {"deflate": zipfile.ZIP_DEFLATED, "bzip2": zipfile.ZIP_BZIP2, "lzma": zipfile.ZIP_LZMA}
+
+
+def archive_options(app_config):
+    """
+    Returns the "archive" block of app.json, filled in with defaults.
+    """
+    return {**DEFAULT_ARCHIVE_OPTIONS, **app_config.get("archive", {})}
+
+
+class Archive:
+    """
+    Cold storage for the history of idle scopes.
+
+    The stores hand over scopes that have been quiet for a while (see
+    MemoryStore.archive_idle); their log, index and summary leave the memory
+    directory and become members of a compressed zip segment.  Segments are
+    partitioned by the month of the scopes' last message
+    (archive/2026-10/<written at>.zip), and each archive pass writes its own
+    segments in one go, so a crash never leaves a half-written one behind.
+
+    manifest.json maps every archived scope (by its string form, as in the
+    stores' file names) to its segment and the sequence number of its first
+    record.  The next time a scope is used the store calls take() and puts the
+    history back exactly as it was; the member becomes dead space, and a segment
+    is rewritten without its dead members once they make up `repack_ratio` of it
+    (or deleted when nothing in it is live).
+
+    Several processes can share an archive: changes hold a file lock, and the
+    manifest is re-read whenever another process has rewritten it.
+
+    Args:
+        path: Folder of the segments and manifest.json.
+        compression: "lzma", "bzip2" or "deflate".
+        repack_ratio: Share of dead bytes at which a segment is rewritten.
+    """
+
+    def __init__(self, path, compression="lzma", repack_ratio=0.5):
+        self.path = path
+        self.compression = COMPRESSION.get(compression, zipfile.ZIP_DEFLATED)
+        self.repack_ratio = repack_ratio
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.restored = 0
+        self._manifest = {"scopes": {}, "segments": {}}
+        self._stamp = None  # (mtime_ns, size) of manifest.json when it was last read.
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def contains(self, scope):
+        """
+        Returns whether a scope's history is in the archive.  Costs a stat() once the manifest is loaded.
+        """
+        with self._lock:
+            self._reload()
+            return str(scope) in self._manifest["scopes"]
+
+    def add(self, entries):
+        """
+        Archives a batch of scopes.
+
+        Args:
+            entries: List of dicts with "scope", "data" (the log in the compact
+                JSONL format), "base" (sequence number of its first record),
+                "count", "last" (epoch seconds of the last message), "summary"
+                (or None) and "bytes" (what the scope took up before).
+
+        Returns:
+            The number of compressed bytes written.
+        """
+        entries = [{**entry, "scope": str(entry["scope"])} for entry in entries]
+        partitions = {}
+        for entry in entries:
+            partitions.setdefault(time.strftime("%Y-%m", time.localtime(entry["last"])), []).append(entry)
+        written = 0
+        with self._lock, file_lock(self.manifest_path + ".lock"):
+            self._reload()
+            for partition, batch in sorted(partitions.items()):
+                segment = f"{partition}/{time.time_ns()}.zip"
+                size, stored = self._write_segment(segment, batch)
+                written += size
+                self._manifest["segments"][segment] = {"bytes": size, "dead": 0}
+                for entry in batch:
+                    self._forget(entry["scope"])  # Left over from a pass that crashed before deleting the live copy.
+                    self._manifest["scopes"][entry["scope"]] = {
+                        "segment": segment,
+                        "base": entry["base"],
+                        "count": entry["count"],
+                        "last": entry["last"],
+                        "bytes": entry["bytes"],
+                        "stored": stored[entry["scope"]],
+                        "summary": entry["summary"] is not None,
+                    }
+            self._save()
+        return written
+
+    def take(self, scope):
+        """
+        Removes a scope from the archive and returns (data, base, summary), or None if it is not there.
+        """
+        scope = str(scope)
+        with self._lock, file_lock(self.manifest_path + ".lock"):
+            self._reload()
+            entry = self._manifest["scopes"].get(scope)
+            if entry is None:
+                return None
+            try:
+                with zipfile.ZipFile(os.path.join(self.path, entry["segment"])) as segment:
+                    data = segment.read(f"{scope}.jsonl")
+                    summary = json.loads(segment.read(f"{scope}.summary.json")) if entry["summary"] else None
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                print(f"⚠️ Could not restore {scope} from {entry['segment']}: {e}")
+                return None
+            self._forget(scope)
+            self._save()
+            self.restored += 1
+        return data, entry["base"], summary
+
+    def discard(self, scope):
+        """
+        Drops a scope's archived copy (its live history is newer).
+        """
+        scope = str(scope)
+        with self._lock, file_lock(self.manifest_path + ".lock"):
+            self._reload()
+            if scope in self._manifest["scopes"]:
+                self._forget(scope)
+                self._save()
+
+    def stats(self):
+        with self._lock:
+            self._reload()
+            scopes = self._manifest["scopes"].values()
+            segments = self._manifest["segments"].values()
+            return {
+                "scopes": len(self._manifest["scopes"]),
+                "messages": sum(entry["count"] for entry in scopes),
+                "segments": len(self._manifest["segments"]),
+                "original_bytes": sum(entry["bytes"] for entry in scopes),
+                "stored_bytes": sum(segment["bytes"] for segment in segments),
+                "dead_bytes": sum(segment["dead"] for segment in segments),
+                "restored": self.restored,
+            }
+
+    def _write_segment(self, segment, batch):
+        # Written under a temporary name and renamed, so a segment is either complete or absent.
+        # Returns (segment size, {scope: compressed bytes of its members}).
+        path = os.path.join(self.path, segment)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        stored = {}
+        with zipfile.ZipFile(tmp_path, "w", self.compression) as out:
+            for entry in batch:
+                out.writestr(f"{entry['scope']}.jsonl", entry["data"])
+                if entry["summary"] is not None:
+                    out.writestr(f"{entry['scope']}.summary.json", json.dumps(entry["summary"], ensure_ascii=False))
+                members = out.infolist()[-2 if entry["summary"] is not None else -1:]
+                # Compressed data plus the member's local and central directory headers.
+                stored[entry["scope"]] = sum(info.compress_size + 76 + 2 * len(info.filename) for info in members)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path), stored
+
+    def _forget(self, scope):
+        # Marks a scope's member as dead space, and repacks or deletes its segment when that is worth it.
+        entry = self._manifest["scopes"].pop(scope, None)
+        if entry is None:
+            return
+        name = entry["segment"]
+        segment = self._manifest["segments"].get(name)
+        if segment is None:
+            return
+        segment["dead"] += entry["stored"]
+        live = [s for s, e in self._manifest["scopes"].items() if e["segment"] == name]
+        path = os.path.join(self.path, name)
+        if not live:
+            del self._manifest["segments"][name]
+            if os.path.exists(path):
+                os.remove(path)
+            try:
+                os.rmdir(os.path.dirname(path))  # The partition's last segment.
+            except OSError:
+                pass
+        elif segment["dead"] >= segment["bytes"] * self.repack_ratio:
+            self._repack(name, live)
+
+    def _repack(self, name, live):
+        path = os.path.join(self.path, name)
+        keep = {f"{scope}.jsonl" for scope in live} | {f"{scope}.summary.json" for scope in live}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with zipfile.ZipFile(path) as old, zipfile.ZipFile(tmp_path, "w", self.compression) as new:
+            for info in old.infolist():
+                if info.filename in keep:
+                    new.writestr(info, old.read(info.filename))
+        os.replace(tmp_path, path)
+        self._manifest["segments"][name] = {"bytes": os.path.getsize(path), "dead": 0}
+
+    def _reload(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            self._manifest, self._stamp = {"scopes": {}, "segments": {}}, None
+            return
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self._stamp:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+            self._stamp = stamp
+
+    def _save(self):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.manifest_path)
+        st = os.stat(self.manifest_path)
+        self._stamp = (st.st_mtime_ns, st.st_size)
+
+
+def build_archive(app_config, memory_dir):
+    """
+    Returns the Archive described by the "archive" block of app.json, or None when it is off.
+    """
+    options = archive_options(app_config)
+    if not options["enabled"]:
+        return None
+    return Archive(os.path.join(memory_dir, options["path"]), options["compression"], options["repack_ratio"])
@@ -0,0 +1,236 @@
+# bot/core/cache.py
+import atexit
+import threading
+from collections import OrderedDict, deque
+
+from bot.core.memory import make_record
+
+
+class MemoryCache:
+    """
+    In-process LRU cache of recent conversation windows in front of a memory store.
+
+    The last `window` messages of the most recently used scopes are kept in RAM, so a
+    busy channel is read from disk once instead of on every message.  Saved messages
+    go into the cached window straight away and are written to the store in batches
+    by a background flusher (every `flush_interval` seconds, and at shutdown).  The
+    next sequence number of a cached scope is read from the store once and then
+    counted in RAM, so saving a message does not touch the disk.
+
+    MemoryCache exposes the same load/append interface as MemoryStore, so handlers can
+    use either one.
+
+    Args:
+        store: The MemoryStore that holds the on-disk logs.
+        max_entries: Maximum number of scopes kept in RAM before the least recently used is evicted.
+        window: Number of messages cached per scope (defaults to store.load_limit).
+        flush_interval: Seconds between write-behind flushes.  0 writes through immediately.
+    """
+
+    def __init__(self, store, max_entries=256, window=None, flush_interval=2.0):
+        self.store = store
+        self.max_entries = max_entries
+        self.window = window or store.load_limit
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+        self._entries = OrderedDict()  # scope -> deque of the last `window` records.
+        self._pending = {}  # scope -> records not yet written to the store.
+        self._seqs = {}  # scope -> sequence number the next appended message gets.
+        self._summaries = {}  # scope -> last summary read or written (None when there is none).
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Held while pending records are written to the store.
+        self._stop = threading.Event()
+        self._flusher = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="memory-cache-flush", daemon=True)
+            self._flusher.start()
+        atexit.register(self.close)
+
+    def load(self, scope, limit=None):
+        """
+        Returns the last `limit` messages for a scope, from RAM when possible.
+        """
+        limit = self.store.load_limit if limit is None else limit
+        if limit > self.window:
+            # Larger windows than we cache go straight to disk.
+            with self._flush_lock:
+                self._write_pending(scope)
+                return self.store.load(scope, limit)
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(scope)
+                return list(entry)[-limit:] if limit > 0 else []
+            self.misses += 1
+        with self._flush_lock:
+            # Anything still pending for this scope must reach disk before we read it back.
+            self._write_pending(scope)
+            records = self.store.load(scope, self.window)
+            with self._lock:
+                entry = self._entries.get(scope)
+                if entry is None:
+                    # Messages saved while we were reading are still pending; include them too.
+                    entry = deque(records + self._pending.get(scope, []), maxlen=self.window)
+                    if records and scope not in self._seqs:
+                        self._seqs[scope] = records[-1]["seq"] + 1 + len(self._pending.get(scope, []))
+                    self._insert(scope, entry)
+                return list(entry)[-limit:] if limit > 0 else []
+
+    def append(self, scope, role, content, tokens=None):
+        """
+        Adds a message to the cached window and queues it for the next flush.
+
+        Returns:
+            The sequence number the message will have in the store.
+        """
+        return self.write_records(scope, [make_record(role, content, tokens)])
+
+    def write_records(self, scope, records):
+        """
+        Adds already-built records (see memory.make_record) to the cached window as one batch.
+
+        They stay together in the pending list, so the next flush writes them to the
+        store in a single write.
+
+        Returns:
+            The sequence number the first record will have in the store.
+        """
+        if not records:
+            return None
+        with self._flush_lock:
+            first_seq = self._next_seq(scope)
+            for i, record in enumerate(records):
+                record["seq"] = first_seq + i
+            with self._lock:
+                entry = self._entries.get(scope)
+                if entry is not None:
+                    entry.extend(records)
+                    self._entries.move_to_end(scope)
+                    self._seqs[scope] = first_seq + len(records)
+                else:
+                    self._seqs.pop(scope, None)  # Only counted for cached scopes.
+                self._pending.setdefault(scope, []).extend(records)
+        if not self.flush_interval:
+            self.flush(scope)
+        return first_seq
+
+    def page(self, scope, before=None, limit=20):
+        """
+        Returns one page of history from the store (see MemoryStore.page), including pending messages.
+        """
+        self.flush(scope)
+        return self.store.page(scope, before, limit)
+
+    def next_seq(self, scope):
+        with self._flush_lock:
+            return self._next_seq(scope)
+
+    def _next_seq(self, scope):
+        # Called with the flush lock held, which keeps the store's count and our pending list in step.
+        with self._lock:
+            seq = self._seqs.get(scope)
+        if seq is None:
+            seq = self.store.next_seq(scope) + len(self._pending.get(scope, []))
+            with self._lock:
+                if scope in self._entries:
+                    self._seqs[scope] = seq
+        return seq
+
+    def load_summary(self, scope):
+        with self._lock:
+            if scope in self._summaries:
+                return self._summaries[scope]
+        summary = self.store.load_summary(scope)
+        with self._lock:
+            self._summaries[scope] = summary
+        return summary
+
+    def save_summary(self, scope, summary):
+        # Summaries are small and rare, so they are written through straight away.
+        self.store.save_summary(scope, summary)
+        with self._lock:
+            self._summaries[scope] = summary
+
+    def flush(self, scope=None):
+        """
+        Writes pending messages to the store, for one scope or for all of them.
+        """
+        with self._flush_lock:
+            self._write_pending(scope)
+
+    def _write_pending(self, scope=None):
+        with self._lock:
+            if scope is None:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {scope: self._pending.pop(scope)} if scope in self._pending else {}
+        if pending:
+            # One call for every scope, so stores that support it can commit them together.
+            failed = self.store.write_many(pending)
+            with self._lock:
+                for key, records in failed.items():
+                    self._pending[key] = records + self._pending.get(key, [])
+        if pending:
+            self.flushes += 1
+
+    def invalidate(self, scope):
+        """
+        Drops a scope from RAM so the next load re-reads it from the store.
+        """
+        self.flush(scope)
+        with self._lock:
+            self._entries.pop(scope, None)
+            self._summaries.pop(scope, None)
+            self._seqs.pop(scope, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "flushes": self.flushes,
+                "pending": sum(len(r) for r in self._pending.values()),
+            }
+
+    def close(self):
+        """
+        Stops the background flusher and writes everything that is still pending.
+        """
+        self._stop.set()
+        if self._flusher and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def _insert(self, scope, entry):
+        self._entries[scope] = entry
+        while len(self._entries) > self.max_entries:
+            # Pending writes live outside the cache entries, so eviction never loses data.
+            evicted, _ = self._entries.popitem(last=False)
+            self._summaries.pop(evicted, None)
+            self._seqs.pop(evicted, None)
+            self.evictions += 1
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+def build_memory(store, cache_config, window=None):
+    """
+    Wraps a MemoryStore in a MemoryCache when the memory_cache block of app.json enables it.
+    """
+    if not cache_config.get("enabled", False):
+        return store
+    return MemoryCache(
+        store,
+        max_entries=cache_config.get("max_entries", 256),
+        window=window,
+        flush_interval=cache_config.get("flush_interval", 2.0),
+    )
@@ -0,0 +1,206 @@
+# bot/core/capabilities.py
+import json
+import os
+import threading
+
+OPENAI = "openai"  # POST {"model", "messages", "max_tokens"} -> {"choices": [{"message": {...}}]}
+OLLAMA = "ollama"  # POST {"model", "messages", "stream", "options"} -> {"message": {...}}
+
+# Extra payload fields per schema, from the "prompt_cache" block of route.json.  They
+# let local servers keep a conversation's KV cache between turns, e.g.
+#   {"openai": {"cache_prompt": true}, "ollama": {"keep_alive": "30m"}}
+# (llama.cpp's server reads cache_prompt; Ollama unloads the model after keep_alive.)
+DEFAULT_PROMPT_CACHE_HINTS = {"openai": {}, "ollama": {}}
+
+# Statuses that mean "this payload shape is wrong" (the next shape is tried).  Any other
+# error (5xx, 429, a timeout) is the endpoint failing, and the learned shape is kept.
+REJECTED_STATUSES = (400, 404, 405, 422)
+
+
+def prompt_cache_hints(route_config):
+    """
+    Returns the "prompt_cache" block of route.json, filled in with defaults.
+    """
+    return {**DEFAULT_PROMPT_CACHE_HINTS, **route_config.get("prompt_cache", {})}
+
+
+def guess_schema(endpoint):
+    # Ollama's native chat API lives at /api/chat; everything else is treated as OpenAI-compatible.
+    return OLLAMA if endpoint.rstrip("/").endswith("/api/chat") else OPENAI
+
+
+def candidate_shapes(endpoint):
+    """
+    Payload shapes to try, in order, for an endpoint we know nothing about yet.
+
+    The schema guessed from the URL comes first, then the other one.  Within a
+    schema we start with the full payload and drop optional fields one at a time.
+    Prompt cache hints are left out here; CapabilityCache.shapes() tries them on
+    top of the shape that was learned.
+    """
+    first = guess_schema(endpoint)
+    second = OPENAI if first == OLLAMA else OLLAMA
+    shapes = []
+    for schema in (first, second):
+        shapes.append({"schema": schema, "send_model": True, "send_max_tokens": True})
+        shapes.append({"schema": schema, "send_model": False, "send_max_tokens": True})
+        shapes.append({"schema": schema, "send_model": False, "send_max_tokens": False})
+    return shapes
+
+
+def build_payload(shape, model, messages, max_tokens, stream=False, hints=None):
+    """
+    Builds the request body for an endpoint in the given shape.
+
+    `hints` are the prompt cache hints (see prompt_cache_hints()); they are only
+    added to shapes with "send_hints" set.
+    """
+    payload = {"messages": messages}
+    if hints and shape.get("send_hints"):
+        payload.update(hints.get(shape["schema"], {}))
+    if shape["send_model"]:
+        payload["model"] = model
+    if shape["schema"] == OLLAMA:
+        payload["stream"] = stream  # Ollama streams by default; a single JSON reply needs stream=false.
+        if shape["send_max_tokens"]:
+            payload["options"] = {"num_predict": max_tokens}
+    else:
+        if stream:
+            payload["stream"] = True
+        if shape["send_max_tokens"]:
+            payload["max_tokens"] = max_tokens
+    return payload
+
+
+def parse_reply(data):
+    """
+    Extracts the reply text from either response schema.
+
+    Returns:
+        A (reply, schema) tuple.
+    """
+    if "choices" in data:
+        return data["choices"][0]["message"]["content"], OPENAI
+    if "message" in data:
+        return data["message"]["content"], OLLAMA
+    raise ValueError(f"unrecognised response: {str(data)[:200]}")
+
+
+def parse_stream_line(line):
+    """
+    Parses one line of a streamed reply.
+
+    OpenAI-compatible servers send Server-Sent Events ("data: {...}" lines ending
+    with "data: [DONE]"); Ollama sends one JSON object per line.
+
+    Returns:
+        A (text, done) tuple, or None for blank lines, comments and other SSE fields.
+    """
+    line = line.strip()
+    if not line or line.startswith(":") or line.startswith(("event:", "id:", "retry:")):
+        return None
+    if line.startswith("data:"):
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return "", True
+        choice = json.loads(data)["choices"][0]
+        text = (choice.get("delta") or {}).get("content") or ""
+        return text, False
+    data = json.loads(line)
+    if "message" in data:
+        return data["message"].get("content") or "", bool(data.get("done"))
+    if "choices" in data:
+        # The server ignored stream=true and sent the whole reply at once.
+        return data["choices"][0]["message"]["content"], True
+    raise ValueError(f"unrecognised stream line: {line[:200]}")
+
+
+class CapabilityCache:
+    """
+    Remembers which payload shape each endpoint accepts.
+
+    The first request to an endpoint walks candidate_shapes() until one works; the
+    winning shape is cached for the life of the process (and in `path`, when given)
+    so every later message needs exactly one request.  If a cached shape is
+    rejected (see REJECTED_STATUSES), the endpoint is forgotten and rediscovered
+    on the next message; server errors and timeouts leave it cached.
+
+    Args:
+        path: Optional JSON file used to keep learned shapes across restarts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._shapes = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self._shapes = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable capability cache {path}: {e}")
+
+    def shapes(self, endpoint, hints=None):
+        """
+        Returns the shapes to try for an endpoint: the learned one, or every candidate.
+
+        With prompt cache `hints` for the learned shape's schema that have not been
+        tried on it yet, the shape with the hints comes first and the learned one
+        second; whichever is accepted is learned, so this happens once.
+        """
+        with self._lock:
+            known = self._shapes.get(endpoint)
+        if not known:
+            return candidate_shapes(endpoint)
+        if "send_hints" not in known and hints and hints.get(known["schema"]):
+            return [{**known, "send_hints": True}, {**known, "send_hints": False}]
+        return [known]
+
+    def known(self, endpoint):
+        with self._lock:
+            return self._shapes.get(endpoint)
+
+    def learn(self, endpoint, shape):
+        with self._lock:
+            if self._shapes.get(endpoint) == shape:
+                return
+            self._shapes[endpoint] = dict(shape)
+            print(f"✅ Endpoint {endpoint} accepts {describe(shape)}")
+            self._save()
+
+    def forget(self, endpoint):
+        with self._lock:
+            if self._shapes.pop(endpoint, None) is not None:
+                self._save()
+
+    def _save(self):
+        # Best effort: the shapes stay learned in memory, so a failed write must never fail the request.
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"  # Per-process name: web workers may learn at the same time.
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self._shapes, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not save capability cache {self.path}: {e}")
+
+
+def capability_cache(route_config, memory_dir):
+    """
+    Builds the CapabilityCache for a handler, persisted under memory_dir when route.json asks for it.
+    """
+    if route_config.get("capabilities", {}).get("persist", False):
+        return CapabilityCache(os.path.join(memory_dir, "capabilities.json"))
+    return CapabilityCache()
+
+
+def describe(shape):
+    fields = ["messages"]
+    if shape["send_model"]:
+        fields.append("model")
+    if shape["send_max_tokens"]:
+        fields.append("max_tokens")
+    if shape.get("send_hints"):
+        fields.append("cache hints")
+    return f"{shape['schema']} payloads ({', '.join(fields)})"
@@ -0,0 +1,151 @@
+# bot/core/channels.py
+
+# Platforms the routing table knows about.
+PLATFORMS = ("discord", "slack", "web")
+
+# Platforms whose bots only answer the channels listed for them; the others answer everywhere.
+LISTED_ONLY = {"discord"}
+
+# Channel settings used when app.json has no "channels" block (or leaves a key out).  Per-channel
+# overrides go under the platform's name, e.g.
+#   "discord": {"123456789": {"persona": "playful", "endpoints": "fast", "load_limit": 20, "max_tokens": 200}}
+DEFAULT_CHANNEL_OPTIONS = {
+    "reload_interval": 2.0,  # Seconds between checks of the config files for changes (0: never reload).
+    "discord": {},
+    "slack": {},
+    "web": {},
+}
+
+
+def channel_options(app_config):
+    """
+    Returns the "channels" block of app.json, filled in with defaults.
+    """
+    return {**DEFAULT_CHANNEL_OPTIONS, **app_config.get("channels", {})}
+
+
+def endpoint_groups(route_config):
+    """
+    Returns {group: endpoint URLs}: "default" is route.json's "endpoints", the rest its "groups" block.
+    """
+    groups = {name: list(endpoints) for name, endpoints in route_config.get("groups", {}).items() if endpoints}
+    groups["default"] = route_config.get("endpoints", [])
+    return groups
+
+
+def secret_channels(platform, secrets):
+    """
+    Returns {channel ID: persona name} as a platform's secrets file lists them.
+    """
+    if platform == "discord":
+        # DC_ID_<n> holds a channel ID and DC_PERSONA_<n> the persona for that same channel.
+        return {
+            str(value): secrets.get(key.replace("DC_ID_", "DC_PERSONA_"), "default")
+            for key, value in secrets.items()
+            if key.startswith("DC_ID_")
+        }
+    if platform == "slack":
+        return {key[len("SLACK_PERSONA_"):]: value for key, value in secrets.items() if key.startswith("SLACK_PERSONA_")}
+    return {}
+
+
+class ChannelRoute:
+    """
+    How one channel is answered: its persona, endpoint group and limits.
+
+    Args:
+        persona_name: Name of the persona in persona.json.
+        persona: The persona message itself.
+        group: Name of the endpoint group (see endpoint_groups()).
+        ai: Inference client for that group.
+        load_limit: Messages of history to load (None: app.json's memory.load_limit).
+        max_tokens: Maximum tokens per reply (None: the client's).
+    """
+
+    def __init__(self, persona_name, persona, group, ai, load_limit=None, max_tokens=None):
+        self.persona_name = persona_name
+        self.persona = persona
+        self.group = group
+        self.ai = ai
+        self.load_limit = load_limit
+        self.max_tokens = max_tokens
+
+
+class RoutingTable:
+    """
+    Channel -> ChannelRoute for every platform, compiled once from the config files.
+
+    A lookup is one dict access; config mistakes (unknown personas or endpoint
+    groups) are reported once, when the table is compiled, not on every message.
+    A table is never changed after it is built: on reload the runtime swaps in a
+    new one, so a turn that looked its route up keeps a consistent view.
+
+    Args:
+        routes: {(platform, channel ID): ChannelRoute} for the configured channels.
+        defaults: {platform: ChannelRoute} for other channels.
+    """
+
+    def __init__(self, routes, defaults):
+        self._routes = routes
+        self._defaults = defaults
+        self._listed = {}
+        for platform, channel in routes:
+            self._listed.setdefault(platform, set()).add(channel)
+        self._listed = {platform: frozenset(channels) for platform, channels in self._listed.items()}
+
+    def route(self, platform, channel):
+        """
+        Returns the route for a channel: its own if it is configured, else the platform's default.
+        """
+        route = self._routes.get((platform, str(channel)))
+        return route if route is not None else self._defaults[platform]
+
+    def listens(self, platform, channel):
+        """
+        Returns whether the platform's bot should answer in a channel (see LISTED_ONLY).
+        """
+        return platform not in LISTED_ONLY or str(channel) in self.channels(platform)
+
+    def channels(self, platform):
+        """
+        Returns the IDs (as strings) of the channels configured for a platform.
+        """
+        return self._listed.get(platform, frozenset())
+
+
+def compile_table(app_config, persona_config, secrets, clients):
+    """
+    Builds the RoutingTable from app.json, persona.json and the platform secrets.
+
+    Personas come from the secrets files (DC_PERSONA_<n>, SLACK_PERSONA_<channel>);
+    the "channels" block of app.json can override them and add an endpoint group
+    and limits per channel.
+
+    Args:
+        app_config: app.json.
+        persona_config: persona.json.
+        secrets: {platform: secrets dict} for the platforms that have a secrets file.
+        clients: {endpoint group: inference client}, with at least "default".
+    """
+    options = channel_options(app_config)
+
+    def make(where, settings):
+        name = settings.get("persona", "default")
+        if name not in persona_config:
+            print(f"⚠️ Unknown persona {name!r} for {where}, using the default one")
+            name = "default"
+        group = settings.get("endpoints", "default")
+        if group not in clients:
+            print(f"⚠️ Unknown endpoint group {group!r} for {where}, using the default endpoints")
+            group = "default"
+        return ChannelRoute(name, persona_config[name], group, clients[group], settings.get("load_limit"), settings.get("max_tokens"))
+
+    routes = {}
+    for platform in PLATFORMS:
+        listed = secret_channels(platform, secrets.get(platform, {}))
+        overrides = {str(channel): settings for channel, settings in (options.get(platform) or {}).items()}
+        for channel in {**listed, **overrides}:
+            settings = {"persona": listed.get(channel, "default"), **overrides.get(channel, {})}
+            routes[(platform, channel)] = make(f"{platform} channel {channel}", settings)
+    defaults = {platform: make(platform, {}) for platform in PLATFORMS}
+    return RoutingTable(routes, defaults)
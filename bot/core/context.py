@@ -0,0 +1,278 @@
+# bot/core/context.py
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from bot.core.summary import SUMMARY_HEADER
+
+# Context settings used when app.json has no "context" block (or leaves a key out).
+DEFAULT_CONTEXT_OPTIONS = {
+    "prompt_tokens": 2048,  # Token budget for persona + history + the new message.
+    "tokenizer": "approximate",  # "approximate", "tiktoken:<encoding>" or "huggingface:<model>".
+    "chars_per_token": 4,  # Used by the approximate tokenizer.
+    "message_overhead": 4,  # Tokens the chat template adds around every message.
+    "layout": "sliding",  # "sliding" (newest history that fits) or "stable" (append-only prefix, see ContextBuilder).
+    "slide_target": 0.5,  # Stable layout: share of the history budget left in use after the window slides.
+    "report_prefix": False,  # Print how much of each prompt repeats the previous one for the same scope.
+    "max_scopes": 1024,  # Scopes whose stable window and last prompt are remembered; the least recent are forgotten.
+}
+
+
+def context_options(app_config):
+    """
+    Returns the "context" block of app.json, filled in with defaults.
+    """
+    return {**DEFAULT_CONTEXT_OPTIONS, **app_config.get("context", {})}
+
+
+class ApproximateTokenizer:
+    """
+    Estimates token counts from the text length.  Fast, dependency-free and close
+    enough for budgeting English chat with BPE-style models.
+    """
+
+    def __init__(self, chars_per_token=4):
+        self.chars_per_token = chars_per_token
+        self.name = f"approximate:{chars_per_token}"
+
+    def count(self, text):
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+class TiktokenTokenizer:
+    """
+    Exact counts for OpenAI-style encodings (needs the optional tiktoken package).
+    """
+
+    def __init__(self, encoding):
+        import tiktoken
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken:{encoding}"
+
+    def count(self, text):
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class HuggingFaceTokenizer:
+    """
+    Exact counts for a Hugging Face model's tokenizer (needs the optional transformers package).
+    """
+
+    def __init__(self, model):
+        from transformers import AutoTokenizer
+        self._tokenizer = AutoTokenizer.from_pretrained(model)
+        self.name = f"huggingface:{model}"
+
+    def count(self, text):
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+
+def make_tokenizer(options):
+    """
+    Builds the tokenizer named in the context options, falling back to the approximate one.
+    """
+    spec = options["tokenizer"]
+    kind, _, arg = spec.partition(":")
+    try:
+        if kind == "tiktoken":
+            return TiktokenTokenizer(arg or "cl100k_base")
+        if kind == "huggingface":
+            return HuggingFaceTokenizer(arg)
+        if kind != "approximate":
+            print(f"⚠️ Unknown tokenizer {spec!r}, using the approximate one")
+    except Exception as e:
+        print(f"⚠️ Tokenizer {spec!r} unavailable ({e}), using the approximate one")
+    return ApproximateTokenizer(options["chars_per_token"])
+
+
+class ContextBuilder:
+    """
+    Assembles the prompt for a reply within a token budget.
+
+    The persona and the new message always go in; the remaining budget is filled
+    with history, newest message first, stopping at the first message that does
+    not fit (so the model never sees a conversation with a hole in it).  The
+    number of messages considered is still capped by what the handler loads.
+
+    With the "sliding" layout the window moves by one turn every turn, so the
+    start of the prompt changes each time and local servers (llama.cpp, LM Studio,
+    Ollama) can't reuse their cached KV state for it.  The "stable" layout keeps
+    the window's first message fixed per scope and only appends to it; once the
+    budget (or the loaded history) runs out, it jumps forward in one go, dropping
+    enough old messages to bring history down to `slide_target` of the budget.
+    Every prompt after that again shares its whole prefix with the previous one.
+
+    Token counts are saved with each message (the "tokens" field, keyed by
+    tokenizer name) when it is stored, so history is never re-tokenized; messages
+    saved before this existed are counted once and memoized.
+
+    Args:
+        tokenizer: Object with a `name` and a `count(text)` method, see make_tokenizer().
+        prompt_tokens: Token budget for the whole prompt.
+        message_overhead: Tokens added per message for the chat template.
+        layout: "sliding" or "stable".
+        slide_target: Stable layout: share of the history budget kept after a slide.
+        report_prefix: Print the prefix reuse of every prompt.
+        max_scopes: Most scopes remembered for the stable window and prefix reporting.
+    """
+
+    def __init__(self, tokenizer, prompt_tokens=2048, message_overhead=4, layout="sliding", slide_target=0.5, report_prefix=False, max_scopes=1024):
+        self.tokenizer = tokenizer
+        self.prompt_tokens = prompt_tokens
+        self.message_overhead = message_overhead
+        self.layout = layout
+        self.slide_target = slide_target
+        self.report_prefix = report_prefix
+        self.max_scopes = max_scopes
+        self.count = lru_cache(maxsize=4096)(tokenizer.count)
+        self.prompts = 0
+        self.total_tokens = 0
+        self.matched_tokens = 0
+        self._anchors = OrderedDict()  # scope -> sequence number of the first history message in the stable window, least recent first.
+        self._previous = OrderedDict()  # scope -> fingerprints of the messages in the last prompt, least recent first.
+        self._lock = threading.Lock()
+
+    def tokens(self, content):
+        """
+        Returns the value to store in a new message's "tokens" field.
+        """
+        return {self.tokenizer.name: self.count(content)}
+
+    def record_tokens(self, record):
+        """
+        Returns the token count of a stored message, using the saved count when there is one.
+        """
+        saved = (record.get("tokens") or {}).get(self.tokenizer.name)
+        if saved is None:
+            saved = self.count(record.get("content", ""))
+        return saved + self.message_overhead
+
+    def build(self, persona, history, user_message, summary=None, scope=None, notes=None):
+        """
+        Returns the messages to send: persona, as much recent history as fits, then the new message.
+
+        When the scope has a summary (see summary.Summarizer), it is appended to the
+        persona and the messages it covers are left out.  The stable layout and
+        prefix reporting need the `scope`; without one the sliding layout is used.
+        `notes` (e.g. passages from docs.KnowledgeBase) go in front of the new
+        message, the only part of the prompt that changes every turn anyway, and
+        their tokens come out of the history budget.
+        """
+        user = {"role": "user", "content": f"{notes}\n\n{user_message}" if notes else user_message}
+        head = [persona] if persona else []
+        loaded = len(history)
+        if summary:
+            history = [r for r in history if r.get("seq", summary["through"] + 1) > summary["through"]]
+            text = f"{SUMMARY_HEADER}\n{summary['content']}"
+            if persona:
+                # One system message: some chat templates reject a second one.
+                head = [{"role": persona["role"], "content": f"{persona['content']}\n\n{text}"}]
+            else:
+                head = [{"role": "system", "content": text}]
+        budget = self.prompt_tokens - sum(self.record_tokens(m) for m in head + [user])
+        if self.layout == "stable" and scope is not None:
+            picked = self._stable_window(scope, history, budget, summarized=len(history) < loaded)
+        else:
+            picked = self._recent_window(history, budget)
+        messages = head + [{"role": r["role"], "content": r["content"]} for r in picked] + [user]
+        if scope is not None:
+            self._record_prefix(scope, messages)
+        return messages
+
+    def _recent_window(self, history, budget):
+        # Newest messages that fit, stopping at the first one that doesn't.
+        start = len(history)
+        while start > 0:
+            cost = self.record_tokens(history[start - 1])
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+        return history[start:]
+
+    def _stable_window(self, scope, history, budget, summarized=False):
+        costs = [self.record_tokens(r) for r in history]
+        with self._lock:
+            anchor = self._anchors.get(scope)
+        start = 0
+        slid = False
+        if anchor is not None and history:
+            if history[0].get("seq", anchor) > anchor and not summarized:
+                # The window's first message is no longer loaded: slide by message count.
+                start = len(history) - int(len(history) * self.slide_target)
+                slid = True
+            else:
+                start = next((i for i, r in enumerate(history) if r.get("seq", anchor) >= anchor), len(history))
+        used = sum(costs[start:])
+        if used > budget:
+            # Out of room: jump forward once, far enough to leave space for the next turns.
+            target = budget * self.slide_target
+            while start < len(history) and used > target:
+                used -= costs[start]
+                start += 1
+            slid = True
+        while slid and start < len(history) and history[start]["role"] != "user":
+            start += 1  # Start the new window on a user turn, as chat templates expect.
+        if start < len(history):
+            with self._lock:
+                self._remember(self._anchors, scope, history[start].get("seq", anchor))
+        return history[start:]
+
+    def _remember(self, table, scope, value):
+        # Called with the lock held.  A scope that goes quiet is forgotten once
+        # max_scopes others have been seen since; its next prompt starts a new window.
+        table[scope] = value
+        table.move_to_end(scope)
+        while len(table) > self.max_scopes:
+            table.popitem(last=False)
+
+    def _record_prefix(self, scope, messages):
+        # Compare against the previous prompt for this scope, message by message.
+        fingerprints = [hash((m["role"], m["content"])) for m in messages]
+        with self._lock:
+            previous = self._previous.get(scope, [])
+            self._remember(self._previous, scope, fingerprints)
+        total = matched = 0
+        prefix = True
+        for i, message in enumerate(messages):
+            cost = self.record_tokens(message)
+            total += cost
+            prefix = prefix and i < len(previous) and previous[i] == fingerprints[i]
+            if prefix:
+                matched += cost
+        with self._lock:
+            self.prompts += 1
+            self.total_tokens += total
+            self.matched_tokens += matched
+        if self.report_prefix:
+            print(f"🔁 Prompt for {scope}: {matched}/{total} tokens match the previous one ({matched / max(total, 1):.0%})")
+
+    def stats(self):
+        """
+        Returns how much of the prompts built so far repeated the previous prompt of their scope.
+        """
+        with self._lock:
+            return {
+                "layout": self.layout,
+                "prompts": self.prompts,
+                "prompt_tokens": self.total_tokens,
+                "matched_tokens": self.matched_tokens,
+                "match_ratio": self.matched_tokens / self.total_tokens if self.total_tokens else None,
+            }
+
+
+def build_context(app_config):
+    """
+    Builds the ContextBuilder described by the "context" block of app.json.
+    """
+    options = context_options(app_config)
+    return ContextBuilder(
+        make_tokenizer(options),
+        options["prompt_tokens"],
+        options["message_overhead"],
+        layout=options["layout"],
+        slide_target=options["slide_target"],
+        report_prefix=options["report_prefix"],
+        max_scopes=options["max_scopes"],
+    )
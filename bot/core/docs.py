@@ -0,0 +1,510 @@
+# bot/core/docs.py
+import os
+import re
+import time
+import asyncio
+import hashlib
+import threading
+
+import requests
+
+from bot.core.storage import connect
+
+# Docs settings used when app.json has no "docs" block (or leaves a key out).
+DEFAULT_DOCS_OPTIONS = {
+    "enabled": False,
+    "path": "docs",  # Folder of docs, relative to the project root; first-level subfolders are collections.
+    "index": "docs_index.sqlite3",  # Index file in secrets/db.
+    "extensions": [".md", ".markdown", ".txt", ".rst"],
+    "chunk_tokens": 200,  # Target size of an indexed passage.
+    "top_k": 3,  # Passages added to a prompt.
+    "max_tokens": 600,  # Token budget for the passages (taken from the prompt budget, before history).
+    "min_score": 0.25,  # BM25 matches scoring under this share of the best one are dropped (common-word noise).
+    "budget_ms": 50,  # Retrieval time allowed per message; a slower lookup is skipped, not waited for.
+    "mmap_bytes": 256 * 1024 * 1024,  # Bytes of the index SQLite maps into memory instead of reading.
+    "refresh_on_start": True,  # Re-index changed files in the background when the bot starts.
+    "personas": {},  # Persona name -> {"top_k": n, "collections": [...]}; top_k 0 turns docs off for it.
+    "embeddings": {
+        "enabled": False,  # Rank by embedding similarity as well as BM25 (needs numpy and an embedding endpoint).
+        "endpoint": None,  # OpenAI-compatible /v1/embeddings or Ollama /api/embed URL.
+        "model": None,
+        "batch": 32,  # Passages per embedding request while indexing.
+        "candidates": 50,  # Results taken from each ranking before they are fused.
+    },
+}
+
+DOCS_HEADER = "Reference notes from the docs (use them only if they are relevant):"
+
+DOCS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    chunks INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+    text, title, path UNINDEXED, collection UNINDEXED, tokens UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS vectors (
+    chunk INTEGER PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+"""
+
+WORD = re.compile(r"\w+")
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+def docs_options(app_config):
+    """
+    Returns the "docs" block of app.json, filled in with defaults.
+    """
+    options = {**DEFAULT_DOCS_OPTIONS, **app_config.get("docs", {})}
+    options["embeddings"] = {**DEFAULT_DOCS_OPTIONS["embeddings"], **options["embeddings"]}
+    return options
+
+
+def chunk_document(text, title, chunk_tokens, count):
+    """
+    Splits a document into passages of about `chunk_tokens` tokens.
+
+    Markdown headings start a new passage and are kept as its title
+    ("file › Heading › Subheading"), so a passage makes sense on its own.
+    Paragraphs are never split unless one alone is over the limit.
+
+    Returns:
+        A list of (title, text) pairs.
+    """
+    chunks = []
+    headings = []
+    paragraphs = []
+
+    def flush():
+        section = " › ".join([title] + [h for _, h in headings])
+        size = 0
+        parts = []
+        for paragraph in paragraphs:
+            for piece in split_long(paragraph, chunk_tokens, count):
+                cost = count(piece)
+                if parts and size + cost > chunk_tokens:
+                    chunks.append((section, "\n\n".join(parts)))
+                    parts, size = [], 0
+                parts.append(piece)
+                size += cost
+        if parts:
+            chunks.append((section, "\n\n".join(parts)))
+        paragraphs.clear()
+
+    current = []
+    for line in text.splitlines():
+        heading = HEADING.match(line)
+        if heading:
+            if current:
+                paragraphs.append("\n".join(current))
+                current = []
+            flush()
+            level = len(heading.group(1))
+            headings[:] = [h for h in headings if h[0] < level] + [(level, heading.group(2))]
+        elif line.strip():
+            current.append(line.rstrip())
+        elif current:
+            paragraphs.append("\n".join(current))
+            current = []
+    if current:
+        paragraphs.append("\n".join(current))
+    flush()
+    return chunks
+
+
+def split_long(paragraph, chunk_tokens, count):
+    # A paragraph over the limit is cut on word boundaries.
+    if count(paragraph) <= chunk_tokens:
+        return [paragraph]
+    pieces, words = [], []
+    for word in paragraph.split():
+        words.append(word)
+        if count(" ".join(words)) >= chunk_tokens:
+            pieces.append(" ".join(words))
+            words = []
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def match_query(text, max_terms=32):
+    """
+    Turns a chat message into an FTS5 query: its distinct words, any of which may match.
+    """
+    terms = list(dict.fromkeys(w.casefold() for w in WORD.findall(text)))[:max_terms]
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def embed(options, texts, timeout):
+    """
+    Returns one embedding per text from the configured endpoint (OpenAI-compatible or Ollama).
+    """
+    endpoint = options["endpoint"]
+    response = requests.post(endpoint, json={"model": options["model"], "input": texts}, timeout=timeout)
+    response.raise_for_status()
+    body = response.json()
+    if "embeddings" in body:  # Ollama /api/embed
+        return body["embeddings"]
+    return [item["embedding"] for item in sorted(body["data"], key=lambda item: item["index"])]
+
+
+class KnowledgeBase:
+    """
+    Offline docs retrieval: a persistent BM25 index of a local folder, plus optional embeddings.
+
+    Documents are cut into passages (see chunk_document()) and kept in an SQLite
+    FTS5 table, which ranks them with BM25.  The index file is memory-mapped
+    (`mmap_bytes`), so opening it costs nothing and hot pages come straight from
+    the OS page cache.  refresh() re-indexes only files whose mtime or size
+    changed and whose content hash really differs, and drops deleted ones.
+
+    With embeddings enabled, every passage also gets a vector.  Vectors are kept
+    in the index and exported to .npy files next to it (the matrix and the
+    passage ids of its rows), opened with numpy's mmap_mode, and searched by dot
+    product; the two rankings are merged with reciprocal rank fusion.
+
+    notes() is what the handlers call: it looks up the passages for a persona's
+    message within `budget_ms` and returns them formatted for the prompt, or
+    None when docs are off, nothing matched or the lookup was too slow.
+
+    Args:
+        docs_dir: Folder of documents.
+        path: SQLite index file.
+        options: Docs settings, see DEFAULT_DOCS_OPTIONS.
+        count: Callable(text) -> token count (the context builder's).
+    """
+
+    def __init__(self, docs_dir, path, options=None, count=None):
+        self.docs_dir = docs_dir
+        self.path = path
+        self.options = {**DEFAULT_DOCS_OPTIONS, **(options or {})}
+        self.enabled = self.options["enabled"]
+        self.count = count or (lambda text: len(text) // 4 + 1)
+        self.embeddings = self.options["embeddings"]
+        base = os.path.splitext(path)[0]
+        self.vectors_path = f"{base}.vectors.npy"
+        self.ids_path = f"{base}.ids.npy"
+        self.searches = 0
+        self.timeouts = 0
+        self.files = 0
+        self.chunks = 0
+        self._vectors = None  # (mtime_ns, chunk ids, matrix) of the mmapped .npy files.
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._closing = False
+        self._db = None
+        if self.enabled and self.embeddings["enabled"]:
+            try:
+                import numpy  # noqa: F401
+            except ImportError:
+                print("⚠️ Docs embeddings need numpy; using BM25 only")
+                self.embeddings = {**self.embeddings, "enabled": False}
+        if self.enabled:
+            self._db = self._connect()
+            self._count(self._db)
+
+    def _count(self, db):
+        self.files, self.chunks = db.execute("SELECT count(*), coalesce(sum(chunks), 0) FROM files").fetchone()
+
+    def _connect(self):
+        db = connect(self.path, schema=DOCS_SCHEMA)
+        db.execute(f"PRAGMA mmap_size={int(self.options['mmap_bytes'])}")
+        return db
+
+    def persona_settings(self, persona_name):
+        """
+        Returns (top_k, collections) for a persona; collections None means all of them.
+        """
+        settings = self.options["personas"].get(persona_name, {})
+        return settings.get("top_k", self.options["top_k"]), settings.get("collections")
+
+    async def notes(self, persona_name, query):
+        """
+        Returns the prompt block of passages for a message, or None.
+        """
+        if not self.enabled or not query.strip():
+            return None
+        top_k, collections = self.persona_settings(persona_name)
+        if top_k <= 0:
+            return None
+        try:
+            passages = await asyncio.wait_for(
+                asyncio.to_thread(self.search, query, top_k, collections),
+                self.options["budget_ms"] / 1000,
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1  # The lookup finishes in its thread; this reply just goes without it.
+            return None
+        except Exception as e:
+            print(f"⚠️ Docs lookup failed: {e}")
+            return None
+        return self.format(passages)
+
+    def format(self, passages):
+        """
+        Formats passages for the prompt, best first, within the `max_tokens` budget.
+        """
+        lines = []
+        used = self.count(DOCS_HEADER)
+        for i, passage in enumerate(passages, 1):
+            block = f"[{i}] {passage['title']}\n{passage['text']}"
+            cost = self.count(block)
+            if used + cost > self.options["max_tokens"]:
+                break
+            lines.append(block)
+            used += cost
+        return f"{DOCS_HEADER}\n\n" + "\n\n".join(lines) if lines else None
+
+    def search(self, query, top_k=None, collections=None):
+        """
+        Returns the best passages for a query as dicts with title, text, path and score.
+        """
+        top_k = top_k or self.options["top_k"]
+        if self._db is None:
+            return []
+        self.searches += 1
+        candidates = max(top_k, self.embeddings["candidates"]) if self.embeddings["enabled"] else top_k
+        ranked = self._bm25(query, candidates, collections)
+        if self.embeddings["enabled"]:
+            ranked = self._fuse(ranked, self._nearest(query, candidates, collections))
+        return ranked[:top_k]
+
+    def _bm25(self, query, limit, collections):
+        expression = match_query(query)
+        if not expression:
+            return []
+        sql = "SELECT rowid, title, text, path, bm25(chunks, 1.0, 0.5) FROM chunks WHERE chunks MATCH ?"
+        params = [expression]
+        if collections is not None:
+            sql += f" AND collection IN ({', '.join('?' * len(collections))})"
+            params += list(collections)
+        sql += " ORDER BY bm25(chunks, 1.0, 0.5) LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(sql, params + [limit]).fetchall()
+        # FTS5's bm25() is lower-is-better; flip it so every score here is higher-is-better.
+        passages = [{"id": r[0], "title": r[1], "text": r[2], "path": r[3], "score": -r[4]} for r in rows]
+        cutoff = passages[0]["score"] * self.options["min_score"] if passages else 0
+        return [p for p in passages if p["score"] >= cutoff]
+
+    def _nearest(self, query, limit, collections):
+        import numpy as np
+
+        loaded = self._load_vectors()
+        if loaded is None:
+            return []
+        ids, matrix = loaded
+        try:
+            vector = np.asarray(embed(self.embeddings, [query], self.options["budget_ms"] / 1000)[0], dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Query embedding failed: {e}")
+            return []
+        vector /= np.linalg.norm(vector) or 1.0
+        scores = matrix @ vector
+        best = np.argsort(-scores)[: limit * 2 if collections is not None else limit]
+        wanted = [int(ids[i]) for i in best]
+        with self._lock:
+            rows = {
+                r[0]: r
+                for r in self._db.execute(
+                    f"SELECT rowid, title, text, path, collection FROM chunks WHERE rowid IN ({', '.join('?' * len(wanted))})",
+                    wanted,
+                )
+            }
+        results = []
+        for i in best:
+            row = rows.get(int(ids[i]))
+            if row is None or (collections is not None and row[4] not in collections):
+                continue
+            results.append({"id": row[0], "title": row[1], "text": row[2], "path": row[3], "score": float(scores[i])})
+        return results[:limit]
+
+    def _fuse(self, *rankings):
+        # Reciprocal rank fusion: a passage ranked well by either method comes out near the top.
+        fused = {}
+        for ranking in rankings:
+            for rank, passage in enumerate(ranking):
+                entry = fused.setdefault(passage["id"], {**passage, "score": 0.0})
+                entry["score"] += 1.0 / (60 + rank)
+        return sorted(fused.values(), key=lambda p: -p["score"])
+
+    def _load_vectors(self):
+        # (Re)open the mmapped matrix when refresh() has rewritten it, e.g. from bot/tools/index_docs.py.
+        import numpy as np
+
+        try:
+            mtime = os.stat(self.vectors_path).st_mtime_ns
+        except OSError:
+            return None
+        if self._vectors is None or self._vectors[0] != mtime:
+            matrix = np.load(self.vectors_path, mmap_mode="r")
+            ids = np.load(self.ids_path, mmap_mode="r")
+            if len(ids) != len(matrix):
+                return None  # Caught between the two renames of an export; the next search reopens them.
+            self._vectors = (mtime, ids, matrix)
+        return self._vectors[1], self._vectors[2]
+
+    def refresh(self, rebuild=False):
+        """
+        Brings the index up to date with the docs folder.
+
+        Unchanged files (same mtime and size, or same content hash) are skipped.
+        Runs on its own connection, so searches keep using the current index.
+
+        Returns:
+            Counts of files seen, indexed, unchanged and removed, chunks written and seconds taken.
+        """
+        started = time.perf_counter()
+        stats = {"files": 0, "indexed": 0, "unchanged": 0, "removed": 0, "chunks": 0}
+        if not os.path.isdir(self.docs_dir):
+            print(f"📁 No docs folder at {self.docs_dir}")
+            return {**stats, "seconds": 0.0}
+        with self._refresh_lock:
+            db = self._connect()
+            try:
+                if rebuild:
+                    db.executescript("DELETE FROM files; DELETE FROM chunks; DELETE FROM vectors;")
+                known = {row[0]: row[1:] for row in db.execute("SELECT path, mtime_ns, size, hash FROM files")}
+                seen = set()
+                for rel, full in self._walk():
+                    if self._closing:
+                        break
+                    stats["files"] += 1
+                    seen.add(rel)
+                    stat = os.stat(full)
+                    previous = known.get(rel)
+                    if previous and previous[0] == stat.st_mtime_ns and previous[1] == stat.st_size:
+                        stats["unchanged"] += 1
+                        continue
+                    with open(full, "rb") as f:
+                        data = f.read()
+                    digest = hashlib.sha256(data).hexdigest()
+                    if previous and previous[2] == digest:
+                        # Touched but not changed: only remember the new mtime.
+                        db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?", (stat.st_mtime_ns, stat.st_size, rel))
+                        stats["unchanged"] += 1
+                        continue
+                    stats["chunks"] += self._index_file(db, rel, data.decode("utf-8", errors="replace"), stat, digest)
+                    stats["indexed"] += 1
+                if not self._closing:
+                    for rel in set(known) - seen:
+                        self._remove_file(db, rel)
+                        stats["removed"] += 1
+                if self.embeddings["enabled"] and (stats["indexed"] or stats["removed"] or rebuild or not os.path.exists(self.vectors_path)):
+                    self._export_vectors(db)
+                self._count(db)
+            finally:
+                db.close()
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        if stats["indexed"] or stats["removed"]:
+            print(f"📚 Docs index updated: {stats['indexed']} file(s) indexed, {stats['removed']} removed, {stats['chunks']} passages")
+        return stats
+
+    def _walk(self):
+        extensions = tuple(self.options["extensions"])
+        for folder, dirs, files in os.walk(self.docs_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    full = os.path.join(folder, name)
+                    yield os.path.relpath(full, self.docs_dir).replace(os.sep, "/"), full
+
+    def _index_file(self, db, rel, text, stat, digest):
+        collection = rel.split("/")[0] if "/" in rel else ""
+        title = os.path.splitext(os.path.basename(rel))[0]
+        chunks = chunk_document(text, title, self.options["chunk_tokens"], self.count)
+        vectors = self._embed_chunks(rel, chunks)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete_chunks(db, rel)
+            for i, (section, body) in enumerate(chunks):
+                cursor = db.execute(
+                    "INSERT INTO chunks (text, title, path, collection, tokens) VALUES (?, ?, ?, ?, ?)",
+                    (body, section, rel, collection, self.count(body)),
+                )
+                if vectors is not None:
+                    db.execute("INSERT INTO vectors (chunk, vector) VALUES (?, ?)", (cursor.lastrowid, vectors[i]))
+            db.execute(
+                "INSERT OR REPLACE INTO files (path, mtime_ns, size, hash, chunks) VALUES (?, ?, ?, ?, ?)",
+                (rel, stat.st_mtime_ns, stat.st_size, digest, len(chunks)),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return len(chunks)
+
+    def _embed_chunks(self, rel, chunks):
+        # Normalized float32 vectors as bytes, or None (the file is then found by BM25 only).
+        if not self.embeddings["enabled"] or not chunks:
+            return None
+        import numpy as np
+
+        vectors = []
+        batch = self.embeddings["batch"]
+        try:
+            for start in range(0, len(chunks), batch):
+                texts = [f"{section}\n{body}" for section, body in chunks[start:start + batch]]
+                vectors += embed(self.embeddings, texts, timeout=60)
+        except Exception as e:
+            print(f"⚠️ Embedding {rel} failed, indexing it for BM25 only: {e}")
+            return None
+        result = []
+        for vector in vectors:
+            array = np.asarray(vector, dtype=np.float32)
+            array /= np.linalg.norm(array) or 1.0
+            result.append(array.tobytes())
+        return result
+
+    def _remove_file(self, db, rel):
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete_chunks(db, rel)
+            db.execute("DELETE FROM files WHERE path = ?", (rel,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _delete_chunks(self, db, rel):
+        db.execute("DELETE FROM vectors WHERE chunk IN (SELECT rowid FROM chunks WHERE path = ?)", (rel,))
+        db.execute("DELETE FROM chunks WHERE path = ?", (rel,))
+
+    def _export_vectors(self, db):
+        # Written aside and renamed, ids first, so readers holding the old maps keep a consistent
+        # (if stale) matrix; the matrix's mtime tells them to reopen both.
+        import numpy as np
+
+        rows = db.execute("SELECT chunk, vector FROM vectors ORDER BY chunk").fetchall()
+        if not rows:
+            return
+        for path, array in (
+            (self.ids_path, np.array([chunk for chunk, _ in rows], dtype=np.int64)),
+            (self.vectors_path, np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])),
+        ):
+            tmp = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp, array)
+            os.replace(tmp, path)
+
+    def stats(self):
+        return {"enabled": self.enabled, "files": self.files, "chunks": self.chunks, "searches": self.searches, "timeouts": self.timeouts}
+
+    def close(self):
+        self._closing = True  # A refresh in progress stops after its current file.
+        with self._refresh_lock, self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def build_docs(app_config, root_dir, memory_dir, count=None):
+    """
+    Builds the KnowledgeBase described by the "docs" block of app.json.
+    """
+    options = docs_options(app_config)
+    return KnowledgeBase(os.path.join(root_dir, options["path"]), os.path.join(memory_dir, options["index"]), options, count)
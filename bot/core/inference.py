@@ -0,0 +1,255 @@
+# bot/core/inference.py
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from bot.core.capabilities import CapabilityCache, REJECTED_STATUSES, build_payload, parse_reply, parse_stream_line, describe
+from bot.core.router import EndpointRouter
+from bot.core.metrics import Metrics
+
+# Connection settings used when route.json has no "http" block (or leaves a key out).
+DEFAULT_HTTP_OPTIONS = {
+    "connect_timeout": 3.05,  # Seconds to wait for the TCP/TLS connection.
+    "read_timeout": 30,  # Seconds to wait between bytes of the reply.
+    "pool_connections": 4,  # Hosts the session keeps connections to (total limit: pool_connections * pool_maxsize).
+    "pool_maxsize": 8,  # Connections kept open per endpoint.
+    "keep_alive": True,  # Reuse connections between requests.
+}
+
+ALL_FAILED_REPLY = "⚠️ All endpoints failed, please try again later."
+
+
+def http_options(route_config):
+    """
+    Returns the connection settings from the "http" block of route.json, filled in with defaults.
+    """
+    return {**DEFAULT_HTTP_OPTIONS, **route_config.get("http", {})}
+
+
+def record_attempt(metrics, endpoint, shape, started, outcome):
+    # One request to one endpoint in one payload shape; "model" tells the retry without the model name apart.
+    metrics.observe(
+        "zia_endpoint_attempt_seconds",
+        time.perf_counter() - started,
+        endpoint=endpoint,
+        schema=shape["schema"],
+        model="yes" if shape["send_model"] else "no",
+        outcome=outcome,
+    )
+
+
+class AsyncInferenceClient:
+    """
+    asyncio-native client for the chat completion endpoints in route.json.
+
+    One pooled aiohttp session is shared by every request, and at most
+    `max_in_flight` requests run at the same time; the rest wait their turn
+    without blocking the event loop.  The payload shape each endpoint accepts is
+    learned once and remembered (see capabilities.CapabilityCache).
+
+    Args:
+        endpoints: Endpoint URLs from route.json.
+        model: Model name sent with each request.
+        max_tokens: Maximum tokens for each reply.
+        http: Connection settings, see http_options().
+        routing: Endpoint selection settings, see router.routing_options().
+        capabilities: CapabilityCache to use (a process-local one by default).
+        max_in_flight: Maximum number of concurrent inference requests.
+        hints: Prompt cache hints added to each payload, see capabilities.prompt_cache_hints().
+        metrics: Metrics to record queueing, per-attempt and first-token timings in (none by default).
+    """
+
+    def __init__(self, endpoints, model, max_tokens, http=None, routing=None, capabilities=None, max_in_flight=4, hints=None, metrics=None):
+        self.endpoints = endpoints
+        self.model = model
+        self.max_tokens = max_tokens
+        self.http = {**DEFAULT_HTTP_OPTIONS, **(http or {})}
+        self.router = EndpointRouter(endpoints, routing)
+        self.capabilities = capabilities or CapabilityCache()
+        self.max_in_flight = max_in_flight
+        self.hints = hints or {}
+        self.metrics = metrics or Metrics(enabled=False)
+        self.calls = 0  # Calls in progress, including those waiting for a slot.
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._session = None
+
+    def _get_session(self):
+        # The session has to be created inside the running event loop, so it is built on first use.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.http["pool_connections"] * self.http["pool_maxsize"],
+                    limit_per_host=self.http["pool_maxsize"],
+                    force_close=not self.http["keep_alive"],
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    sock_connect=self.http["connect_timeout"],
+                    sock_read=self.http["read_timeout"],
+                ),
+            )
+        return self._session
+
+    async def _post(self, endpoint, payload):
+        async with self._get_session().post(endpoint, json=payload) as response:
+            if response.status != 200:
+                return response.status, None
+            return response.status, await response.text()
+
+    @asynccontextmanager
+    async def _slot(self, called):
+        # Waits for one of the max_in_flight slots; `calls` counts waiting callers too.
+        self.calls += 1
+        try:
+            async with self._slots:
+                self.metrics.observe("zia_inference_queue_seconds", time.perf_counter() - called)
+                yield
+        finally:
+            self.calls -= 1
+
+    async def request(self, endpoint, messages, max_tokens=None):
+        """
+        Sends the messages to one endpoint in the shape it accepts.
+
+        Only a status in REJECTED_STATUSES moves on to the next shape.  Any other
+        error means the endpoint is down or overloaded rather than picky, so the
+        shape it accepts is kept and the endpoint is given up on for this call.
+
+        Returns:
+            The reply text, or None if the endpoint failed or rejected every shape.
+        """
+        for shape in self.capabilities.shapes(endpoint, self.hints):
+            payload = build_payload(shape, self.model, messages, max_tokens or self.max_tokens, hints=self.hints)
+            started = time.perf_counter()
+            try:
+                status, body = await self._post(endpoint, payload)
+            except Exception:
+                record_attempt(self.metrics, endpoint, shape, started, "error")
+                raise
+            if status == 200:
+                try:
+                    reply, _ = parse_reply(json.loads(body))
+                except ValueError as e:
+                    record_attempt(self.metrics, endpoint, shape, started, "bad_reply")
+                    print(f"⚠️ Endpoint {endpoint} sent an unexpected reply to {describe(shape)}: {e}")
+                    continue
+                record_attempt(self.metrics, endpoint, shape, started, "ok")
+                self.capabilities.learn(endpoint, shape)
+                return reply
+            record_attempt(self.metrics, endpoint, shape, started, f"http_{status}")
+            print(f"⚠️ Endpoint {endpoint} returned {status} for {describe(shape)}")
+            if status not in REJECTED_STATUSES:
+                return None
+        self.capabilities.forget(endpoint)
+        return None
+
+    async def complete(self, messages, max_tokens=None):
+        """
+        Sends the messages to the best endpoint the router knows of, falling back to the others.
+        `max_tokens` overrides the client's limit for this call.
+
+        Returns:
+            The reply text, or None if every endpoint failed.
+        """
+        called = time.perf_counter()
+        async with self._slot(called):
+            try:
+                for endpoint in self.router.order():
+                    started = time.perf_counter()
+                    self.router.begin(endpoint)
+                    try:
+                        reply = await self.request(endpoint, messages, max_tokens)
+                        if reply is not None:
+                            self.router.success(endpoint, time.perf_counter() - started)
+                            return reply
+                    except asyncio.CancelledError:
+                        self.router.cancel(endpoint)  # The caller gave up (client gone, shutdown); not the endpoint's fault.
+                        raise
+                    except Exception as e:
+                        print(f"⚠️ Failed on {endpoint}: {e}")
+                    self.router.failure(endpoint)
+            finally:
+                self.metrics.observe("zia_inference_seconds", time.perf_counter() - called, mode="complete")
+        return None
+
+    async def stream(self, messages, max_tokens=None):
+        """
+        Yields the reply in chunks as the best available endpoint generates it.
+        `max_tokens` overrides the client's limit for this call.
+
+        Endpoints are tried in router order until one starts answering.  Once text
+        has been yielded we are committed to that endpoint: a failure mid-reply ends
+        the stream instead of starting over somewhere else.  Nothing is yielded if
+        every endpoint failed.
+        """
+        called = time.perf_counter()
+        first_token = False
+        async with self._slot(called):
+            try:
+                for endpoint in self.router.order():
+                    started = time.perf_counter()
+                    self.router.begin(endpoint)
+                    answered = False
+                    outcome = None
+                    attempt = None  # (shape, start time) of the request in progress, until its outcome is recorded.
+                    try:
+                        for shape in self.capabilities.shapes(endpoint, self.hints):
+                            payload = build_payload(shape, self.model, messages, max_tokens or self.max_tokens, stream=True, hints=self.hints)
+                            attempt = (shape, time.perf_counter())
+                            async with self._get_session().post(endpoint, json=payload) as response:
+                                if response.status != 200:
+                                    record_attempt(self.metrics, endpoint, shape, attempt[1], f"http_{response.status}")
+                                    attempt = None
+                                    print(f"⚠️ Endpoint {endpoint} returned {response.status} for streamed {describe(shape)}")
+                                    if response.status in REJECTED_STATUSES:
+                                        continue
+                                    break  # Down, not picky: keep the shape it accepts (see request()).
+                                async for raw in response.content:
+                                    parsed = parse_stream_line(raw.decode("utf-8", errors="replace"))
+                                    if parsed is None:
+                                        continue
+                                    if not answered:
+                                        answered = True
+                                        self.capabilities.learn(endpoint, shape)
+                                    text, done = parsed
+                                    if text:
+                                        if not first_token:
+                                            first_token = True
+                                            self.metrics.observe("zia_first_token_seconds", time.perf_counter() - called)
+                                        yield text
+                                    if done:
+                                        break
+                            if answered:
+                                record_attempt(self.metrics, endpoint, shape, attempt[1], "ok")
+                                attempt = None
+                                outcome = "success"
+                                return
+                            record_attempt(self.metrics, endpoint, shape, attempt[1], "bad_reply")
+                            attempt = None
+                        else:
+                            self.capabilities.forget(endpoint)  # Every shape was rejected.
+                        outcome = "failure"
+                    except Exception as e:
+                        print(f"⚠️ Failed on {endpoint}: {e}")
+                        outcome = "failure"
+                    finally:
+                        if attempt is not None:
+                            record_attempt(self.metrics, endpoint, attempt[0], attempt[1], "error" if outcome else "cancelled")
+                        if outcome == "success":
+                            self.router.success(endpoint, time.perf_counter() - started)
+                        elif outcome == "failure":
+                            self.router.failure(endpoint)
+                        else:
+                            self.router.cancel(endpoint)  # The consumer stopped reading; not the endpoint's fault.
+                    if answered:
+                        return
+            finally:
+                self.metrics.observe("zia_inference_seconds", time.perf_counter() - called, mode="stream")
+
+    async def close(self):
+        self.router.close()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
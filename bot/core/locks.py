@@ -0,0 +1,26 @@
+# bot/core/locks.py
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks, so only one process may write at a time.
+    fcntl = None
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive advisory lock on `path` (created if missing) for the duration of the block.
+
+    Used where several processes (e.g. uvicorn workers) write the same files.
+    Without fcntl the block simply runs unlocked.
+    """
+    with open(path, "a") as f:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
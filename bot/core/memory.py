@@ -0,0 +1,541 @@
+# bot/core/memory.py
+import os
+import json
+import time
+import datetime
+import struct
+import threading
+import contextlib
+
+from bot.core.locks import file_lock
+
+# Size of the blocks read from the end of a log when looking for the last N records.
+TAIL_BLOCK_SIZE = 4096
+
+# Layout of the <scope>.idx files: the sequence number of the first record in the log,
+# followed by the byte offset of every record, all little-endian uint64.
+INDEX_ENTRY = struct.Struct("<Q")
+
+# Roles are written to the logs as one letter; decoded records share these strings.
+ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+
+class MemoryStore:
+    """
+    Append-only conversation memory.
+
+    Every scope (a Discord/Slack channel id, or a web user/chat pair) is kept in its
+    own JSONL file under the memory directory, one message per line in the compact
+    form written by encode_record().  Saving a message
+    appends a single line instead of rewriting the whole history, and loading reads
+    only the tail of the file.  Once a log holds `compact_every` records more than
+    `log_limit`, it is compacted back down to the last `log_limit` records.
+
+    Every record also has a sequence number that never changes, even across
+    compactions.  A small <scope>.idx file next to the log maps sequence numbers to
+    byte offsets, so page() can serve any window of history without parsing the
+    rest of the log.
+
+    With `shared=True` several processes may use the same directory: writes to a
+    scope hold a <scope>.lock file lock, and record counts are re-read from the
+    index each time instead of being trusted from memory.
+
+    With an `archive` (see archive.Archive), archive_idle() moves scopes that have
+    been quiet for a while out of the directory, and a scope is put back the next
+    time it is read or written.
+
+    Scopes are keyed by their string form (Discord passes channel ids as ints), the
+    same name they get back from a file name or the archive.
+
+    Args:
+        memory_dir: Directory where the .jsonl logs are stored.
+        log_limit: Number of messages kept per scope after compaction.
+        load_limit: Default number of messages returned by load().
+        compact_every: Extra records allowed before a compaction (defaults to log_limit).
+        shared: Whether other processes write to the same memory_dir.
+        archive: Archive for idle scopes (None: keep everything in memory_dir).
+    """
+
+    def __init__(self, memory_dir, log_limit=100, load_limit=10, compact_every=None, shared=False, archive=None):
+        self.memory_dir = memory_dir
+        self.log_limit = log_limit
+        self.load_limit = load_limit
+        self.compact_every = compact_every or log_limit
+        self.shared = shared
+        self.archive = archive
+        self._counts = {}  # scope -> number of records currently in the log.
+        self._bases = {}  # scope -> sequence number of the first record in the log.
+        self._lock = threading.Lock()
+        os.makedirs(memory_dir, exist_ok=True)
+
+    def path(self, scope):
+        return os.path.join(self.memory_dir, f"{scope}.jsonl")
+
+    def index_path(self, scope):
+        return os.path.join(self.memory_dir, f"{scope}.idx")
+
+    def legacy_path(self, scope):
+        return os.path.join(self.memory_dir, f"{scope}.json")
+
+    def lock_path(self, scope):
+        return os.path.join(self.memory_dir, f"{scope}.lock")
+
+    @contextlib.contextmanager
+    def _locked(self, scope):
+        # Serialises work on a scope between threads, and between processes when shared.
+        with self._lock:
+            if not self.shared:
+                yield
+                return
+            with file_lock(self.lock_path(scope)):
+                if scope in self._counts:
+                    # Another process may have appended or compacted since we last looked.
+                    base, indexed = self._read_index_header(scope)
+                    if indexed >= 0:
+                        self._counts[scope] = indexed
+                        self._bases[scope] = base
+                    else:
+                        self._counts.pop(scope, None)
+                yield
+
+    def summary_path(self, scope):
+        return os.path.join(self.memory_dir, f"{scope}.summary.json")
+
+    def load(self, scope, limit=None):
+        """
+        Returns the last `limit` messages for a scope (load_limit by default), each with its "seq".
+        """
+        limit = self.load_limit if limit is None else limit
+        records, _ = self.page(scope, None, limit)
+        return records
+
+    def load_summary(self, scope):
+        """
+        Returns the stored conversation summary for a scope (see summary.Summarizer), or None.
+        """
+        scope = str(scope)
+        if self.archive is not None:
+            with self._locked(scope):
+                self._rehydrate(scope)
+        return self._read_summary(scope)
+
+    def _read_summary(self, scope):
+        path = self.summary_path(scope)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError as e:
+            print(f"⚠️ Ignoring unreadable summary {path}: {e}")
+            return None
+
+    def save_summary(self, scope, summary):
+        scope = str(scope)
+        if self.archive is not None:
+            with self._locked(scope):
+                self._rehydrate(scope)  # Or the archived summary would overwrite this one later.
+        self._write_summary(scope, summary)
+
+    def _write_summary(self, scope, summary):
+        path = self.summary_path(scope)
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # Per-process name: shared stores may save from several workers.
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def page(self, scope, before=None, limit=20):
+        """
+        Returns one page of history, oldest first, for paginated history views.
+
+        Args:
+            scope: The memory scope.
+            before: Only return records with a sequence number below this cursor
+                (None for the most recent page).
+            limit: Maximum number of records in the page.
+
+        Returns:
+            A (records, cursor) tuple.  Each record carries its "seq"; cursor is the
+            `before` value for the next older page, or None when there is none.
+        """
+        scope = str(scope)
+        with self._locked(scope):
+            self._migrate_legacy(scope)
+            self._rehydrate(scope)
+            path = self.path(scope)
+            if limit <= 0 or not os.path.exists(path):
+                return [], None
+            count = self._count(scope)
+            base = self._bases[scope]
+            end = count if before is None else max(0, min(count, before - base))
+            start = max(0, end - limit)
+            if start >= end:
+                return [], None
+            # Read only the offsets for this window (plus the next record's, to know where it ends).
+            with open(self.index_path(scope), "rb") as f:
+                f.seek(INDEX_ENTRY.size * (1 + start))
+                wanted = end - start + (1 if end < count else 0)
+                raw = f.read(INDEX_ENTRY.size * wanted)
+            offsets = [INDEX_ENTRY.unpack_from(raw, i * INDEX_ENTRY.size)[0] for i in range(wanted)]
+            with open(path, "rb") as f:
+                f.seek(offsets[0])
+                data = f.read(offsets[-1] - offsets[0]) if end < count else f.read()
+        records = []
+        for i, line in enumerate(data.splitlines()[:end - start]):
+            try:
+                record = decode_record(json.loads(line))
+            except ValueError:
+                continue
+            record["seq"] = base + start + i
+            records.append(record)
+        return records, (base + start if start > 0 else None)
+
+    def next_seq(self, scope):
+        """
+        Returns the sequence number the next saved message in a scope will get.
+        """
+        scope = str(scope)
+        with self._locked(scope):
+            self._migrate_legacy(scope)
+            self._rehydrate(scope)
+            count = self._count(scope)
+            return self._bases[scope] + count
+
+    def append(self, scope, role, content, tokens=None):
+        """
+        Appends one message to a scope's log.
+
+        Args:
+            tokens: Optional {tokenizer name: count} saved with the message (see context.ContextBuilder).
+
+        Returns:
+            The message's sequence number.
+        """
+        return self.write_records(scope, [make_record(role, content, tokens)])
+
+    def extend(self, scope, messages):
+        """
+        Appends several (role, content) messages to a scope's log in one write.
+
+        Returns:
+            The sequence number of the first message.
+        """
+        return self.write_records(scope, [make_record(role, content) for role, content in messages])
+
+    def write_records(self, scope, records):
+        """
+        Appends already-built records (see make_record) to a scope's log in one write.
+
+        Returns:
+            The sequence number of the first record.
+        """
+        if not records:
+            return None
+        scope = str(scope)
+        lines = [encode_record(r).encode("utf-8") for r in records]
+        with self._locked(scope):
+            self._migrate_legacy(scope)
+            self._rehydrate(scope)
+            path = self.path(scope)
+            count = self._count(scope)
+            first_seq = self._bases[scope] + count
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(b"".join(lines))
+            offsets = []
+            for line in lines:
+                offsets.append(offset)
+                offset += len(line)
+            with open(self.index_path(scope), "ab") as f:
+                f.write(b"".join(INDEX_ENTRY.pack(o) for o in offsets))
+            self._counts[scope] = count + len(records)
+            if self._counts[scope] >= self.log_limit + self.compact_every:
+                self._compact(scope)
+            return first_seq
+
+    def write_many(self, batches):
+        """
+        Writes {scope: records} for several scopes (one append per scope).
+
+        Returns:
+            The batches that could not be written ({} on success).
+        """
+        failed = {}
+        for scope, records in batches.items():
+            try:
+                self.write_records(scope, records)
+            except Exception as e:
+                print(f"⚠️ Failed to write memory for {scope}: {e}")
+                failed[scope] = records
+        return failed
+
+    def compact(self, scope):
+        """
+        Rewrites a scope's log so it only holds the last log_limit records.
+        """
+        scope = str(scope)
+        with self._locked(scope):
+            if os.path.exists(self.path(scope)):
+                self._compact(scope)
+
+    def idle_scopes(self, idle_seconds):
+        """
+        Returns [(scope, time of its last message)] for logs not written to in `idle_seconds`.
+        """
+        cutoff = time.time() - idle_seconds
+        idle = []
+        with os.scandir(self.memory_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".jsonl") and entry.is_file():
+                    modified = entry.stat().st_mtime
+                    if modified < cutoff:
+                        idle.append((entry.name[:-len(".jsonl")], modified))
+        return sorted(idle)
+
+    def archive_idle(self, idle_seconds, batch=200):
+        """
+        Moves scopes not written to in `idle_seconds` into the archive, `batch` scopes per segment.
+
+        Returns:
+            {"scopes": archived, "before": bytes they took up, "after": compressed bytes}.
+        """
+        report = {"scopes": 0, "before": 0, "after": 0}
+        if self.archive is None:
+            return report
+        idle = self.idle_scopes(idle_seconds)
+        cutoff = time.time() - idle_seconds
+        for i in range(0, len(idle), batch):
+            with self._lock, contextlib.ExitStack() as locks:
+                entries = []
+                for scope, _ in idle[i:i + batch]:
+                    if self.shared:
+                        locks.enter_context(file_lock(self.lock_path(scope)))
+                    entry = self._archive_entry(scope, cutoff)
+                    if entry is not None:
+                        entries.append(entry)
+                if not entries:
+                    continue
+                report["after"] += self.archive.add(entries)
+                for entry in entries:
+                    scope = entry["scope"]
+                    # Empty .lock files stay: removing one that is held would let two processes lock the scope.
+                    for path in (self.path(scope), self.index_path(scope), self.summary_path(scope)):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    self._counts.pop(scope, None)
+                    self._bases.pop(scope, None)
+                report["scopes"] += len(entries)
+                report["before"] += sum(entry["bytes"] for entry in entries)
+        return report
+
+    def _archive_entry(self, scope, cutoff):
+        # What archive.add() needs for one scope, or None if it was written to since it was found idle.
+        path = self.path(scope)
+        try:
+            last = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        if last >= cutoff:
+            return None
+        self._counts.pop(scope, None)  # Re-read from disk: another process may have changed it.
+        self._count(scope)
+        with open(path, "rb") as f:
+            lines = f.read().splitlines()
+        records = []
+        for line in lines:
+            try:
+                records.append(decode_record(json.loads(line)))
+            except ValueError:
+                continue
+        files = (path, self.index_path(scope), self.summary_path(scope))
+        return {
+            "scope": scope,
+            "data": "".join(encode_record(r) for r in records).encode("utf-8"),
+            "base": self._bases[scope],
+            "count": len(records),
+            "last": int(last),
+            "summary": self._read_summary(scope),
+            "bytes": sum(os.path.getsize(p) for p in files if os.path.exists(p)),
+        }
+
+    def _rehydrate(self, scope):
+        # Put an archived scope's log, index and summary back before it is used.
+        if self.archive is None or scope in self._counts or not self.archive.contains(scope):
+            return
+        if os.path.exists(self.path(scope)):
+            self.archive.discard(scope)  # A pass was interrupted after archiving; the live log wins.
+            return
+        taken = self.archive.take(scope)
+        if taken is None:
+            return
+        data, base, summary = taken
+        lines = data.splitlines(keepends=True)
+        tmp_path = self.path(scope) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        self._write_index(scope, base, lines)
+        os.replace(tmp_path, self.path(scope))
+        if summary is not None:
+            self._write_summary(scope, summary)
+        self._counts[scope] = len(lines)
+        self._bases[scope] = base
+
+    def close(self):
+        """
+        Nothing is buffered in the store itself; kept so it can stand in for a MemoryCache.
+        """
+
+    def _compact(self, scope):
+        path = self.path(scope)
+        count = self._count(scope)
+        records = read_tail(path, self.log_limit)
+        lines = [encode_record(r).encode("utf-8") for r in records]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(lines))
+        base = self._bases[scope] + count - len(records)  # Dropped records keep their numbers.
+        self._write_index(scope, base, lines)
+        os.replace(tmp_path, path)  # Atomic swap so readers never see a half-written log.
+        self._counts[scope] = len(records)
+        self._bases[scope] = base
+
+    def _write_index(self, scope, base, lines):
+        offsets = [base]
+        offset = 0
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line)
+        tmp_path = self.index_path(scope) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(INDEX_ENTRY.pack(o) for o in offsets))
+        os.replace(tmp_path, self.index_path(scope))
+
+    def _count(self, scope):
+        # Record counts (and the index) are checked once per scope, then kept up to date in memory.
+        if scope not in self._counts:
+            path = self.path(scope)
+            lines = []
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    lines = f.read().splitlines(keepends=True)
+            base, indexed = self._read_index_header(scope)
+            if indexed != len(lines):
+                # Missing or out of step (e.g. a crash between the two appends): rebuild it.
+                self._write_index(scope, base, lines)
+            self._counts[scope] = len(lines)
+            self._bases[scope] = base
+        return self._counts[scope]
+
+    def _read_index_header(self, scope):
+        # Returns (base sequence number, number of indexed records).
+        path = self.index_path(scope)
+        if not os.path.exists(path):
+            return 0, -1
+        size = os.path.getsize(path)
+        if size < INDEX_ENTRY.size:
+            return 0, -1
+        with open(path, "rb") as f:
+            base = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0]
+        return base, size // INDEX_ENTRY.size - 1
+
+    def _migrate_legacy(self, scope):
+        # Convert an old whole-file <scope>.json history into the JSONL log, once.
+        legacy = self.legacy_path(scope)
+        if not os.path.exists(legacy) or os.path.exists(self.path(scope)):
+            return
+        try:
+            with open(legacy, "r", encoding="utf-8") as f:
+                history = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not migrate {legacy}: {e}")
+            return
+        tmp_path = self.path(scope) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(encode_record(r) for r in history[-self.log_limit:]))
+        os.replace(tmp_path, self.path(scope))
+        os.replace(legacy, legacy + ".migrated")
+        if os.path.exists(self.index_path(scope)):
+            os.remove(self.index_path(scope))
+        self._counts.pop(scope, None)
+
+
+def make_record(role, content, tokens=None):
+    record = {"role": role, "content": content, "timestamp": int(time.time())}
+    if tokens:
+        record["tokens"] = tokens
+    return record
+
+
+def epoch(timestamp):
+    """
+    Returns a record's timestamp in whole seconds since the epoch (older records carry ISO strings).
+    """
+    if isinstance(timestamp, (int, float)):
+        return int(timestamp)
+    if not timestamp:
+        return 0
+    try:
+        return int(float(timestamp))
+    except ValueError:
+        pass
+    try:
+        return int(datetime.datetime.fromisoformat(timestamp).timestamp())
+    except ValueError:
+        return 0
+
+
+def encode_record(record):
+    """
+    Returns a record as one log line: [role code, content, epoch seconds] plus {tokenizer: count} if known.
+
+    "seq" is implied by the record's position in the log, so it is never written.
+    """
+    role = record.get("role", "")
+    row = [ROLE_CODES.get(role, role), record.get("content", ""), epoch(record.get("timestamp"))]
+    if record.get("tokens"):
+        row.append(record["tokens"])
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def decode_record(row):
+    """
+    Returns the record for a parsed log line, in the compact form or the older one-object-per-line form.
+    """
+    if isinstance(row, dict):
+        role = row.get("role", "")
+        record = {"role": ROLE_NAMES.get(ROLE_CODES.get(role), role), "content": row.get("content", ""), "timestamp": epoch(row.get("timestamp"))}
+        if row.get("tokens"):
+            record["tokens"] = row["tokens"]
+        return record
+    if not isinstance(row, list) or len(row) < 3:
+        raise ValueError(f"not a memory record: {row!r}")
+    record = {"role": ROLE_NAMES.get(row[0], row[0]), "content": row[1], "timestamp": row[2]}
+    if len(row) > 3:
+        record["tokens"] = row[3]
+    return record
+
+
+def read_tail(path, limit):
+    """
+    Reads the last `limit` records of a JSONL file without parsing the rest of it.
+
+    Blocks are read backwards from the end of the file until enough newlines have
+    been seen.  A torn final line (e.g. from a crash mid-write) is skipped.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= limit:
+            step = min(TAIL_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    records = []
+    for line in data.splitlines()[-limit - 1:]:
+        try:
+            records.append(decode_record(json.loads(line)))
+        except ValueError:
+            continue  # Partial line at the start of the window, or a torn write.
+    return records[-limit:]
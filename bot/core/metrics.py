@@ -0,0 +1,269 @@
+# bot/core/metrics.py
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+# Metrics settings used when app.json has no "metrics" block (or leaves a key out).
+DEFAULT_METRICS_OPTIONS = {
+    "enabled": True,
+    "web_endpoint": False,  # Serve /metrics from the web app (to localhost clients only).
+    "host": "127.0.0.1",  # Interface of the bots' metrics port.
+    "port": None,  # Port for a /metrics endpoint in the Discord/Slack bots and the gateway (None: off).
+    "buckets": [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30],  # Histogram buckets, in seconds.
+    "profile": {
+        "enabled": False,  # Sample every thread's stack in the background (for hot-path investigation).
+        "interval": 0.01,  # Seconds between samples.
+        "path": "runtime/profile.folded",  # Folded stacks (flamegraph.pl / speedscope format), relative to the root.
+        "dump_every": 60,  # Seconds between rewrites of the file.
+    },
+}
+
+# Name -> (type, help) of everything the bots record; anything else is exported untyped.
+METRICS_HELP = {
+    "zia_stage_seconds": ("histogram", "Time spent in each stage of a turn, per platform."),
+    "zia_turns_total": ("counter", "Turns answered, per platform and outcome (ok, cached, failed)."),
+    "zia_inference_queue_seconds": ("histogram", "Time requests waited for a free inference slot."),
+    "zia_inference_seconds": ("histogram", "Time from the start of a model call to its last token, per mode."),
+    "zia_first_token_seconds": ("histogram", "Time from the start of a streamed model call to its first token."),
+    "zia_endpoint_attempt_seconds": ("histogram", "Duration of each request to an endpoint, per payload shape and outcome."),
+    "zia_http_request_seconds": ("histogram", "Web requests, per route and status."),
+    "zia_events_skipped_total": ("counter", "Incoming events dropped before a turn, per platform and reason."),
+}
+
+
+def metrics_options(app_config):
+    """
+    Returns the "metrics" block of app.json, filled in with defaults.
+    """
+    options = {**DEFAULT_METRICS_OPTIONS, **app_config.get("metrics", {})}
+    options["profile"] = {**DEFAULT_METRICS_OPTIONS["profile"], **options["profile"]}
+    return options
+
+
+class Metrics:
+    """
+    Counters and histograms for the reply path, rendered in the Prometheus text format.
+
+    Series are keyed by name and labels, e.g.
+        METRICS.observe("zia_stage_seconds", 0.012, platform="discord", stage="memory_load")
+    and timers wrap code blocks, sync or async:
+        with METRICS.stage("discord", "prompt_build"): ...
+    Gauges are read when rendering, from callbacks registered with gauge().
+    With `enabled` off every call is a no-op.
+
+    Args:
+        enabled: Record anything at all.
+        buckets: Histogram bucket bounds, in seconds.
+    """
+
+    def __init__(self, enabled=True, buckets=None):
+        self.enabled = enabled
+        self.buckets = tuple(buckets or DEFAULT_METRICS_OPTIONS["buckets"])
+        self._histograms = {}  # (name, labels) -> [count per bucket..., sum, count]
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}  # name -> (help, callback)
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += seconds
+            series[-1] += 1
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def stage(self, platform, stage):
+        """
+        Times one stage of a turn (memory_load, docs, prompt_build, generate, memory_save, send).
+        """
+        return self.timer("zia_stage_seconds", platform=platform, stage=stage)
+
+    def gauge(self, name, help, callback):
+        """
+        Registers a gauge read at render time.  `callback` returns a number or a list of (labels, value).
+        """
+        self._gauges[name] = (help, callback)
+
+    def render(self):
+        """
+        Returns every series in the Prometheus text exposition format.
+        """
+        with self._lock:
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name, series in _by_name(counters):
+            lines += _header(name, "counter")
+            lines += [f"{name}{_labels(labels)} {_number(value)}" for labels, value in series]
+        for name, series in _by_name(histograms):
+            lines += _header(name, "histogram")
+            for labels, values in series:
+                cumulative = 0
+                for bound, count in zip(self.buckets, values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {values[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(values[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+        for name, (help, callback) in sorted(self._gauges.items()):
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"⚠️ Gauge {name} failed: {e}")
+                continue
+            if value is None:
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            if isinstance(value, (int, float)):
+                value = [({}, value)]
+            for labels, number in value:
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {_number(number)}")
+        return "\n".join(lines) + "\n"
+
+
+def _by_name(series):
+    # Group {(name, labels): value} into [(name, [(labels, value), ...]), ...], sorted.
+    grouped = {}
+    for (name, labels), value in series.items():
+        grouped.setdefault(name, []).append((labels, value))
+    return sorted((name, sorted(values)) for name, values in grouped.items())
+
+
+def _header(name, kind):
+    help = METRICS_HELP.get(name, (kind, ""))[1]
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsServer:
+    """
+    Serves Metrics.render() at http://host:port/metrics, for bots without a web app.
+
+    Args:
+        metrics: The Metrics to export.
+        host: Interface to listen on.
+        port: Port to listen on.
+    """
+
+    def __init__(self, metrics, host, port):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"✅ Metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler for finding hot paths in production.
+
+    A daemon thread wakes every `interval` seconds, records the current stack of
+    every other thread, and counts identical stacks.  The counts are written to
+    `path` in the folded format ("file:function;file:function N" per line) that
+    flamegraph.pl and speedscope read, every `dump_every` seconds and on stop().
+
+    Args:
+        path: File the folded stacks are written to.
+        interval: Seconds between samples.
+        dump_every: Seconds between rewrites of the file.
+    """
+
+    def __init__(self, path, interval=0.01, dump_every=60):
+        self.path = path
+        self.interval = interval
+        self.dump_every = dump_every
+        self.samples = 0
+        self._stacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        print(f"🔍 Sampling profiler on, writing to {self.path}")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.dump()
+
+    def dump(self):
+        lines = [f"{stack} {count}" for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1])]
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        me = threading.get_ident()
+        last_dump = time.monotonic()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self._stacks[key] = self._stacks.get(key, 0) + 1
+            self.samples += 1
+            if time.monotonic() - last_dump >= self.dump_every:
+                self.dump()
+                last_dump = time.monotonic()
@@ -0,0 +1,219 @@
+# bot/core/reply_cache.py
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from bot.core.storage import connect
+
+# Reply cache settings used when app.json has no "reply_cache" block (or leaves a key out).
+DEFAULT_REPLY_CACHE_OPTIONS = {
+    "enabled": False,
+    "ttl": 3600,  # Seconds a cached reply stays valid.
+    "max_entries": 512,  # Replies kept in RAM (least recently used are evicted first).
+    "max_bytes": 2 * 1024 * 1024,  # Total size of the replies kept in RAM.
+    "context_messages": 0,  # Recent history messages that are part of the key (0: the question alone).
+    "personas": None,  # Persona names whose replies may be cached (None: all).
+    "channels": None,  # Scopes (channel ids / web chats) that may use the cache (None: all).
+    "exclude_channels": [],  # Scopes that never use the cache.
+    "persist": True,  # Keep replies in reply_cache.sqlite3 so they survive restarts.
+    "disk_max_entries": 10000,  # Replies kept on disk.
+}
+
+REPLY_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (
+    key TEXT PRIMARY KEY,
+    reply TEXT NOT NULL,
+    expires REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS replies_last_used ON replies (last_used);
+"""
+
+MENTION = re.compile(r"<@[!&]?\w+>")  # Discord <@123> / Slack <@U123> mentions.
+
+
+def reply_cache_options(app_config):
+    """
+    Returns the "reply_cache" block of app.json, filled in with defaults.
+    """
+    return {**DEFAULT_REPLY_CACHE_OPTIONS, **app_config.get("reply_cache", {})}
+
+
+def normalize(text):
+    """
+    Folds the differences that don't change a question: case, mentions, spacing and trailing punctuation.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = MENTION.sub(" ", text)
+    text = " ".join(text.split())
+    return text.rstrip("?!.。？！ ")
+
+
+class ReplyCache:
+    """
+    Reuses model replies for questions that were already answered.
+
+    Keys are a hash of the model, the persona, the normalized message and
+    (optionally) the last `context_messages` messages of history, so the same
+    question under the same persona gets the same answer without a model call.
+    Replies live in an LRU in RAM, bounded by `max_entries` and `max_bytes`, and
+    (with `persist`) in a small SQLite file that survives restarts.  Every entry
+    expires after `ttl` seconds.
+
+    Caching is opt-in per persona and per scope, see DEFAULT_REPLY_CACHE_OPTIONS.
+
+    Args:
+        options: Reply cache settings, see reply_cache_options().
+        persona_config: persona.json, used to resolve the persona names in the options.
+        namespace: Extra key material, normally the model name, so changing models starts fresh.
+        path: SQLite file for the disk tier (None keeps the cache in RAM only).
+    """
+
+    def __init__(self, options=None, persona_config=None, namespace="", path=None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (reply, expires)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self.configure(options, persona_config, namespace)
+
+    def configure(self, options=None, persona_config=None, namespace=""):
+        """
+        Applies new settings and persona definitions in place (see Runtime.reload).
+
+        Replies already cached are kept; changed personas or a changed namespace
+        give new keys, so their old replies just expire.  Whether the disk tier
+        is used (`persist`) is fixed when the cache is built.
+        """
+        options = {**DEFAULT_REPLY_CACHE_OPTIONS, **(options or {})}
+        personas = None
+        if options["personas"] is not None:
+            persona_config = persona_config or {}
+            personas = {persona_config[n]["content"] for n in options["personas"] if n in persona_config}
+        with self._lock:
+            self.options = options
+            self.enabled = options["enabled"]
+            self.namespace = namespace
+            self._personas = personas
+            self._channels = None if options["channels"] is None else {str(c) for c in options["channels"]}
+            self._excluded = {str(c) for c in options["exclude_channels"]}
+            while self._entries and (len(self._entries) > options["max_entries"] or self._bytes > options["max_bytes"]):
+                self._remove(next(iter(self._entries)))
+            if self.enabled and self.path and self._db is None:
+                self._db = connect(self.path, schema=REPLY_CACHE_SCHEMA)
+
+    def key(self, persona, scope, message, history=()):
+        """
+        Returns the cache key for a message, or None if this persona/scope does not use the cache.
+        """
+        if not self.enabled:
+            return None
+        scope = str(scope)
+        if scope in self._excluded or (self._channels is not None and scope not in self._channels):
+            return None
+        persona_text = persona["content"] if persona else ""
+        if self._personas is not None and persona_text not in self._personas:
+            return None
+        material = [self.namespace, persona_text, normalize(message)]
+        count = self.options["context_messages"]
+        if count > 0:
+            material += [[r["role"], normalize(r["content"])] for r in history[-count:]]
+        return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached reply for a key, or None.  May read the disk tier, so async callers use a thread.
+        """
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+            if self._db is not None:
+                row = self._db.execute("SELECT reply, expires FROM replies WHERE key = ?", (key,)).fetchone()
+                if row and row[1] > now:
+                    self._db.execute("UPDATE replies SET last_used = ? WHERE key = ?", (now, key))
+                    self._insert(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, reply):
+        """
+        Caches a reply under a key (a None key is ignored).
+        """
+        if key is None or not reply:
+            return
+        now = time.time()
+        expires = now + self.options["ttl"]
+        with self._lock:
+            self._insert(key, reply, expires)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO replies (key, reply, expires, last_used) VALUES (?, ?, ?, ?)",
+                    (key, reply, expires, now),
+                )
+                self._prune_disk(now)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _insert(self, key, reply, expires):
+        if key in self._entries:
+            self._remove(key)
+        size = len(reply.encode("utf-8"))
+        if size > self.options["max_bytes"]:
+            return
+        self._entries[key] = (reply, expires)
+        self._bytes += size
+        while len(self._entries) > self.options["max_entries"] or self._bytes > self.options["max_bytes"]:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        reply, _ = self._entries.pop(key)
+        self._bytes -= len(reply.encode("utf-8"))
+
+    def _prune_disk(self, now):
+        # Drop expired replies, then the least recently used beyond the cap.
+        self._db.execute("DELETE FROM replies WHERE expires <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM replies WHERE key IN ("
+            " SELECT key FROM replies ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.options["disk_max_entries"],),
+        )
+
+
+def build_reply_cache(app_config, persona_config, memory_dir, namespace=""):
+    """
+    Builds the ReplyCache described by the "reply_cache" block of app.json.
+    """
+    options = reply_cache_options(app_config)
+    path = os.path.join(memory_dir, "reply_cache.sqlite3") if options["persist"] else None
+    return ReplyCache(options, persona_config, namespace, path)
@@ -0,0 +1,243 @@
+# bot/core/router.py
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+# Routing settings used when route.json has no "routing" block (or leaves a key out).
+DEFAULT_ROUTING_OPTIONS = {
+    "policy": "latency",  # "latency", "least_outstanding", "weighted" or "ordered".
+    "weights": {},  # endpoint URL -> weight, used by the "weighted" policy.
+    "failure_threshold": 3,  # Consecutive failures before an endpoint's circuit opens.
+    "cooldown": 30,  # Seconds an open circuit waits before the endpoint is tried again.
+    "probe_interval": 10,  # Seconds between background probes of open endpoints (0 disables probing).
+    "ewma_alpha": 0.3,  # Weight of the newest sample in the rolling latency average.
+    "latency_window": 100,  # Number of recent samples kept for percentiles.
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def routing_options(route_config):
+    """
+    Returns the routing settings from the "routing" block of route.json, filled in with defaults.
+    """
+    return {**DEFAULT_ROUTING_OPTIONS, **route_config.get("routing", {})}
+
+
+class EndpointHealth:
+    """
+    Rolling health and latency figures for one endpoint.
+    """
+
+    def __init__(self, window):
+        self.state = CLOSED
+        self.failures = 0  # Consecutive failures.
+        self.open_until = 0.0
+        self.trial_in_flight = False  # A half-open endpoint lets one request through at a time.
+        self.outstanding = 0
+        self.ewma = None
+        self.samples = deque(maxlen=window)
+        self.successes_total = 0
+        self.failures_total = 0
+
+    def percentile(self, pct):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class EndpointRouter:
+    """
+    Picks which endpoint to try first for each request.
+
+    Every request reports back its latency or failure.  Endpoints that fail
+    `failure_threshold` times in a row have their circuit opened and are skipped
+    until `cooldown` has passed; a background thread probes them in the meantime
+    and closes the circuit as soon as they answer again.  Healthy endpoints are
+    ordered by the configured policy:
+
+        latency            fastest rolling average (EWMA) first.
+        least_outstanding  fewest requests in flight first, then fastest.
+        weighted           random order, biased by the configured weights.
+        ordered            the order from route.json (the old behaviour).
+
+    Args:
+        endpoints: Endpoint URLs from route.json.
+        options: Routing settings, see routing_options().
+        probe: Callable(endpoint) -> bool used by the background prober.
+    """
+
+    def __init__(self, endpoints, options=None, probe=None):
+        self.endpoints = list(endpoints)
+        self.options = {**DEFAULT_ROUTING_OPTIONS, **(options or {})}
+        self.policy = self.options["policy"]
+        self._health = {e: EndpointHealth(self.options["latency_window"]) for e in self.endpoints}
+        self._lock = threading.Lock()
+        self._probe = probe or http_probe
+        self._stop = threading.Event()
+        self._prober = None
+        if self.options["probe_interval"] > 0:
+            self._prober = threading.Thread(target=self._probe_loop, name="endpoint-prober", daemon=True)
+            self._prober.start()
+
+    def order(self):
+        """
+        Returns the endpoints to try for the next request, best first.
+
+        Endpoints with an open circuit are left out, unless every endpoint is
+        open; then they are all returned so the request still gets a chance.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            for endpoint in self.endpoints:
+                health = self._health[endpoint]
+                if health.state == OPEN and now >= health.open_until:
+                    health.state = HALF_OPEN
+                if health.state == CLOSED or (health.state == HALF_OPEN and not health.trial_in_flight):
+                    available.append(endpoint)
+            if not available:
+                return sorted(self.endpoints, key=lambda e: self._health[e].open_until)
+            return self._sort(available)
+
+    def _sort(self, endpoints):
+        def latency(endpoint):
+            ewma = self._health[endpoint].ewma
+            return 0.0 if ewma is None else ewma  # Unmeasured endpoints go first so they get measured.
+
+        if self.policy == "latency":
+            return sorted(endpoints, key=latency)
+        if self.policy == "least_outstanding":
+            return sorted(endpoints, key=lambda e: (self._health[e].outstanding, latency(e)))
+        if self.policy == "weighted":
+            weights = self.options["weights"]
+            remaining = list(endpoints)
+            ordered = []
+            while remaining:
+                pick = random.choices(remaining, weights=[weights.get(e, 1) for e in remaining])[0]
+                remaining.remove(pick)
+                ordered.append(pick)
+            return ordered
+        return endpoints
+
+    def begin(self, endpoint):
+        """
+        Marks a request to `endpoint` as in flight.
+        """
+        with self._lock:
+            health = self._health[endpoint]
+            health.outstanding += 1
+            if health.state == HALF_OPEN:
+                health.trial_in_flight = True
+
+    def success(self, endpoint, latency):
+        """
+        Records a successful request and its latency in seconds.
+        """
+        with self._lock:
+            health = self._health[endpoint]
+            health.outstanding = max(0, health.outstanding - 1)
+            health.samples.append(latency)
+            alpha = self.options["ewma_alpha"]
+            health.ewma = latency if health.ewma is None else alpha * latency + (1 - alpha) * health.ewma
+            health.successes_total += 1
+            self._close(health)
+
+    def failure(self, endpoint):
+        """
+        Records a failed request, opening the endpoint's circuit if it keeps failing.
+        """
+        with self._lock:
+            health = self._health[endpoint]
+            health.outstanding = max(0, health.outstanding - 1)
+            health.failures += 1
+            health.failures_total += 1
+            health.trial_in_flight = False
+            if health.state == HALF_OPEN or health.failures >= self.options["failure_threshold"]:
+                if health.state != OPEN:
+                    print(f"⚠️ Endpoint {endpoint} marked unhealthy, skipping it for {self.options['cooldown']}s")
+                health.state = OPEN
+                health.open_until = time.monotonic() + self.options["cooldown"]
+
+    def cancel(self, endpoint):
+        """
+        Releases a request that was abandoned by the caller, without judging the endpoint.
+        """
+        with self._lock:
+            health = self._health[endpoint]
+            health.outstanding = max(0, health.outstanding - 1)
+            health.trial_in_flight = False
+
+    def _close(self, health):
+        health.state = CLOSED
+        health.failures = 0
+        health.trial_in_flight = False
+
+    def stats(self):
+        """
+        Returns per-endpoint health, rolling latency and request counters.
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    "state": health.state,
+                    "ewma": health.ewma,
+                    "p50": health.percentile(50),
+                    "p95": health.percentile(95),
+                    "outstanding": health.outstanding,
+                    "successes": health.successes_total,
+                    "failures": health.failures_total,
+                }
+                for endpoint, health in self._health.items()
+            }
+
+    def close(self):
+        self._stop.set()
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.options["probe_interval"]):
+            with self._lock:
+                down = [e for e, h in self._health.items() if h.state != CLOSED]
+            for endpoint in down:
+                try:
+                    healthy = self._probe(endpoint)
+                except Exception:
+                    healthy = False
+                if healthy:
+                    with self._lock:
+                        print(f"✅ Endpoint {endpoint} is reachable again")
+                        self._close(self._health[endpoint])
+
+
+def health_url(endpoint):
+    """
+    Returns the URL to probe for an endpoint: the model list next to a chat URL, or the URL itself.
+
+    GET /v1/models (OpenAI-compatible servers) and GET /api/tags (Ollama) only
+    answer 200 when the server behind them is really up.
+    """
+    url = endpoint.rstrip("/")
+    if url.endswith("/api/chat"):
+        return url[:-len("/chat")] + "/tags"
+    if url.endswith("/chat/completions"):
+        return url[:-len("/chat/completions")] + "/models"
+    return endpoint
+
+
+def http_probe(endpoint, timeout=2):
+    """
+    Liveness check: a 2xx from the endpoint's health URL (see health_url()) means it is up again.
+
+    When there is no health URL to derive, the chat URL itself is probed, and the
+    405 a chat route returns for GET counts as up too.  Anything else (a 404 from
+    a wrong path, a 5xx) leaves the circuit open.
+    """
+    url = health_url(endpoint)
+    status = requests.get(url, timeout=timeout).status_code
+    return 200 <= status < 300 or (url == endpoint and status == 405)
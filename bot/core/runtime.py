@@ -0,0 +1,403 @@
+# bot/core/runtime.py
+import os
+import sys
+import json
+import asyncio
+
+from bot.core.storage import open_memory_store
+from bot.core.cache import build_memory
+from bot.core.context import build_context
+from bot.core.summary import Summarizer, summary_options
+from bot.core.reply_cache import build_reply_cache, reply_cache_options
+from bot.core.scheduler import ChannelScheduler, scheduler_options
+from bot.core.router import routing_options
+from bot.core.capabilities import capability_cache, prompt_cache_hints
+from bot.core.inference import AsyncInferenceClient, http_options
+from bot.core.metrics import Metrics, MetricsServer, SamplingProfiler, metrics_options
+from bot.core.channels import PLATFORMS, channel_options, compile_table, endpoint_groups
+from bot.core.docs import build_docs
+from bot.core.archive import archive_options, build_archive
+from bot.core.sharding import PoolClient
+
+# app.json values used when the file is missing or unreadable.
+DEFAULT_APP_CONFIG = {
+    "memory": {"log_limit": 100, "load_limit": 10, "compact_every": 50},
+    "tokens": {"max_tokens": 100},
+    "inference": {"max_in_flight": 4},
+}
+
+# Persona used when persona.json is missing or unreadable.
+DEFAULT_PERSONA_CONFIG = {
+    "default": {
+        "role": "system",
+        "content": "You are ZIA, a friendly indie dev lounge AI. Keep replies short and casual."
+    }
+}
+
+_shared = None  # The process-wide Runtime, see shared_runtime().
+
+
+class Runtime:
+    """
+    Everything the platform adapters share within one process.
+
+    Loads app.json, route.json and persona.json, and builds one memory store
+    (with its cache), context builder, inference client per endpoint group (one
+    connection pool and one in-flight limit each), summarizer, reply cache, turn
+    scheduler, docs knowledge base and metrics.  Adapters get it from shared_runtime(), so running
+    several of them in the gateway costs one set of these rather than one per
+    platform.
+
+    Channels are answered through `table`, a RoutingTable compiled from the
+    configs and the platform secrets.  Once start() has run, the files are
+    checked every channels.reload_interval seconds and a changed set is compiled
+    into a new table (and new clients, if route.json changed) that replaces the
+    old one in a single assignment.  Storage, cache, scheduler and context
+    settings still take a restart.
+
+    Exits the process, like the handlers always have, when route.json is
+    missing or has no endpoints.
+
+    Args:
+        root_dir: Project root (holds config/ and secrets/).
+        shared: Whether other processes write the same memory logs (web workers);
+            the memory cache is then left out, as it would serve stale windows.
+        pinned: Whether every scope is answered by one process only (sharded
+            Discord workers), which keeps the memory cache safe even when shared.
+        pool: URL of an InferencePool to send model calls to instead of calling
+            the endpoints from this process (see sharding.ShardSupervisor).
+    """
+
+    def __init__(self, root_dir, shared=False, pinned=False, pool=None):
+        self.root_dir = root_dir
+        self.memory_dir = os.path.join(root_dir, "secrets", "db")
+        os.makedirs(self.memory_dir, exist_ok=True)
+        self.hosted = False  # Set by the gateway: adapters then leave closing the runtime to it.
+        self.worker = None  # Index of a sharded Discord worker; the supervisor does the background upkeep.
+        self.pool = pool
+        self._closed = False
+        self._metrics_server = None
+        self._profiler = None
+        self._watcher = None
+        self._retired = set()  # Replaced inference clients, closed once their last call is done.
+        self.paths = {
+            "app": os.path.join(root_dir, "config", "app.json"),
+            "persona": os.path.join(root_dir, "config", "persona.json"),
+            "route": os.path.join(root_dir, "secrets", "config", "route.json"),
+            **{platform: os.path.join(root_dir, "secrets", "connects", f"{platform}.json") for platform in PLATFORMS},
+        }
+        self._stamps = config_stamps(self.paths)
+
+        self.app_config = load_config(self.paths["app"], DEFAULT_APP_CONFIG)
+        self.persona_config = load_config(self.paths["persona"], DEFAULT_PERSONA_CONFIG)
+        try:
+            self.route_config = read_json(self.paths["route"])
+        except Exception as e:
+            print(f"❌ Failed to load route config: {e}")
+            sys.exit(1)
+
+        memory = self.app_config["memory"]
+        self.log_limit = memory["log_limit"]
+        self.load_limit = memory["load_limit"]
+        if not self.route_config.get("endpoints"):
+            print("❌ No endpoints configured in route.json")
+            sys.exit(1)
+
+        self.metrics_options = metrics_options(self.app_config)
+        self.metrics = Metrics(self.metrics_options["enabled"], self.metrics_options["buckets"])
+        self.context = build_context(self.app_config)
+        self.archive = build_archive(self.app_config, self.memory_dir)
+        self.memory = build_memory(
+            open_memory_store(
+                self.app_config.get("storage", {}),
+                self.memory_dir,
+                self.log_limit,
+                self.load_limit,
+                memory.get("compact_every"),
+                shared=shared,
+                archive=self.archive,
+            ),
+            {} if shared and not pinned else self.app_config.get("memory_cache", {}),
+            window=self.load_limit,
+        )
+        self.capabilities = capability_cache(self.route_config, self.memory_dir)
+        self._use_clients(self._build_clients(self.app_config, self.route_config))
+        self.table = compile_table(self.app_config, self.persona_config, self._read_secrets(), self.clients)
+        self.summarizer = Summarizer(self.memory, self.context, self._summarize, summary_options(self.app_config))
+        self.replies = build_reply_cache(self.app_config, self.persona_config, self.memory_dir, self.model)
+        self.scheduler = ChannelScheduler(options=scheduler_options(self.app_config))
+        self.docs = build_docs(self.app_config, root_dir, self.memory_dir, self.context.count)
+        self._docs_refresh = None
+        self._archiver = None
+        self._register_gauges()
+
+    def persona(self, name):
+        """
+        Returns the named persona, or the default one.
+        """
+        return self.persona_config.get(name, self.persona_config["default"])
+
+    def _build_clients(self, app_config, route_config):
+        # One client per endpoint group, all sharing the learned payload shapes and the metrics.
+        tokens = app_config.get("tokens", route_config.get("tokens", {}))
+        if self.pool:
+            return {
+                group: PoolClient(self.pool, group, endpoints, route_config.get("model", "qwen3-v1-4b"), tokens.get("max_tokens", 100))
+                for group, endpoints in endpoint_groups(route_config).items()
+            }
+        return {
+            group: AsyncInferenceClient(
+                endpoints, route_config.get("model", "qwen3-v1-4b"), tokens.get("max_tokens", 100),
+                http=http_options(route_config),
+                routing=routing_options(route_config),
+                capabilities=self.capabilities,
+                max_in_flight=app_config.get("inference", {}).get("max_in_flight", 4),
+                hints=prompt_cache_hints(route_config),
+                metrics=self.metrics,
+            )
+            for group, endpoints in endpoint_groups(route_config).items()
+        }
+
+    def _use_clients(self, clients):
+        self.clients = clients
+        self.ai = clients["default"]  # For callers that don't route per channel (summaries, tools).
+        self.endpoints = self.ai.endpoints
+        self.model = self.ai.model
+        self.max_tokens = self.ai.max_tokens
+
+    def _read_secrets(self):
+        # Channel lists of the platforms that have a secrets file; the others just get defaults.
+        secrets = {}
+        for platform in PLATFORMS:
+            if os.path.exists(self.paths[platform]):
+                try:
+                    secrets[platform] = read_json(self.paths[platform])
+                except Exception as e:
+                    print(f"⚠️ Failed to read {platform} channels: {e}")
+        return secrets
+
+    async def _summarize(self, messages):
+        # Looked up on each call, so summaries follow the default endpoints across reloads.
+        return await self.ai.complete(messages)
+
+    def reload(self):
+        """
+        Re-reads the config files and swaps in a new routing table.
+
+        Inference clients are rebuilt only when route.json or the token and
+        in-flight limits changed.  The reply cache picks up the new personas
+        and reply_cache settings.  If a file can't be read or is invalid, the
+        current table is kept and a warning is printed.
+
+        Returns:
+            The replaced inference clients (empty if they were kept), for the caller to close.
+        """
+        try:
+            app_config = read_json(self.paths["app"])
+            persona_config = read_json(self.paths["persona"])
+            route_config = read_json(self.paths["route"])
+        except Exception as e:
+            print(f"⚠️ Config reload skipped, keeping the current settings: {e}")
+            return []
+        if "default" not in persona_config or not route_config.get("endpoints"):
+            print("⚠️ Config reload skipped: persona.json needs a default persona and route.json endpoints")
+            return []
+
+        old_clients = self.clients
+        if client_settings(app_config, route_config) == client_settings(self.app_config, self.route_config):
+            clients = old_clients
+        else:
+            clients = self._build_clients(app_config, route_config)
+        table = compile_table(app_config, persona_config, self._read_secrets(), clients)
+
+        self.app_config, self.persona_config, self.route_config = app_config, persona_config, route_config
+        self._use_clients(clients)
+        self.table = table
+        # Handlers hold on to the reply cache, so its persona/channel filters are updated in place.
+        self.replies.configure(reply_cache_options(app_config), persona_config, self.model)
+        print(f"🔁 Reloaded channel routing ({len(clients)} endpoint group(s))")
+        return [] if clients is old_clients else list(old_clients.values())
+
+    async def _watch(self, interval):
+        # Polls the config files' mtimes; a changed set triggers reload().
+        while True:
+            await asyncio.sleep(interval)
+            stamps = await asyncio.to_thread(config_stamps, self.paths)
+            if stamps == self._stamps:
+                continue
+            self._stamps = stamps
+            for client in self.reload():
+                self._retired.add(client)
+                asyncio.create_task(self._retire(client))
+
+    async def _retire(self, client):
+        # Calls that picked the old client up before the swap finish on it; then its pool is closed.
+        while client.calls:
+            await asyncio.sleep(1)
+        if client in self._retired:
+            self._retired.discard(client)
+            await client.close()
+
+    def _register_gauges(self):
+        # Counters the components already keep, exported as they are at scrape time.
+        def labelled(stats, label):
+            return [({label: key}, value) for key, value in stats.items() if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+        self.metrics.gauge("zia_scheduler", "Turn scheduler state and counters.", lambda: labelled(self.scheduler.stats(), "stat"))
+        self.metrics.gauge("zia_reply_cache", "Reply cache size and hit counters.", lambda: labelled(self.replies.stats(), "stat"))
+        self.metrics.gauge("zia_prompt_prefix_match_ratio", "Share of prompt tokens that repeated the previous prompt of their channel.",
+                           lambda: self.context.stats()["match_ratio"])
+        self.metrics.gauge("zia_endpoint_outstanding", "Requests in flight per endpoint.", lambda: [
+            ({"group": group, "endpoint": e}, h["outstanding"])
+            for group, client in self.clients.items() if hasattr(client, "router")  # Pool clients: the pool reports them.
+            for e, h in client.router.stats().items()
+        ])
+        self.metrics.gauge("zia_docs", "Docs index size, lookups and lookups over the latency budget.", lambda: labelled(self.docs.stats(), "stat"))
+        if self.archive is not None:
+            self.metrics.gauge("zia_memory_archive", "Archived scopes and their size before and after compression.", lambda: labelled(self.archive.stats(), "stat"))
+        if hasattr(self.memory, "stats"):
+            self.metrics.gauge("zia_memory_cache", "Memory cache size and hit counters.", lambda: labelled(self.memory.stats(), "stat"))
+
+    async def _refresh_docs(self):
+        try:
+            await asyncio.to_thread(self.docs.refresh)
+        except Exception as e:
+            print(f"⚠️ Docs re-index failed: {e}")
+
+    def archive_idle(self):
+        """
+        Moves the scopes that have been quiet for archive.idle_days into the archive.  Returns the store's report.
+        """
+        options = archive_options(self.app_config)
+        store = getattr(self.memory, "store", self.memory)  # Behind the memory cache, if there is one.
+        report = store.archive_idle(options["idle_days"] * 86400, options["batch"])
+        if report["scopes"]:
+            saved = 100 * (1 - report["after"] / report["before"]) if report["before"] else 0
+            print(f"📦 Archived {report['scopes']} idle scope(s): {report['before'] // 1024} KB -> {report['after'] // 1024} KB ({saved:.0f}% saved)")
+        return report
+
+    async def _archive_loop(self, interval):
+        while True:
+            try:
+                await asyncio.to_thread(self.archive_idle)
+            except Exception as e:
+                print(f"⚠️ Memory archive pass failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def start(self):
+        """
+        Starts the background parts: the config watcher, the docs re-index, the
+        memory archiver, and the /metrics port and sampling profiler if app.json
+        asks for them.
+
+        The web app serves /metrics itself; the port is for the Discord and Slack
+        bots and the gateway.  Everything is stopped by aclose().
+        """
+        interval = channel_options(self.app_config)["reload_interval"]
+        if interval and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch(interval))
+        upkeep = self.worker is None  # Sharded workers leave the docs re-index and archiving to the supervisor.
+        if upkeep and self.docs.enabled and self.docs.options["refresh_on_start"] and self._docs_refresh is None:
+            # Searches use the index as it is until the refresh has committed each changed file.
+            self._docs_refresh = asyncio.create_task(self._refresh_docs())
+        archive_interval = archive_options(self.app_config)["interval"]
+        if upkeep and self.archive is not None and archive_interval and self._archiver is None:
+            self._archiver = asyncio.create_task(self._archive_loop(archive_interval))
+        options = self.metrics_options
+        if options["enabled"] and options["port"] and self._metrics_server is None:
+            # Sharded workers each serve their own, on the ports after the supervisor's.
+            port = options["port"] + (0 if self.worker is None else 1 + self.worker)
+            self._metrics_server = MetricsServer(self.metrics, options["host"], port)
+            try:
+                await self._metrics_server.start()
+            except OSError as e:
+                print(f"⚠️ Failed to start the metrics port: {e}")
+                self._metrics_server = None
+        profile = options["profile"]
+        if profile["enabled"] and self._profiler is None:
+            path = os.path.join(self.root_dir, profile["path"])
+            if self.worker is not None:
+                path = f"{path}.worker{self.worker}"
+            self._profiler = SamplingProfiler(path, profile["interval"], profile["dump_every"])
+            self._profiler.start()
+
+    async def aclose(self):
+        """
+        Flushes memory and closes the shared resources (once, however many adapters ask).
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._archiver is not None:
+            self._archiver.cancel()
+        if self._metrics_server is not None:
+            await self._metrics_server.stop()
+        if self._profiler is not None:
+            await asyncio.to_thread(self._profiler.stop)
+        await asyncio.to_thread(self.memory.close)
+        await asyncio.to_thread(self.replies.close)
+        await asyncio.to_thread(self.docs.close)
+        for client in [*self.clients.values(), *self._retired]:
+            await client.close()
+        self._retired.clear()
+
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def config_stamps(paths):
+    """
+    Returns (mtime, size) per config file, None for missing ones, to tell when any of them changed.
+    """
+    stamps = {}
+    for name, path in paths.items():
+        try:
+            stat = os.stat(path)
+            stamps[name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamps[name] = None
+    return stamps
+
+
+def client_settings(app_config, route_config):
+    # Everything the inference clients are built from: a change means new clients.
+    return route_config, app_config.get("tokens"), app_config.get("inference")
+
+
+def load_config(path, default):
+    """
+    Reads a JSON config file, falling back to `default` (with a warning) if it can't be read.
+    """
+    try:
+        return read_json(path)
+    except Exception as e:
+        print(f"⚠️ Failed to load {os.path.basename(path)}, using defaults: {e}")
+        return default
+
+
+def project_root(default):
+    """
+    Returns the directory that holds config/ and secrets/: the shared runtime's, once there is one.
+
+    Lets a tool (e.g. bot/tools/benchmark.py) create the runtime on a scratch
+    directory before it imports the handlers, which then read their own secrets
+    from there too.
+    """
+    return _shared.root_dir if _shared is not None else default
+
+
+def shared_runtime(root_dir, shared=False, pinned=False, pool=None):
+    """
+    Returns the process-wide Runtime, creating it on first use.
+
+    The first caller decides the options: the gateway creates it before it loads
+    any adapter, so adapters hosted there all get the same one.
+    """
+    global _shared
+    if _shared is None:
+        _shared = Runtime(root_dir, shared=shared, pinned=pinned, pool=pool)
+    return _shared
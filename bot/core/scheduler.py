@@ -0,0 +1,194 @@
+# bot/core/scheduler.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Scheduler settings used when app.json has no "scheduler" block (or leaves a key out).
+DEFAULT_SCHEDULER_OPTIONS = {
+    "coalesce": True,  # Answer messages that arrived during a reply together, in one follow-up turn.
+    "coalesce_max": 5,  # Most messages answered by one turn.
+    "max_pending": 5,  # Messages waiting per channel; more are shed.
+    "max_queued": 32,  # Messages waiting across all channels; more are shed.
+    "max_active": 4,  # Channels being answered at the same time.
+    "busy_reply": "I'm a bit swamped right now, give me a moment and try again.",
+    "busy_cooldown": 30,  # Seconds between busy replies in the same channel.
+    "dedupe_ttl": 600,  # Seconds an incoming event ID is remembered, to drop redeliveries.
+    "dedupe_max": 4096,  # Most event IDs remembered.
+}
+
+
+def scheduler_options(app_config):
+    """
+    Returns the "scheduler" block of app.json, filled in with defaults.
+    """
+    return {**DEFAULT_SCHEDULER_OPTIONS, **app_config.get("scheduler", {})}
+
+
+class ChannelScheduler:
+    """
+    Queues incoming messages per channel and answers them one turn at a time.
+
+    Each scope (channel) gets a worker while it has messages waiting, so turns in
+    a channel never overlap and its memory is saved in order, while different
+    channels run side by side, at most `max_active` at once.  With `coalesce`,
+    the messages that pile up while a turn is running (or waiting for a free
+    slot) are handed to the handler together, so a burst of messages costs one
+    follow-up model call instead of one call each.
+
+    When a channel already has `max_pending` messages waiting, or all channels
+    together have `max_queued`, submit() sheds the message and returns False;
+    the caller can then post busy_reply(scope).
+
+    `handler(scope, items)` may be a blocking function (workers are threads) or a
+    coroutine function (workers are tasks on the running event loop; submit()
+    must then be called from that loop).  A scheduler shared by several adapters
+    takes each adapter's handler with submit() instead; the limits then apply
+    across all of them.
+
+    Args:
+        handler: Callable(scope, items) that answers a list of queued items.
+        options: Scheduler settings, see scheduler_options().
+    """
+
+    def __init__(self, handler=None, options=None):
+        self.handler = handler
+        self.options = {**DEFAULT_SCHEDULER_OPTIONS, **(options or {})}
+        self.accepted = 0
+        self.shed = 0
+        self.turns = 0
+        self._queues = {}  # scope -> deque of items waiting for a turn.
+        self._queued = 0
+        self._last_busy = OrderedDict()  # scope -> time of the last busy reply, oldest first.
+        self._lock = threading.Lock()
+        self._tasks = set()  # Keeps asyncio tasks referenced until they finish.
+        self._async_slots = asyncio.Semaphore(self.options["max_active"])
+        self._thread_slots = threading.BoundedSemaphore(self.options["max_active"])
+
+    def submit(self, scope, item, handler=None):
+        """
+        Queues an item for the scope and starts its worker if needed.  Returns False if the item was shed.
+        """
+        handler = handler or self.handler
+        with self._lock:
+            pending = self._queues.get(scope)
+            waiting = len(pending) if pending is not None else 0
+            if waiting >= self.options["max_pending"] or self._queued >= self.options["max_queued"]:
+                self.shed += 1
+                return False
+            self.accepted += 1
+            self._queued += 1
+            if pending is not None:
+                pending.append(item)  # The scope's worker picks it up after the current turn.
+                return True
+            self._queues[scope] = deque([item])
+        if asyncio.iscoroutinefunction(handler):
+            task = asyncio.get_running_loop().create_task(self._drain_async(scope, handler))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            threading.Thread(target=self._drain, args=(scope, handler), name=f"turns-{scope}", daemon=True).start()
+        return True
+
+    def busy_reply(self, scope):
+        """
+        Returns the text to post for a shed message, or None if the channel was told recently.
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._last_busy:
+                # Past the cooldown an entry no longer matters: forget it.
+                first, told_at = next(iter(self._last_busy.items()))
+                if now - told_at < self.options["busy_cooldown"]:
+                    break
+                del self._last_busy[first]
+            if scope in self._last_busy:
+                return None
+            self._last_busy[scope] = now
+        return self.options["busy_reply"]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "channels": len(self._queues),  # Channels with a worker (running or waiting for a slot).
+                "queued": self._queued,
+                "accepted": self.accepted,
+                "turns": self.turns,
+                "shed": self.shed,
+            }
+
+    def _next_batch(self, scope):
+        # Take the next turn's items, or retire the worker when the queue is empty.
+        with self._lock:
+            pending = self._queues[scope]
+            if not pending:
+                del self._queues[scope]
+                return None
+            count = self.options["coalesce_max"] if self.options["coalesce"] else 1
+            batch = [pending.popleft() for _ in range(min(count, len(pending)))]
+            self._queued -= len(batch)
+            self.turns += 1
+            return batch
+
+    def _drain(self, scope, handler):
+        while True:
+            # The slot is taken before the batch, so messages sent while waiting for one are coalesced too.
+            with self._thread_slots:
+                batch = self._next_batch(scope)
+                if batch is None:
+                    return
+                try:
+                    handler(scope, batch)
+                except Exception as e:
+                    print(f"⚠️ Turn in {scope} failed: {e}")
+
+    async def _drain_async(self, scope, handler):
+        while True:
+            async with self._async_slots:
+                batch = self._next_batch(scope)
+                if batch is None:
+                    return
+                try:
+                    await handler(scope, batch)
+                except Exception as e:
+                    print(f"⚠️ Turn in {scope} failed: {e}")
+
+
+class RecentIds:
+    """
+    The IDs seen in the last `ttl` seconds, for dropping events that are delivered twice.
+
+    Slack redelivers an event when it thinks the first delivery was not
+    acknowledged; remembering event IDs (and the client's message ID) for a while
+    lets the handler answer each message once.
+
+    Args:
+        ttl: Seconds an ID is remembered.
+        max_entries: Most IDs remembered; the oldest are forgotten first.
+    """
+
+    def __init__(self, ttl=600, max_entries=4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.duplicates = 0
+        self._seen = OrderedDict()  # id -> time it was first seen, oldest first.
+        self._lock = threading.Lock()
+
+    def add(self, *ids):
+        """
+        Remembers the IDs (empty ones are ignored).  Returns False if any of them was seen already.
+        """
+        ids = [i for i in ids if i]
+        now = time.monotonic()
+        with self._lock:
+            while self._seen:
+                first, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.ttl and len(self._seen) < self.max_entries:
+                    break
+                del self._seen[first]
+            if any(i in self._seen for i in ids):
+                self.duplicates += 1
+                return False
+            for i in ids:
+                self._seen[i] = now
+        return True
@@ -0,0 +1,278 @@
+# bot/core/sharding.py
+import os
+import sys
+import json
+import signal
+import asyncio
+
+import aiohttp
+import requests
+
+# Sharding settings used when app.json has no "sharding" block (or leaves a key out).
+DEFAULT_SHARDING_OPTIONS = {
+    "enabled": False,  # Run the Discord bot as an AutoShardedClient.
+    "shard_count": None,  # Total shards (None: what Discord recommends for the bot, at least one per worker).
+    "workers": 1,  # Processes the shards are split across (1: all shards in this process).
+    "start_delay": 5.0,  # Seconds between starting workers, per shard, to respect Discord's identify limit.
+    "restart_delay": 5.0,  # Seconds before a worker that exited is started again.
+    "pool_host": "127.0.0.1",  # Interface of the inference pool the workers share.
+    "pool_port": 0,  # Its port (0: any free one).
+}
+
+# Environment variable the supervisor describes a worker's part in (JSON: worker, shards, shard_count, pool).
+WORKER_ENV = "ZIA_SHARD_WORKER"
+
+
+def sharding_options(app_config):
+    """
+    Returns the "sharding" block of app.json, filled in with defaults.
+    """
+    return {**DEFAULT_SHARDING_OPTIONS, **app_config.get("sharding", {})}
+
+
+def worker_assignment():
+    """
+    Returns this process's part as set by ShardSupervisor ({"worker", "shards", "shard_count", "pool"}), or None.
+    """
+    value = os.environ.get(WORKER_ENV)
+    return json.loads(value) if value else None
+
+
+def worker_shards(worker, workers, shard_count):
+    """
+    Returns the shard IDs a worker runs: every `workers`-th shard, starting at its index.
+    """
+    return list(range(worker, shard_count, workers))
+
+
+def recommended_shards(token, fallback):
+    """
+    Asks Discord how many shards the bot should run, or returns `fallback` if that fails.
+    """
+    try:
+        response = requests.get(
+            "https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}, timeout=10
+        )
+        response.raise_for_status()
+        return response.json()["shards"]
+    except Exception as e:
+        print(f"⚠️ Could not get the recommended shard count, using {fallback}: {e}")
+        return fallback
+
+
+class InferencePool:
+    """
+    Serves a runtime's inference clients to other processes over local HTTP.
+
+    Sharded Discord workers send their model calls here instead of holding their
+    own clients, so the endpoints see one in-flight limit, one set of health
+    scores and one connection pool however many workers there are.  Calls are
+    made with the runtime's current client for the requested endpoint group, so
+    a reloaded route.json applies to every worker at once.
+
+        POST /complete  {"group", "messages", "max_tokens"}  ->  {"reply": text or null}
+        POST /stream    same body  ->  one JSON-encoded chunk per line
+
+    Args:
+        runtime: The Runtime whose clients make the calls.
+        host: Interface to listen on.
+        port: Port to listen on (0: any free one).
+    """
+
+    def __init__(self, runtime, host="127.0.0.1", port=0):
+        self.runtime = runtime
+        self.host = host
+        self.port = port
+        self.url = None
+        self._runner = None
+
+    def _client(self, body):
+        return self.runtime.clients.get(body.get("group"), self.runtime.ai)
+
+    async def start(self):
+        from aiohttp import web
+
+        async def complete(request):
+            body = await request.json()
+            reply = await self._client(body).complete(body["messages"], body.get("max_tokens"))
+            return web.json_response({"reply": reply})
+
+        async def stream(request):
+            body = await request.json()
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            async for chunk in self._client(body).stream(body["messages"], body.get("max_tokens")):
+                await response.write(json.dumps(chunk).encode("utf-8") + b"\n")
+            await response.write_eof()
+            return response
+
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/complete", complete)
+        app.router.add_post("/stream", stream)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]  # The port picked when it was 0.
+        self.url = f"http://{self.host}:{self.port}"
+        print(f"✅ Inference pool on {self.url}")
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class PoolClient:
+    """
+    Inference client of a worker process: forwards calls to an InferencePool.
+
+    Has the complete()/stream() interface of AsyncInferenceClient, so handlers
+    and routes use it unchanged.  A pool that can't be reached counts as a
+    failed call (complete() returns None, stream() yields nothing).
+
+    Args:
+        url: The pool's address.
+        group: Endpoint group the calls are for.
+        endpoints: That group's endpoints (for display; the pool picks among them).
+        model: Model name, as in route.json.
+        max_tokens: Default maximum tokens per reply.
+    """
+
+    def __init__(self, url, group, endpoints, model, max_tokens):
+        self.url = url
+        self.group = group
+        self.endpoints = endpoints
+        self.model = model
+        self.max_tokens = max_tokens
+        self.calls = 0  # Calls in progress.
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            # No total timeout: the pool applies the endpoints' own timeouts.
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=5))
+        return self._session
+
+    def _body(self, messages, max_tokens):
+        return {"group": self.group, "messages": messages, "max_tokens": max_tokens or self.max_tokens}
+
+    async def complete(self, messages, max_tokens=None):
+        self.calls += 1
+        try:
+            async with self._get_session().post(f"{self.url}/complete", json=self._body(messages, max_tokens)) as response:
+                response.raise_for_status()
+                return (await response.json())["reply"]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            print(f"⚠️ Inference pool call failed: {e}")
+            return None
+        finally:
+            self.calls -= 1
+
+    async def stream(self, messages, max_tokens=None):
+        self.calls += 1
+        try:
+            async with self._get_session().post(f"{self.url}/stream", json=self._body(messages, max_tokens)) as response:
+                response.raise_for_status()
+                async for line in response.content:
+                    if line.strip():
+                        yield json.loads(line)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"⚠️ Inference pool stream failed: {e}")
+        finally:
+            self.calls -= 1
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class ShardSupervisor:
+    """
+    Starts one worker process per slice of the shards and keeps them running.
+
+    Worker i runs `script` with WORKER_ENV describing shards i, i + workers,
+    i + 2 * workers, ...  Discord sends all of a guild's events to one shard
+    ((guild_id >> 22) % shard_count), so every channel is answered by exactly
+    one worker: its turns stay in order (that worker's scheduler runs them one
+    at a time) and its memory is only ever written by one process.  A worker
+    that exits is started again after `restart_delay` seconds; stop() sends
+    SIGTERM so workers flush their memory.
+
+    Args:
+        script: The bot script the workers run.
+        workers: Number of worker processes.
+        shard_count: Total number of shards.
+        pool: URL of the InferencePool the workers use.
+        start_delay: Seconds to wait per shard before starting the next worker.
+        restart_delay: Seconds before restarting a worker that exited.
+    """
+
+    def __init__(self, script, workers, shard_count, pool, start_delay=5.0, restart_delay=5.0):
+        self.script = script
+        self.workers = workers
+        self.shard_count = shard_count
+        self.pool = pool
+        self.start_delay = start_delay
+        self.restart_delay = restart_delay
+        self.restarts = 0
+        self._processes = {}  # worker index -> running asyncio subprocess.
+        self._stopping = False
+
+    async def run(self):
+        """
+        Starts the workers and restarts them as they exit, until cancelled.
+        """
+        tasks = []
+        try:
+            for worker in range(self.workers):
+                tasks.append(asyncio.create_task(self._keep(worker)))
+                # Discord allows one identify per few seconds: give this worker's shards time to connect.
+                await asyncio.sleep(self.start_delay * len(worker_shards(worker, self.workers, self.shard_count)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()  # The processes keep running until stop().
+
+    async def stop(self, timeout=15):
+        self._stopping = True
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+        for worker, process in list(self._processes.items()):
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Worker {worker} did not stop in {timeout}s, killing it")
+                process.kill()
+                await process.wait()
+
+    async def _keep(self, worker):
+        shards = worker_shards(worker, self.workers, self.shard_count)
+        assignment = {"worker": worker, "shards": shards, "shard_count": self.shard_count, "pool": self.pool}
+        env = {**os.environ, WORKER_ENV: json.dumps(assignment)}
+        while not self._stopping:
+            process = await asyncio.create_subprocess_exec(sys.executable, self.script, env=env)
+            self._processes[worker] = process
+            print(f"✅ Worker {worker} started (pid {process.pid}, shards {shards} of {self.shard_count})")
+            code = await process.wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            print(f"❌ Worker {worker} exited with code {code}, restarting in {self.restart_delay}s")
+            await asyncio.sleep(self.restart_delay)
+
+
+async def run_until_terminated(coro):
+    """
+    Runs a coroutine, cancelling it on SIGTERM so its cleanup (memory flush) runs.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    except (NotImplementedError, RuntimeError):
+        pass  # Windows: no signal handlers on the event loop.
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
@@ -0,0 +1,530 @@
+# bot/core/storage.py
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from bot.core.locks import file_lock
+from bot.core.memory import MemoryStore, make_record, epoch, encode_record, decode_record
+
+# Storage settings used when app.json has no "storage" block (or leaves a key out).
+DEFAULT_STORAGE_OPTIONS = {
+    "backend": "jsonl",  # "jsonl" (one log file per scope) or "sqlite".
+    "sqlite_path": "zia.sqlite3",  # Relative to the memory directory.
+    "busy_timeout": 5.0,  # Seconds a write waits for another process to finish its transaction.
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    scope TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    tokens TEXT,
+    PRIMARY KEY (scope, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_scope_timestamp ON messages (scope, timestamp);
+CREATE TABLE IF NOT EXISTS summaries (
+    scope TEXT PRIMARY KEY,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+"""
+
+
+def storage_options(app_config):
+    """
+    Returns the "storage" block of app.json, filled in with defaults.
+    """
+    return {**DEFAULT_STORAGE_OPTIONS, **app_config.get("storage", {})}
+
+
+def connect(path, busy_timeout=5.0, schema=SCHEMA):
+    """
+    Opens a SQLite database in WAL mode, so readers never wait for writers.
+
+    The connection is in autocommit mode; writes open their own transactions.
+    """
+    db = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")  # Durable across crashes of the bot; only a power cut can lose the last commits.
+    db.executescript(schema)
+    if schema is SCHEMA:
+        columns = {row[1] for row in db.execute("PRAGMA table_info(messages)")}
+        if "tokens" not in columns:
+            db.execute("ALTER TABLE messages ADD COLUMN tokens TEXT")  # Databases created before token counts were saved.
+    return db
+
+
+class SQLiteMemoryStore:
+    """
+    Conversation memory kept in one SQLite database instead of a file per scope.
+
+    Drop-in replacement for MemoryStore (same load/page/append/write_records
+    interface and sequence numbers).  Every write_records() or write_many() call is
+    a single transaction, so a MemoryCache flush commits all pending scopes at once.
+    Old messages are trimmed back to `log_limit` the same way MemoryStore compacts.
+
+    Discord, Slack and web processes can share the database: WAL mode lets readers
+    run alongside a writer, and writes take SQLite's write lock before picking
+    sequence numbers.
+
+    Scopes that still have a .jsonl log (or an older .json file) in `import_dir`
+    are imported the first time they are used; bot/tools/migrate_sqlite.py imports
+    everything in one go instead.
+
+    With an `archive`, archive_idle() moves the rows of quiet scopes into it, and
+    they are put back the next time the scope is used.  SQLite reuses the freed
+    pages for new messages; run VACUUM to give the space back to the disk.
+
+    Args:
+        path: SQLite database file.
+        log_limit: Number of messages kept per scope after trimming.
+        load_limit: Default number of messages returned by load().
+        compact_every: Extra messages allowed before a trim (defaults to log_limit).
+        import_dir: Directory with file-based memory to import from (None to skip).
+        busy_timeout: Seconds to wait for another process's write transaction.
+        archive: Archive for idle scopes (None: keep everything in the database).
+    """
+
+    def __init__(self, path, log_limit=100, load_limit=10, compact_every=None, import_dir=None, busy_timeout=5.0, archive=None):
+        self.path = path
+        self.log_limit = log_limit
+        self.load_limit = load_limit
+        self.compact_every = compact_every or log_limit
+        self.import_dir = import_dir
+        self.archive = archive
+        self._db = connect(path, busy_timeout)
+        self._lock = threading.Lock()
+        self._checked = set()  # Scopes already checked for files to import.
+
+    def load(self, scope, limit=None):
+        """
+        Returns the last `limit` messages for a scope (load_limit by default).
+        """
+        limit = self.load_limit if limit is None else limit
+        records, _ = self.page(scope, None, limit)
+        return records
+
+    def load_summary(self, scope):
+        scope = str(scope)
+        self._import(scope)
+        with self._lock:
+            row = self._db.execute("SELECT summary FROM summaries WHERE scope = ?", (scope,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_summary(self, scope, summary):
+        scope = str(scope)
+        self._import(scope)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (scope, summary) VALUES (?, ?)",
+                (scope, json.dumps(summary, ensure_ascii=False)),
+            )
+
+    def page(self, scope, before=None, limit=20):
+        """
+        Returns one page of history, oldest first (see MemoryStore.page).
+        """
+        if limit <= 0:
+            return [], None
+        scope = str(scope)
+        self._import(scope)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, role, content, timestamp, tokens FROM messages"
+                " WHERE scope = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (scope, before if before is not None else 2 ** 63 - 1, limit + 1),
+            ).fetchall()
+        cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            cursor = rows[-1][0]
+        records = []
+        for seq, role, content, timestamp, tokens in reversed(rows):
+            record = {"role": role, "content": content, "timestamp": epoch(timestamp), "seq": seq}
+            if tokens:
+                record["tokens"] = json.loads(tokens)
+            records.append(record)
+        return records, cursor
+
+    def next_seq(self, scope):
+        scope = str(scope)
+        self._import(scope)
+        with self._lock:
+            return self._next_seq(scope)
+
+    def append(self, scope, role, content, tokens=None):
+        """
+        Appends one message to a scope.
+
+        Returns:
+            The message's sequence number.
+        """
+        return self.write_records(scope, [make_record(role, content, tokens)])
+
+    def extend(self, scope, messages):
+        return self.write_records(scope, [make_record(role, content) for role, content in messages])
+
+    def write_records(self, scope, records):
+        """
+        Appends already-built records to a scope in one transaction.
+
+        Returns:
+            The sequence number of the first record.
+        """
+        if not records:
+            return None
+        scope = str(scope)
+        self._import(scope)
+        with self._lock, self._transaction():
+            return self._insert(scope, records)
+
+    def write_many(self, batches):
+        """
+        Writes {scope: records} for several scopes in a single transaction.
+
+        Returns:
+            The batches that could not be written ({} on success).
+        """
+        batches = {str(scope): records for scope, records in batches.items()}
+        for scope in batches:
+            self._import(scope)
+        try:
+            with self._lock, self._transaction():
+                for scope, records in batches.items():
+                    self._insert(scope, records)
+        except sqlite3.Error as e:
+            print(f"⚠️ Failed to write memory batch: {e}")
+            return batches
+        return {}
+
+    def compact(self, scope):
+        scope = str(scope)
+        with self._lock, self._transaction():
+            self._trim(scope, self._next_seq(scope))
+
+    def idle_scopes(self, idle_seconds):
+        """
+        Returns [(scope, time of its last message)] for scopes without a message in `idle_seconds`.
+        """
+        cutoff = time.time() - idle_seconds
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT scope, timestamp FROM messages WHERE (scope, seq) IN (SELECT scope, MAX(seq) FROM messages GROUP BY scope)"
+            ).fetchall()
+        return sorted((scope, epoch(timestamp)) for scope, timestamp in rows if epoch(timestamp) < cutoff)
+
+    def archive_idle(self, idle_seconds, batch=200):
+        """
+        Moves the rows of scopes without a message in `idle_seconds` into the archive (see MemoryStore.archive_idle).
+        """
+        report = {"scopes": 0, "before": 0, "after": 0}
+        if self.archive is None:
+            return report
+        idle = self.idle_scopes(idle_seconds)
+        cutoff = time.time() - idle_seconds
+        for i in range(0, len(idle), batch):
+            # One transaction per batch: the rows are only deleted once their segment is written.
+            with self._lock, self._transaction():
+                entries = [e for e in (self._archive_entry(scope, cutoff) for scope, _ in idle[i:i + batch]) if e]
+                if not entries:
+                    continue
+                report["after"] += self.archive.add(entries)
+                for entry in entries:
+                    self._db.execute("DELETE FROM messages WHERE scope = ?", (entry["scope"],))
+                    self._db.execute("DELETE FROM summaries WHERE scope = ?", (entry["scope"],))
+            report["scopes"] += len(entries)
+            report["before"] += sum(entry["bytes"] for entry in entries)
+        return report
+
+    def _archive_entry(self, scope, cutoff):
+        # What archive.add() needs for one scope, or None if it got a message since it was found idle.
+        rows = self._db.execute(
+            "SELECT seq, role, content, timestamp, tokens FROM messages WHERE scope = ? ORDER BY seq", (scope,)
+        ).fetchall()
+        if not rows or epoch(rows[-1][3]) >= cutoff:
+            return None
+        data = "".join(
+            encode_record({"role": role, "content": content, "timestamp": timestamp, "tokens": json.loads(tokens) if tokens else None})
+            for _, role, content, timestamp, tokens in rows
+        ).encode("utf-8")
+        row = self._db.execute("SELECT summary FROM summaries WHERE scope = ?", (scope,)).fetchone()
+        return {
+            "scope": scope,
+            "data": data,
+            "base": rows[0][0],
+            "count": len(rows),
+            "last": epoch(rows[-1][3]),
+            "summary": json.loads(row[0]) if row else None,
+            "bytes": len(data) + (len(row[0]) if row else 0),  # About what the rows hold; the file only shrinks on VACUUM.
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+    def _next_seq(self, scope):
+        row = self._db.execute("SELECT MAX(seq) FROM messages WHERE scope = ?", (scope,)).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def _insert(self, scope, records):
+        first_seq = self._next_seq(scope)
+        self._db.executemany(
+            "INSERT OR IGNORE INTO messages (scope, seq, role, content, timestamp, tokens) VALUES (?, ?, ?, ?, ?, ?)",
+            [(scope, first_seq + i) + _row(r) for i, r in enumerate(records)],
+        )
+        next_seq = first_seq + len(records)
+        row = self._db.execute("SELECT MIN(seq) FROM messages WHERE scope = ?", (scope,)).fetchone()
+        if row[0] is not None and next_seq - row[0] >= self.log_limit + self.compact_every:
+            self._trim(scope, next_seq)
+        return first_seq
+
+    def _trim(self, scope, next_seq):
+        # Dropped messages keep their numbers, exactly like a MemoryStore compaction.
+        self._db.execute("DELETE FROM messages WHERE scope = ? AND seq < ?", (scope, next_seq - self.log_limit))
+
+    def _import(self, scope):
+        # Pull in a scope's file-based history the first time this process sees the scope,
+        # and its archived history whenever it has been archived (possibly by another process).
+        if scope not in self._checked:
+            self._checked.add(scope)
+            if self.import_dir:
+                import_scope(self, MemoryStore(self.import_dir, self.log_limit), scope)
+        if self.archive is not None and self.archive.contains(scope):
+            self._rehydrate(scope)
+
+    def _rehydrate(self, scope):
+        # The write transaction is taken first, so no other writer can add to the scope while it comes back.
+        with self._lock, self._transaction():
+            if self._db.execute("SELECT 1 FROM messages WHERE scope = ? LIMIT 1", (scope,)).fetchone():
+                self.archive.discard(scope)  # A pass was interrupted after archiving; the live rows win.
+                return
+            taken = self.archive.take(scope)
+            if taken is None:
+                return
+            data, base, summary = taken
+            records = [decode_record(json.loads(line)) for line in data.splitlines()]
+            self._db.executemany(
+                "INSERT OR IGNORE INTO messages (scope, seq, role, content, timestamp, tokens) VALUES (?, ?, ?, ?, ?, ?)",
+                [(scope, base + i) + _row(r) for i, r in enumerate(records)],
+            )
+            if summary is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO summaries (scope, summary) VALUES (?, ?)",
+                    (scope, json.dumps(summary, ensure_ascii=False)),
+                )
+
+    def import_records(self, scope, records):
+        """
+        Stores records that already carry their "seq", unless the scope has messages already.
+
+        Returns:
+            The number of records imported.
+        """
+        if not records:
+            return 0
+        scope = str(scope)
+        with self._lock, self._transaction():
+            if self._db.execute("SELECT 1 FROM messages WHERE scope = ? LIMIT 1", (scope,)).fetchone():
+                return 0
+            self._db.executemany(
+                "INSERT OR IGNORE INTO messages (scope, seq, role, content, timestamp, tokens) VALUES (?, ?, ?, ?, ?, ?)",
+                [(scope, r["seq"]) + _row(r) for r in records],
+            )
+        return len(records)
+
+
+def _row(record):
+    # Column values for a record, after (scope, seq).
+    tokens = record.get("tokens")
+    return (
+        record.get("role", ""),
+        record.get("content", ""),
+        record.get("timestamp", ""),
+        json.dumps(tokens, separators=(",", ":")) if tokens else None,
+    )
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so two processes can't pick the same sequence numbers.
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def import_scope(target, source, scope):
+    """
+    Copies one scope from a file-based MemoryStore into a SQLiteMemoryStore.
+
+    The source log (and its index) is renamed to .migrated afterwards so it is
+    never imported twice.  Returns the number of records imported.
+    """
+    log = source.path(scope)
+    if not os.path.exists(log) and not os.path.exists(source.legacy_path(scope)):
+        return 0
+    records, _ = source.page(scope, None, source.log_limit + source.compact_every)
+    count = target.import_records(scope, records)
+    summary = source.load_summary(scope)
+    if summary and target.load_summary(scope) is None:
+        target.save_summary(scope, summary)
+    for path in (source.index_path(scope), source.lock_path(scope), source.summary_path(scope)):
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.exists(log):
+        os.replace(log, log + ".migrated")
+    return count
+
+
+class JsonUserStore:
+    """
+    Web users in a single users.json file.
+
+    Registrations take a file lock and replace the file atomically, so several
+    processes can register users without losing each other's writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            self._save({})
+
+    def load(self):
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def get(self, username):
+        return self.load().get(username)
+
+    def add(self, username, record):
+        """
+        Adds a user.  Returns False if the username is taken.
+        """
+        with file_lock(self.path + ".lock"):
+            users = self.load()
+            if username in users:
+                return False
+            users[username] = record
+            self._save(users)
+            return True
+
+    def close(self):
+        pass
+
+    def _save(self, users):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(users, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class SQLiteUserStore:
+    """
+    Web users in the SQLite database, one row per user.
+
+    A users.json file at `import_path` is imported on first start and renamed to
+    users.json.migrated.
+    """
+
+    def __init__(self, path, import_path=None, busy_timeout=5.0):
+        self.path = path
+        self._db = connect(path, busy_timeout)
+        self._lock = threading.Lock()
+        if import_path and os.path.exists(import_path):
+            self.import_json(import_path)
+
+    def load(self):
+        with self._lock:
+            rows = self._db.execute("SELECT username, password FROM users").fetchall()
+        return {u: {"password": p} for u, p in rows}
+
+    def get(self, username):
+        with self._lock:
+            row = self._db.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return {"password": row[0]} if row else None
+
+    def add(self, username, record):
+        """
+        Adds a user.  Returns False if the username is taken.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+                (username, record["password"]),
+            )
+        return cursor.rowcount == 1
+
+    def import_json(self, import_path):
+        """
+        Imports a users.json file and renames it.  Returns the number of new users.
+        """
+        with open(import_path, "r") as f:
+            users = json.load(f)
+        with self._lock, _Transaction(self._db):
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+                [(u, r["password"]) for u, r in users.items()],
+            )
+            added = self._db.total_changes - before
+        os.replace(import_path, import_path + ".migrated")
+        print(f"✅ Imported {added} users from {import_path}")
+        return added
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_memory_store(storage_config, memory_dir, log_limit=100, load_limit=10, compact_every=None, shared=False, archive=None):
+    """
+    Builds the memory store selected by the "storage" block of app.json.
+
+    Args:
+        storage_config: The "storage" block (see DEFAULT_STORAGE_OPTIONS).
+        memory_dir: Directory that holds the logs or the SQLite database.
+        shared: Whether other processes write the same JSONL logs (ignored for SQLite,
+            which always supports it).
+        archive: Archive for idle scopes (see archive.build_archive), or None.
+    """
+    options = {**DEFAULT_STORAGE_OPTIONS, **storage_config}
+    if options["backend"] == "sqlite":
+        os.makedirs(memory_dir, exist_ok=True)
+        return SQLiteMemoryStore(
+            os.path.join(memory_dir, options["sqlite_path"]),
+            log_limit, load_limit, compact_every,
+            import_dir=memory_dir,
+            busy_timeout=options["busy_timeout"],
+            archive=archive,
+        )
+    return MemoryStore(memory_dir, log_limit, load_limit, compact_every, shared=shared, archive=archive)
+
+
+def open_user_store(storage_config, db_dir):
+    """
+    Builds the web user store selected by the "storage" block of app.json.
+    """
+    options = {**DEFAULT_STORAGE_OPTIONS, **storage_config}
+    users_json = os.path.join(db_dir, "users.json")
+    if options["backend"] == "sqlite":
+        os.makedirs(db_dir, exist_ok=True)
+        return SQLiteUserStore(
+            os.path.join(db_dir, options["sqlite_path"]),
+            import_path=users_json,
+            busy_timeout=options["busy_timeout"],
+        )
+    return JsonUserStore(users_json)
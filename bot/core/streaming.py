@@ -0,0 +1,98 @@
+# bot/core/streaming.py
+import time
+
+# Longest message each platform accepts.
+DISCORD_MESSAGE_LIMIT = 2000
+SLACK_MESSAGE_LIMIT = 4000
+
+# Streaming settings used when app.json has no "streaming" block (or leaves a key out).
+DEFAULT_STREAMING_OPTIONS = {
+    "enabled": False,
+    "placeholder": "💭 ...",
+    "edit_interval": {"discord": 1.5, "slack": 1.0},  # Minimum seconds between edits of one reply.
+}
+
+
+def streaming_options(app_config):
+    """
+    Returns the "streaming" block of app.json, filled in with defaults.
+    """
+    options = {**DEFAULT_STREAMING_OPTIONS, **app_config.get("streaming", {})}
+    options["edit_interval"] = {**DEFAULT_STREAMING_OPTIONS["edit_interval"], **options["edit_interval"]}
+    return options
+
+
+def split_message(text, limit):
+    """
+    Splits text into pages of at most `limit` characters, preferring line and word breaks.
+
+    A page only depends on the text before the next page starts, so pages that are
+    already full never change as more text is streamed in.  Empty pages are
+    dropped (the platforms reject empty messages); empty text is one empty page.
+    """
+    pages = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        pages.append(text[:cut])
+        text = text[cut:].lstrip("\n ")
+    if text or not pages:
+        pages.append(text)
+    return pages
+
+
+class ProgressiveReply:
+    """
+    Decides when and how to update a reply that is being edited while the model streams.
+
+    Chunks are fed in as they arrive; feed() says when enough time has passed since
+    the last edit, and updates() returns the edits to make.  Edits are coalesced to at
+    most one per `interval` seconds to stay under the platform's rate limits, and the
+    text is split into several messages once it outgrows `limit`.  The class does no
+    I/O itself, so the same logic drives Discord (async) and Slack (sync) replies.
+
+    Args:
+        limit: Maximum characters per message.
+        interval: Minimum seconds between edits.
+        placeholder: Text shown before the first token arrives.
+    """
+
+    def __init__(self, limit, interval, placeholder):
+        self.limit = limit
+        self.interval = interval
+        self.placeholder = placeholder
+        self.text = ""
+        self.shown = [placeholder]  # Text currently displayed in each posted message.
+        self._last_update = time.monotonic()
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of the reply.  Returns True when an update is due.
+        """
+        self.text += chunk
+        return time.monotonic() - self._last_update >= self.interval
+
+    def updates(self, final=False):
+        """
+        Returns (index, text) edits needed to bring the posted messages up to date.
+
+        An index equal to the number of posted messages means a new message has to be
+        sent.  While streaming, the last page gets a trailing cursor so users can tell
+        the reply is still being written.
+        """
+        self._last_update = time.monotonic()
+        pages = split_message(self.text, self.limit) if self.text else [self.placeholder]
+        if not final and self.text:
+            pages[-1] = pages[-1] + " ▌" if len(pages[-1]) + 2 <= self.limit else pages[-1]
+        edits = []
+        for index, page in enumerate(pages):
+            if index >= len(self.shown):
+                self.shown.append(page)
+                edits.append((index, page))
+            elif self.shown[index] != page:
+                self.shown[index] = page
+                edits.append((index, page))
+        return edits
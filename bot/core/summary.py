@@ -0,0 +1,157 @@
+# bot/core/summary.py
+import asyncio
+import datetime
+import threading
+
+# Summary settings used when app.json has no "summary" block (or leaves a key out).
+DEFAULT_SUMMARY_OPTIONS = {
+    "enabled": False,
+    "trigger_messages": 24,  # Unsummarized messages in a scope before older ones are folded in.
+    "keep_recent": 8,  # Newest messages always kept verbatim.
+    "max_fold": 40,  # Most messages folded into the summary by one job.
+    "prompt": (
+        "You maintain a running summary of a chat conversation. Merge the new messages into the "
+        "existing summary. Keep names, decisions, open questions and facts people shared; drop "
+        "small talk. Reply with the updated summary only, in under 80 words."
+    ),
+}
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+
+def summary_options(app_config):
+    """
+    Returns the "summary" block of app.json, filled in with defaults.
+    """
+    return {**DEFAULT_SUMMARY_OPTIONS, **app_config.get("summary", {})}
+
+
+class Summarizer:
+    """
+    Folds the older part of long conversations into a stored summary.
+
+    After each saved turn, schedule() checks whether a scope has more than
+    `trigger_messages` messages that are not covered by its summary yet.  If so, a
+    background job asks the model to merge the oldest of them (all but the last
+    `keep_recent`) into the summary, and stores the result with the sequence number
+    of the last message it covers.  ContextBuilder.build() then sends the summary
+    in place of those messages, so prompts for busy channels stay short.
+
+    Jobs never run twice at once for the same scope.  `complete` may be a blocking
+    function (the job runs in a thread) or a coroutine function (the job runs as
+    a task on the current event loop).
+
+    Args:
+        memory: Memory store or cache (needs load_summary/save_summary/page/next_seq).
+        context: ContextBuilder, used to count tokens and to keep the job's prompt in budget.
+        complete: Callable(messages) -> reply text or None, e.g. AI.complete.
+        options: Summary settings, see summary_options().
+    """
+
+    def __init__(self, memory, context, complete, options=None):
+        self.memory = memory
+        self.context = context
+        self.complete = complete
+        self.options = {**DEFAULT_SUMMARY_OPTIONS, **(options or {})}
+        self.enabled = self.options["enabled"]
+        self._running = set()  # Scopes with a job in flight.
+        self._lock = threading.Lock()
+        self._tasks = set()  # Keeps asyncio tasks referenced until they finish.
+
+    def load(self, scope):
+        """
+        Returns the scope's summary, or None (always None when summarizing is disabled).
+        """
+        if not self.enabled:
+            return None
+        return self.memory.load_summary(scope)
+
+    def schedule(self, scope):
+        """
+        Starts a background summary job for the scope if it is due and none is running.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if scope in self._running:
+                return
+            self._running.add(scope)
+        if asyncio.iscoroutinefunction(self.complete):
+            task = asyncio.get_running_loop().create_task(self._run_async(scope))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            threading.Thread(target=self._run, args=(scope,), name="summarizer", daemon=True).start()
+
+    def plan(self, scope):
+        """
+        Returns (previous summary, messages to fold) if a job is due, else None.
+        """
+        summary = self.memory.load_summary(scope)
+        through = summary["through"] if summary else -1
+        next_seq = self.memory.next_seq(scope)
+        unsummarized = next_seq - through - 1
+        if unsummarized <= self.options["trigger_messages"]:
+            return None
+        end = next_seq - self.options["keep_recent"]  # Fold everything before this sequence number...
+        start = max(through + 1, end - unsummarized)
+        limit = min(end - start, self.options["max_fold"])
+        records, _ = self.memory.page(scope, start + limit, limit)  # ...oldest first, max_fold at a time.
+        records = [r for r in records if r["seq"] > through]
+        # Stay inside the prompt budget; whatever does not fit is folded by the next job.
+        budget = self.context.prompt_tokens - self.context.count(self.options["prompt"])
+        if summary:
+            budget -= self.context.count(summary["content"])
+        folded = []
+        for record in records:
+            budget -= self.context.record_tokens(record)
+            if budget < 0 and folded:
+                break
+            folded.append(record)
+        return (summary, folded) if folded else None
+
+    def prompt(self, summary, records):
+        transcript = "\n".join(f"{r['role']}: {r['content']}" for r in records)
+        previous = summary["content"] if summary else "(none yet)"
+        return [
+            {"role": "system", "content": self.options["prompt"]},
+            {"role": "user", "content": f"Current summary:\n{previous}\n\nNew messages:\n{transcript}"},
+        ]
+
+    def commit(self, scope, records, text):
+        summary = {
+            "content": text.strip(),
+            "through": records[-1]["seq"],
+            "tokens": self.context.tokens(text.strip()),
+            "updated": datetime.datetime.now().isoformat(),
+        }
+        self.memory.save_summary(scope, summary)
+        return summary
+
+    def _run(self, scope):
+        try:
+            planned = self.plan(scope)
+            if planned:
+                summary, records = planned
+                text = self.complete(self.prompt(summary, records))
+                if text:
+                    self.commit(scope, records, text)
+        except Exception as e:
+            print(f"⚠️ Summary of {scope} failed: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(scope)
+
+    async def _run_async(self, scope):
+        try:
+            planned = await asyncio.to_thread(self.plan, scope)
+            if planned:
+                summary, records = planned
+                text = await self.complete(self.prompt(summary, records))
+                if text:
+                    await asyncio.to_thread(self.commit, scope, records, text)
+        except Exception as e:
+            print(f"⚠️ Summary of {scope} failed: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(scope)
@@ -0,0 +1,152 @@
+# bot/core/turns.py
+import asyncio
+
+from bot.core.inference import ALL_FAILED_REPLY
+from bot.core.memory import make_record
+
+
+class Turn:
+    """
+    One message being answered: its route and prompt, then its reply and outcome.
+
+    `reply` stays None until the model (or the reply cache) has answered, and is
+    still None afterwards if every endpoint failed.  `outcome` ("ok", "cached" or
+    "failed") is what zia_turns_total counts the turn as.
+    """
+
+    def __init__(self, scope, message, route):
+        self.scope = scope
+        self.message = message
+        self.route = route
+        self.messages = None
+        self.cache_key = None
+        self.reply = None
+        self.outcome = None
+
+
+class TurnPipeline:
+    """
+    Answers a message the same way on every platform.
+
+    A turn loads the scope's recent history and summary, looks up doc passages,
+    builds the prompt, answers from the reply cache or the route's endpoints,
+    saves both messages in one write, schedules the summarizer and counts the
+    outcome.  Every stage is timed under the adapter's platform label.
+
+    Adapters that only need the reply use call() or stream(); the web app runs
+    the steps itself (prepare(), complete() or generate(), finish()) to hold its
+    chat lock around them and to return the saved turn.  The runtime's table is
+    looked up on every turn, so routes follow config reloads.
+
+    Args:
+        runtime: The shared Runtime (memory, context, summarizer, replies, docs, metrics, table).
+        platform: Routing table platform and metrics label ("discord", "slack" or "web").
+    """
+
+    def __init__(self, runtime, platform):
+        self.runtime = runtime
+        self.platform = platform
+
+    def route(self, scope):
+        """
+        Returns the scope's ChannelRoute (persona, inference client, limits).
+        """
+        return self.runtime.table.route(self.platform, scope)
+
+    async def prepare(self, scope, message):
+        """
+        Returns a Turn with the prompt built and the reply cache key set (None when the cache does not apply).
+        """
+        runtime = self.runtime
+        turn = Turn(scope, message, self.route(scope))
+        with runtime.metrics.stage(self.platform, "memory_load"):
+            memory = await asyncio.to_thread(runtime.memory.load, scope, turn.route.load_limit)
+            summary = await asyncio.to_thread(runtime.summarizer.load, scope)
+        with runtime.metrics.stage(self.platform, "docs"):
+            notes = await runtime.docs.notes(turn.route.persona_name, message)
+        with runtime.metrics.stage(self.platform, "prompt_build"):
+            turn.messages = runtime.context.build(turn.route.persona, memory, message, summary, scope, notes)
+        turn.cache_key = runtime.replies.key(turn.route.persona, scope, message, memory)
+        return turn
+
+    async def complete(self, turn):
+        """
+        Answers the turn from the reply cache or the model, and returns the reply (None if every endpoint failed).
+        """
+        replies = self.runtime.replies
+        turn.reply = await asyncio.to_thread(replies.get, turn.cache_key) if turn.cache_key else None
+        if turn.reply is not None:
+            turn.outcome = "cached"
+            return turn.reply
+        with self.runtime.metrics.stage(self.platform, "generate"):
+            turn.reply = await turn.route.ai.complete(turn.messages, turn.route.max_tokens)
+        if turn.reply is None:
+            turn.outcome = "failed"
+            return None
+        turn.outcome = "ok"
+        await asyncio.to_thread(replies.put, turn.cache_key, turn.reply)
+        return turn.reply
+
+    async def generate(self, turn):
+        """
+        Like complete(), but yields the reply chunk by chunk; a cached reply comes in one piece.
+
+        Nothing is yielded if every endpoint failed; turn.reply is then None.
+        """
+        replies = self.runtime.replies
+        cached = await asyncio.to_thread(replies.get, turn.cache_key) if turn.cache_key else None
+        if cached is not None:
+            turn.reply, turn.outcome = cached, "cached"
+            yield cached
+            return
+        parts = []
+        with self.runtime.metrics.stage(self.platform, "generate"):  # The whole stream, including what the caller does with each chunk.
+            async for chunk in turn.route.ai.stream(turn.messages, turn.route.max_tokens):
+                parts.append(chunk)
+                yield chunk
+        if not parts:
+            turn.outcome = "failed"
+            return
+        turn.reply, turn.outcome = "".join(parts), "ok"
+        await asyncio.to_thread(replies.put, turn.cache_key, turn.reply)
+
+    def save(self, turn):
+        """
+        Saves the message and its reply in one write, so they stay adjacent, and returns them as stored.
+        """
+        context = self.runtime.context
+        records = [make_record(role, content, context.tokens(content)) for role, content in (("user", turn.message), ("assistant", turn.reply))]
+        with self.runtime.metrics.stage(self.platform, "memory_save"):
+            seq = self.runtime.memory.write_records(turn.scope, records)
+        return [{"seq": seq + i, "role": r["role"], "content": r["content"]} for i, r in enumerate(records)]
+
+    async def finish(self, turn):
+        """
+        Counts the turn and, if it has a reply, saves it and schedules the summarizer.  Returns the saved messages, or None.
+        """
+        self.runtime.metrics.inc("zia_turns_total", platform=self.platform, outcome=turn.outcome)
+        if turn.reply is None:
+            return None
+        saved = await asyncio.to_thread(self.save, turn)
+        self.runtime.summarizer.schedule(turn.scope)  # Fold older turns into the summary in the background if they are due.
+        return saved
+
+    async def call(self, scope, message):
+        """
+        Answers a message and returns the reply, or ALL_FAILED_REPLY if no endpoint answered.
+        """
+        turn = await self.prepare(scope, message)
+        await self.complete(turn)
+        await self.finish(turn)
+        return turn.reply if turn.reply is not None else ALL_FAILED_REPLY
+
+    async def stream(self, scope, message):
+        """
+        Answers a message chunk by chunk, saving it once the whole reply has arrived.
+        """
+        turn = await self.prepare(scope, message)
+        async for chunk in self.generate(turn):
+            yield chunk
+        if turn.reply is None:
+            yield ALL_FAILED_REPLY
+        await self.finish(turn)
@@ -0,0 +1,94 @@
+# bot/gateway/zia.py
+# Runs several platform adapters in one asyncio process, on one shared runtime:
+#   python bot/gateway/zia.py                 # the adapters listed in the "gateway" block of app.json
+#   python bot/gateway/zia.py discord web     # just these
+# An adapter is any module with an `async def serve()`; the built-in ones are the handlers in
+# bot/<platform>/zia.py, which still run standalone too.
+import os, sys, asyncio, argparse, importlib
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from bot.core.runtime import shared_runtime
+
+# Built-in adapters; "adapters" entries that aren't listed here are imported as module paths.
+ADAPTERS = {
+    "discord": "bot.Discord.zia",
+    "slack": "bot.slack.zia",
+    "web": "bot.web.zia",
+}
+
+# Gateway settings used when app.json has no "gateway" block (or leaves a key out).
+DEFAULT_GATEWAY_OPTIONS = {
+    "adapters": ["discord", "slack", "web"],
+}
+
+
+def gateway_options(app_config):
+    return {**DEFAULT_GATEWAY_OPTIONS, **app_config.get("gateway", {})}
+
+
+def load_adapters(names):
+    # Import each adapter; one that can't start (missing secrets, missing package) is skipped.
+    adapters = {}
+    for name in names:
+        try:
+            module = importlib.import_module(ADAPTERS.get(name, name))
+        except SystemExit:
+            print(f"⚠️ Adapter {name} is not configured, skipping it")
+            continue
+        except Exception as e:
+            print(f"⚠️ Adapter {name} failed to load, skipping it: {e}")
+            continue
+        if not hasattr(module, "serve"):
+            print(f"⚠️ Adapter {name} has no serve() coroutine, skipping it")
+            continue
+        adapters[name] = module
+    return adapters
+
+
+async def run(adapters, runtime):
+    await runtime.start()  # One config watcher, metrics port and profiler for every adapter in the process.
+    tasks = {asyncio.create_task(module.serve(), name=name): name for name, module in adapters.items()}
+    try:
+        # An adapter that stops (or crashes) does not take the others down.
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = None if task.cancelled() else task.exception()
+                if error:
+                    print(f"❌ Adapter {tasks[task]} stopped: {error!r}")
+                else:
+                    print(f"🛑 Adapter {tasks[task]} stopped")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await runtime.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several ZIA adapters in one process.")
+    parser.add_argument("adapters", nargs="*", help="Adapters to run (default: the gateway block of app.json).")
+    args = parser.parse_args()
+
+    # Create the shared runtime before any adapter does, and keep its shutdown here.
+    runtime = shared_runtime(ROOT_DIR)
+    runtime.hosted = True
+    names = args.adapters or gateway_options(runtime.app_config)["adapters"]
+    adapters = load_adapters(names)
+    if not adapters:
+        print("❌ No adapter could be loaded")
+        sys.exit(1)
+
+    print(f"✅ Gateway running: {', '.join(adapters)}")
+    try:
+        asyncio.run(run(adapters, runtime))
+    except KeyboardInterrupt:
+        print("🛑 Shutting down gateway...")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,29 @@
 # bot/slack/zia.py
-import os, json, sys, datetime
-import requests
-from slack_bolt import App
-from slack_bolt.adapter.socket_mode import SocketModeHandler
+import os, json, sys, asyncio
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 
 # Base and root directories for project structure.
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Directory of this file.
 ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))  # Project root.
+sys.path.insert(0, ROOT_DIR)  # Make the shared bot.core package importable.
 
-# Paths to configuration and secret files. These are used throughout the script.
-SLACK_SECRETS_PATH = os.path.join(ROOT_DIR, "secrets", "connects", "slack.json")  # Slack credentials (bot token, signing secret, app token).
-ROUTE_PATH = os.path.join(ROOT_DIR, "secrets", "config", "route.json")  # AI endpoint URLs and model.
-PERSONA_PATH = os.path.join(ROOT_DIR, "config", "persona.json")  # Persona definitions for the bot.
-MEMORY_DIR = os.path.join(ROOT_DIR, "secrets", "db")  # Directory where conversation history will be stored.
-APP_PATH = os.path.join(ROOT_DIR, "config", "app.json")  # Application configuration file (memory limits, token limits).
+from bot.core.runtime import shared_runtime
+from bot.core.turns import TurnPipeline
+from bot.core.scheduler import RecentIds
+from bot.core.streaming import ProgressiveReply, streaming_options, SLACK_MESSAGE_LIMIT
 
-# Create the memory directory if it doesn't exist. This ensures that the bot can store conversation history.
-os.makedirs(MEMORY_DIR, exist_ok=True)
+# Configs, memory store, AI client, summarizer, reply cache and scheduler, shared with the
+# other adapters when running inside the gateway (bot/gateway/zia.py).
+RUNTIME = shared_runtime(ROOT_DIR)
+app_config = RUNTIME.app_config
+STREAMING = streaming_options(app_config)  # Whether replies are edited in place while the model streams.
+SCHEDULER = RUNTIME.scheduler
+METRICS = RUNTIME.metrics
+TURNS = TurnPipeline(RUNTIME, "slack")  # Answers a channel's message, the same way as the other platforms.
 
-# Load app.json limits
-try:
-    with open(APP_PATH, "r") as f:
-        app_config = json.load(f)
-except Exception as e:
-    # If the file fails to load, print a warning and use default values. This prevents crashes.
-    print(f"⚠️ Failed to load app.json, using defaults: {e}")
-    app_config = {
-        "memory": {"log_limit": 100, "load_limit": 10},
-        "tokens": {"max_tokens": 100}
-    }
-
-# Extract configuration values from the loaded app_config.
-LOG_LIMIT = app_config["memory"]["log_limit"]  # Maximum number of messages to keep in memory per channel.
-LOAD_LIMIT = app_config["memory"]["load_limit"]  # Number of recent messages to load for context.
-MAX_TOKENS = app_config["tokens"]["max_tokens"]  # Maximum tokens allowed in AI responses.
+# Path to the Slack credentials (bot token, signing secret, app token).
+SLACK_SECRETS_PATH = os.path.join(RUNTIME.root_dir, "secrets", "connects", "slack.json")
 
 # Load Slack secrets
 try:
@@ -52,124 +42,102 @@ if not SLACK_BOT_TOKEN or not SLACK_SIGNING_SECRET or not SLACK_APP_TOKEN:
     print("❌ Missing Slack tokens or signing secret in slack.json")
     sys.exit(1)
 
-# Initialize the Slack app using Bolt. It will handle events and commands.
-app = App(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
-
-# Load route config
-try:
-    with open(ROUTE_PATH, "r") as f:
-        route_config = json.load(f)
-except Exception as e:
-    print(f"❌ Failed to load route config: {e}")
-    sys.exit(1)
-
-ENDPOINTS = route_config.get("endpoints", [])  # List of AI endpoint URLs.
-MODEL = route_config.get("model", "qwen3-v1-4b")  # Name of the AI model.
-
-# Validate that at least one endpoint is configured.
-if not ENDPOINTS:
-    print("❌ No endpoints configured in route.json")
-    sys.exit(1)
-
-# Load personas
-try:
-    with open(PERSONA_PATH, "r") as f:
-        persona_config = json.load(f)
-except Exception as e:
-    # If the file fails to load, use a built‑in default persona.
-    print(f"⚠️ Persona config not found or invalid, using built-in default: {e}")
-    persona_config = {
-        "default": {
-            "role": "system",
-            "content": "You are ZIA, a friendly indie dev lounge AI. Keep replies short and casual."
-        }
-    }
-
-def load_memory(channel_id):
-    # Build path to memory file for this channel.
-    path = os.path.join(MEMORY_DIR, f"{channel_id}.json")
-    if not os.path.exists(path):
-        return []  # Return an empty list if the file does not exist.
-    with open(path, "r") as f:
-        history = json.load(f)
-    return history[-LOAD_LIMIT:]  # Return the last LOAD_LIMIT messages.
-
-def save_memory(channel_id, role, content):
-    # Build path to memory file for this channel.
-    path = os.path.join(MEMORY_DIR, f"{channel_id}.json")
-    history = []
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            history = json.load(f)
-    # Append the new message to the history.
-    history.append({
-        "role": role,
-        "content": content,
-        "timestamp": datetime.datetime.now().isoformat()
-    })
-    # Keep only the last LOG_LIMIT messages.
-    history = history[-LOG_LIMIT:]
-    with open(path, "w") as f:
-        json.dump(history, f, indent=2)
-
-def get_persona_for_channel(channel_id: str):
-    # Channel‑specific personas are defined in slack.json with keys like SLACK_PERSONA_<channel>.
-    persona_name = slack_secrets.get(f"SLACK_PERSONA_{channel_id}", "default")
-    return persona_config.get(persona_name, persona_config["default"])
-
-def call_ai(message_content, channel_id):
-    # Retrieve the persona for this channel.
-    persona = get_persona_for_channel(channel_id)
-    # Load conversation history from memory.
-    memory = load_memory(channel_id)
-    # Construct the message list to send to the AI endpoint.
-    messages = [persona] + memory + [{"role": "user", "content": message_content}]
-
-    for endpoint in ENDPOINTS:
-        try:
-            # First attempt with model
-            payload = {
-                "model": MODEL,
-                "messages": messages,
-                "max_tokens": MAX_TOKENS
-            }
-            response = requests.post(endpoint, json=payload, timeout=10)
-
-            # Retry without model if failed
-            if response.status_code != 200:
-                print(f"⚠️ Endpoint {endpoint} returned {response.status_code}, retrying without model...")
-                payload.pop("model", None)
-                response = requests.post(endpoint, json=payload, timeout=10)
-
-            if response.status_code == 200:
-                reply = response.json()["choices"][0]["message"]["content"]
-
-                # Persist the conversation to memory.
-                save_memory(channel_id, "user", message_content)
-                save_memory(channel_id, "assistant", reply)
-                return reply
-            else:
-                print(f"⚠️ Endpoint {endpoint} still failed with {response.status_code}")
-                continue
-
-        except Exception as e:
-            print(f"⚠️ Failed on {endpoint}: {e}")
-            continue
-
-    return "⚠️ All endpoints failed, please try again later."
+# Initialize the Slack app using Bolt's asyncio flavour, so it can share an event loop with the other adapters.
+# Events are acknowledged before the listener runs (process_before_response off), and the listener only queues.
+app = AsyncApp(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET, process_before_response=False)
+
+# Event and message IDs seen recently: Slack redelivers an event when its ack looks late, and a redelivery
+# must not cost a second model call or a second copy of the turn in memory.
+SEEN = RecentIds(SCHEDULER.options["dedupe_ttl"], SCHEDULER.options["dedupe_max"])
+
+# Message subtypes that carry a new message from a person; edits, deletions, joins and the like are skipped.
+USER_SUBTYPES = {None, "file_share", "thread_broadcast"}
+
+async def call_ai(message_content, channel_id):
+    # Memory, docs, prompt, reply cache, model call, save, summary and metrics: the same pipeline as every platform.
+    return await TURNS.call(channel_id, message_content)
+
+async def stream_ai(message_content, channel_id):
+    # Same as call_ai, but yields the reply chunk by chunk as the model generates it, and saves it once it has arrived.
+    async for chunk in TURNS.stream(channel_id, message_content):
+        yield chunk
+
+async def send_streamed_reply(client, channel_id, say, chunks):
+    # Post a placeholder, then edit it with the accumulated reply.  Edits are coalesced to one per
+    # edit_interval seconds to stay under chat.update rate limits; long replies continue in new messages.
+    progress = ProgressiveReply(SLACK_MESSAGE_LIMIT, STREAMING["edit_interval"]["slack"], STREAMING["placeholder"])
+    sent = [(await say(STREAMING["placeholder"]))["ts"]]
+
+    async def apply(updates):
+        with METRICS.stage("slack", "send"):
+            for index, text in updates:
+                if index < len(sent):
+                    await client.chat_update(channel=channel_id, ts=sent[index], text=text)
+                else:
+                    sent.append((await say(text))["ts"])
+
+    async for chunk in chunks:
+        if progress.feed(chunk):
+            await apply(progress.updates())
+    await apply(progress.updates(final=True))
+
+async def reply_to(channel_id, turn):
+    # Answer the messages queued for a channel in one turn; several arrive together when they were coalesced.
+    user_message = "\n".join(text for text, _, _ in turn)
+    _, say, client = turn[-1]
+
+    if STREAMING["enabled"]:
+        await send_streamed_reply(client, channel_id, say, stream_ai(user_message, channel_id))
+        return
+    reply = await call_ai(user_message, channel_id)
+    with METRICS.stage("slack", "send"):
+        await say(reply)
+
+def skip_reason(message, body, bot_user_id):
+    # Why a message should not be answered, or None.  Checked before anything expensive happens.
+    if message.get("bot_id") or message.get("user") == bot_user_id:
+        return "bot"  # Other bots, and our own replies.
+    if message.get("subtype") not in USER_SUBTYPES:
+        return "subtype"
+    if not message.get("text", "").strip():
+        return "empty"
+    if not SEEN.add(body.get("event_id"), message.get("client_msg_id")):
+        return "duplicate"
+    return None
 
 # Slack message handler
 @app.message(".*")
-def handle_message(message, say):
+async def handle_message(message, body, context, say, client):
     # Handle any incoming text message in channels the bot is present in.
     channel_id = message["channel"]
     user_message = message.get("text", "")
-
-    reply = call_ai(user_message, channel_id)
-    say(reply)
+    reason = skip_reason(message, body, context.get("bot_user_id"))
+    if reason:
+        METRICS.inc("zia_events_skipped_total", platform="slack", reason=reason)
+        return
+
+    # Queue the message and return right away; the scheduler answers it (one turn at a time per channel,
+    # max_active channels at once, busy reply when full).
+    if not SCHEDULER.submit(channel_id, (user_message, say, client), reply_to):
+        busy = SCHEDULER.busy_reply(channel_id)
+        if busy:
+            await say(busy)
+
+async def serve():
+    # Connect over Socket Mode (no public HTTP endpoint needed) and run until cancelled.
+    handler = AsyncSocketModeHandler(app, SLACK_APP_TOKEN)
+    try:
+        if not RUNTIME.hosted:
+            await RUNTIME.start()  # Config hot reload, metrics port and profiler (the gateway starts its own).
+        await handler.start_async()
+    finally:
+        await handler.close_async()
+        if not RUNTIME.hosted:
+            await RUNTIME.aclose()  # Flush cached messages and close the AI client (the gateway does this itself).
 
 if __name__ == "__main__":
-    # Start the Slack bot using Socket Mode. This allows it to run without exposing a public HTTP endpoint.
     print("✅ Slack bot is running in Socket Mode...")
-    handler = SocketModeHandler(app, SLACK_APP_TOKEN)
-    handler.start()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("🛑 Shutting down Slack bot...")
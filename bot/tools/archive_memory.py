@@ -0,0 +1,79 @@
+# bot/tools/archive_memory.py
+# Moves the history of idle channels and chats into the compressed archive (the "archive"
+# block of config/app.json) and reports how much disk it saves.
+#
+#   python bot/tools/archive_memory.py                  # archive scopes idle for archive.idle_days
+#   python bot/tools/archive_memory.py --idle-days 7
+#   python bot/tools/archive_memory.py --report         # only print the report
+#
+# With archive.enabled the bots run the same pass every archive.interval seconds; an
+# archived scope is restored by whichever bot gets its next message.
+import os, sys, json, argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from bot.core.archive import Archive, archive_options
+from bot.core.storage import open_memory_store
+
+APP_PATH = os.path.join(ROOT_DIR, "config", "app.json")
+
+
+def kilobytes(size):
+    return f"{size / 1024:,.1f} KB"
+
+
+def live_usage(db_dir):
+    # (files, bytes) directly in the memory directory, i.e. what the archive has not taken.
+    files = size = 0
+    with os.scandir(db_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                files += 1
+                size += entry.stat().st_size
+    return files, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive idle conversation history and report the savings.")
+    parser.add_argument("--db-dir", default=os.path.join(ROOT_DIR, "secrets", "db"))
+    parser.add_argument("--idle-days", type=float, default=None, help="Archive scopes quiet for this long (default: archive.idle_days).")
+    parser.add_argument("--report", action="store_true", help="Print the report without archiving anything.")
+    args = parser.parse_args()
+
+    with open(APP_PATH, "r") as f:
+        app_config = json.load(f)
+    # The tool works whether or not the bots have the archive turned on.
+    options = archive_options(app_config)
+    idle_days = options["idle_days"] if args.idle_days is None else args.idle_days
+    archive = Archive(os.path.join(args.db_dir, options["path"]), options["compression"], options["repack_ratio"])
+    memory = app_config.get("memory", {})
+    store = open_memory_store(
+        app_config.get("storage", {}),
+        args.db_dir,
+        memory.get("log_limit", 100),
+        memory.get("load_limit", 10),
+        memory.get("compact_every"),
+        shared=True,  # The bots may be running.
+        archive=archive,
+    )
+
+    if not args.report:
+        report = store.archive_idle(idle_days * 86400, options["batch"])
+        print(f"📦 Archived {report['scopes']} scope(s) idle for {idle_days:g} day(s): "
+              f"{kilobytes(report['before'])} -> {kilobytes(report['after'])}")
+    store.close()
+
+    stats = archive.stats()
+    files, size = live_usage(args.db_dir)
+    saved = stats["original_bytes"] - stats["stored_bytes"]
+    ratio = 100 * saved / stats["original_bytes"] if stats["original_bytes"] else 0
+    print(f"📁 Live: {files} files, {kilobytes(size)} in {args.db_dir}")
+    print(f"📦 Archive: {stats['scopes']} scopes, {stats['messages']} messages in {stats['segments']} segments")
+    print(f"   {kilobytes(stats['original_bytes'])} before, {kilobytes(stats['stored_bytes'])} stored "
+          f"({kilobytes(stats['dead_bytes'])} of it restored since), {kilobytes(saved)} saved ({ratio:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+# bot/tools/benchmark.py
+# Load test for the reply path, against the local mock model server (bot/tools/mock_server.py).
+#   python bot/tools/benchmark.py --messages 500 --concurrency 16 --latency 0.3
+#   python bot/tools/benchmark.py --stream --failure-rate 0.1 --baseline benchmark.json
+# Drives a handler's call_ai (or stream_ai) and the web app's /chat/{chat_id} (or /stream) at
+# the given concurrency, on a scratch copy of config/ with its own secrets/db, and writes
+# throughput, latency percentiles and memory store I/O per message as JSON.
+import os, sys, json, time, shutil, asyncio, argparse, tempfile, threading, importlib, subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))
+sys.path.insert(0, ROOT_DIR)
+
+import aiohttp
+from bot.core.runtime import shared_runtime
+from bot.core.inference import ALL_FAILED_REPLY
+from bot.gateway.zia import ADAPTERS
+from bot.tools.mock_server import MockModelServer, add_mock_arguments, mock_options
+
+MOCK_MODEL = "mock"
+
+
+class StoreMeter:
+    """
+    Counts the calls a memory store gets, and the time spent in them.
+
+    Wraps the store behind the memory cache (if any), so cache hits are not
+    counted: what is left is the real disk I/O.  Calls a store makes to its own
+    methods are counted once, as the outer call.
+    """
+
+    READS = ("load", "page", "next_seq", "load_summary")
+    WRITES = ("append", "extend", "write_records", "write_many", "save_summary", "compact")
+
+    def __init__(self, memory):
+        self.store = getattr(memory, "store", memory)
+        self.calls = {}
+        self.seconds = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        for name in self.READS + self.WRITES:
+            if hasattr(self.store, name):
+                setattr(self.store, name, self._wrap(name, getattr(self.store, name)))
+
+    def _wrap(self, name, method):
+        def counted(*args, **kwargs):
+            depth = getattr(self._local, "depth", 0)
+            self._local.depth = depth + 1
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._local.depth = depth
+                if depth == 0:
+                    with self._lock:
+                        self.calls[name] = self.calls.get(name, 0) + 1
+                        self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+        return counted
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.calls), dict(self.seconds)
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of an unsorted list.
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))]
+
+
+def latency_summary(seconds):
+    ms = [s * 1000 for s in seconds]
+    if not ms:
+        return None
+    return {
+        "p50": round(percentile(ms, 50), 2),
+        "p95": round(percentile(ms, 95), 2),
+        "p99": round(percentile(ms, 99), 2),
+        "mean": round(sum(ms) / len(ms), 2),
+        "max": round(max(ms), 2),
+    }
+
+
+def dir_size(path):
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass
+    return total
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_home(home, mock_url, schema, web_port, app_config_path=None):
+    # A scratch project root: the repo's config/ plus secrets pointing at the mock server.
+    shutil.copytree(os.path.join(ROOT_DIR, "config"), os.path.join(home, "config"))
+    if app_config_path:
+        shutil.copyfile(app_config_path, os.path.join(home, "config", "app.json"))
+    endpoint = f"{mock_url}/api/chat" if schema == "ollama" else f"{mock_url}/v1/chat/completions"
+    secrets = {
+        ("config", "route.json"): {"endpoints": [endpoint], "model": MOCK_MODEL},
+        ("config", "web.json"): {"host": "localhost", "port": web_port, "workers": 1},
+        ("connects", "discord.json"): {"DT_01": "benchmark", "DC_ID_BENCH": "1"},
+        ("connects", "slack.json"): {
+            "SLACK_BOT_TOKEN": "xoxb-benchmark",
+            "SLACK_SIGNING_SECRET": "benchmark",
+            "SLACK_APP_TOKEN": "xapp-benchmark",
+        },
+    }
+    for (folder, name), data in secrets.items():
+        os.makedirs(os.path.join(home, "secrets", folder), exist_ok=True)
+        with open(os.path.join(home, "secrets", folder, name), "w") as f:
+            json.dump(data, f)
+
+
+async def run_load(count, concurrency, channels, send):
+    # Send `count` messages from `concurrency` workers; each channel sees one message at a time,
+    # like the scheduler guarantees, so memory is exercised the way the bots use it.
+    locks = [asyncio.Lock() for _ in range(channels)]
+    queue = asyncio.Queue()
+    for i in range(count):
+        queue.put_nowait(i)
+    latencies, first_chunks, errors = [], [], []
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            channel = i % channels
+            async with locks[channel]:
+                started = time.perf_counter()
+                try:
+                    ok, first = await send(channel, f"benchmark message {i}: how is the build going?", started)
+                    error = None if ok else "no reply"
+                except Exception as e:
+                    first, error = None, repr(e)
+                latencies.append(time.perf_counter() - started)
+                if first is not None:
+                    first_chunks.append(first)
+                if error:
+                    errors.append(error)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies, first_chunks, errors
+
+
+async def measure(name, args, runtime, meter, mock, send):
+    calls_before, seconds_before = meter.snapshot()
+    disk_before = dir_size(runtime.memory_dir)
+    requests_before = mock.stats["requests"]
+
+    duration, latencies, first_chunks, errors = await run_load(args.messages, args.concurrency, args.channels, send)
+
+    if hasattr(runtime.memory, "flush"):
+        await asyncio.to_thread(runtime.memory.flush)  # Count write-behind batches against this run.
+    calls_after, seconds_after = meter.snapshot()
+    per_message = lambda value: round(value / args.messages, 4)
+    calls = {k: per_message(v - calls_before.get(k, 0)) for k, v in calls_after.items() if v - calls_before.get(k, 0)}
+    store_seconds = sum(seconds_after.values()) - sum(seconds_before.values())
+    result = {
+        "messages": args.messages,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "duration_s": round(duration, 3),
+        "throughput_msgs_per_s": round(args.messages / duration, 2) if duration else None,
+        "latency_ms": latency_summary(latencies),
+        "first_chunk_ms": latency_summary(first_chunks),
+        "model_requests_per_message": per_message(mock.stats["requests"] - requests_before),
+        "store": {
+            "calls_per_message": calls,
+            "reads_per_message": per_message(sum(calls_after.get(k, 0) - calls_before.get(k, 0) for k in StoreMeter.READS)),
+            "writes_per_message": per_message(sum(calls_after.get(k, 0) - calls_before.get(k, 0) for k in StoreMeter.WRITES)),
+            "ms_per_message": round(store_seconds * 1000 / args.messages, 4),
+            "disk_bytes_per_message": per_message(dir_size(runtime.memory_dir) - disk_before),
+        },
+    }
+    print(f"✅ {name}: {result['throughput_msgs_per_s']} msg/s, latency {result['latency_ms']}, {len(errors)} errors")
+    return result
+
+
+async def bench_call_ai(args, runtime, meter, mock):
+    module = importlib.import_module(ADAPTERS[args.adapter])
+
+    async def send(channel, text, started):
+        scope = f"bench-{args.adapter}-{channel}"
+        if not args.stream:
+            reply = await module.call_ai(text, scope)
+            return reply != ALL_FAILED_REPLY, None
+        first, parts = None, []
+        async for chunk in module.stream_ai(text, scope):
+            if first is None:
+                first = time.perf_counter() - started
+            parts.append(chunk)
+        ok = "".join(parts) != ALL_FAILED_REPLY
+        return ok, first if ok else None  # The failure notice is not a first token.
+
+    return await measure(f"{args.adapter} {'stream_ai' if args.stream else 'call_ai'}", args, runtime, meter, mock, send)
+
+
+async def bench_web(args, runtime, meter, mock):
+    import uvicorn
+    module = importlib.import_module(ADAPTERS["web"])
+    server = uvicorn.Server(uvicorn.Config(module.app, host="127.0.0.1", port=module.PORT, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()  # Raises why the server could not start.
+        await asyncio.sleep(0.05)
+
+    base = f"http://127.0.0.1:{module.PORT}"
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            form = {"username": "benchmark", "password": "benchmark"}
+            async with session.post(f"{base}/register", data=form):
+                pass
+            async with session.post(f"{base}/login", data=form) as response:
+                token = (await response.json())["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            async def send(chat_id, text, started):
+                if not args.stream:
+                    async with session.post(f"{base}/chat/{chat_id}", json={"message": text}, headers=headers) as response:
+                        data = await response.json()
+                        return response.status == 200 and data.get("reply") != ALL_FAILED_REPLY, None
+                first, reply = None, None
+                async with session.post(f"{base}/chat/{chat_id}/stream", json={"message": text}, headers=headers) as response:
+                    async for line in response.content:
+                        if line.startswith(b"data:") and first is None:
+                            first = time.perf_counter() - started
+                        if line.startswith(b"data:") and b'"reply"' in line:
+                            reply = json.loads(line[5:])["reply"]
+                ok = response.status == 200 and reply not in (None, ALL_FAILED_REPLY)
+                return ok, first if ok else None
+
+            return await measure(f"web /chat{'/stream' if args.stream else ''}", args, runtime, meter, mock, send)
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline):
+    # One line per metric that both runs have, e.g. "web p95: 412.0 -> 398.5 ms (-3.3%)".
+    if baseline.get("settings") != results["settings"]:
+        print("⚠️ The baseline ran with different settings; the numbers may not be comparable")
+    for target, current in results["targets"].items():
+        previous = baseline.get("targets", {}).get(target)
+        if not previous:
+            continue
+        rows = [("throughput", "throughput_msgs_per_s", None, "msg/s")]
+        rows += [(q, "latency_ms", q, "ms") for q in ("p50", "p95", "p99")]
+        for label, key, sub, unit in rows:
+            old, new = previous.get(key), current.get(key)
+            if sub:
+                old, new = (old or {}).get(sub), (new or {}).get(sub)
+            if old and new is not None:
+                print(f"   {target} {label}: {old} -> {new} {unit} ({(new - old) / old:+.1%})")
+
+
+async def run(args):
+    home = tempfile.mkdtemp(prefix="zia-bench-")
+    mock = MockModelServer(mock_options(args))
+    mock_url = await mock.start()
+    prepare_home(home, mock_url, args.schema, free_port(), args.app_config)
+
+    # The handlers pick this runtime (and the scratch secrets) up when they are imported.
+    runtime = shared_runtime(home)
+    runtime.hosted = True
+    await runtime.start()  # Profiles the run when --app-config enables metrics.profile (see --keep).
+    meter = StoreMeter(runtime.memory)
+    results = {
+        "revision": git_revision(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {
+            "messages": args.messages,
+            "concurrency": args.concurrency,
+            "channels": args.channels,
+            "stream": args.stream,
+            "schema": args.schema,
+            "adapter": args.adapter,
+            "mock": mock_options(args),
+            "storage": runtime.app_config.get("storage", {}).get("backend", "jsonl"),
+        },
+        "targets": {},
+    }
+    try:
+        if args.target in ("call_ai", "all"):
+            results["targets"]["call_ai"] = await bench_call_ai(args, runtime, meter, mock)
+        if args.target in ("web", "all"):
+            results["targets"]["web"] = await bench_web(args, runtime, meter, mock)
+        results["mock"] = dict(mock.stats)
+    finally:
+        await runtime.aclose()
+        await mock.stop()
+        if args.keep:
+            print(f"📁 Scratch directory kept: {home}")
+        else:
+            shutil.rmtree(home, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reply path against a local mock model server.")
+    parser.add_argument("--target", choices=("call_ai", "web", "all"), default="all", help="What to drive.")
+    parser.add_argument("--adapter", choices=("discord", "slack"), default="discord", help="Handler whose call_ai is driven.")
+    parser.add_argument("--messages", type=int, default=200, help="Messages per target.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Messages in flight at once.")
+    parser.add_argument("--channels", type=int, default=None, help="Distinct channels/chats (default: --concurrency).")
+    parser.add_argument("--stream", action="store_true", help="Drive stream_ai and /chat/{id}/stream instead.")
+    parser.add_argument("--schema", choices=("openai", "ollama"), default="openai", help="API the mock endpoint speaks.")
+    parser.add_argument("--app-config", default=None, help="app.json to benchmark with (default: config/app.json).")
+    parser.add_argument("--output", default="benchmark.json", help="Where to write the JSON results.")
+    parser.add_argument("--baseline", default=None, help="Earlier results to compare against.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory (configs, secrets/db).")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    args.channels = args.channels or args.concurrency
+
+    results = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
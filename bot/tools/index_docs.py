@@ -0,0 +1,59 @@
+# bot/tools/index_docs.py
+# Builds or updates the offline docs index (the "docs" block of config/app.json) and
+# tries queries against it.
+#
+#   python bot/tools/index_docs.py                      # index new and changed files
+#   python bot/tools/index_docs.py --rebuild            # re-index everything
+#   python bot/tools/index_docs.py --query "how do I deploy" [--persona professional]
+#
+# The bots refresh the index in the background when they start, so running this is
+# optional; it is handy for a large first import or to check what a question retrieves.
+import os, sys, json, time, argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from bot.core.context import build_context
+from bot.core.docs import KnowledgeBase, docs_options
+
+APP_PATH = os.path.join(ROOT_DIR, "config", "app.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the offline docs folder and query the index.")
+    parser.add_argument("--docs-dir", default=None, help="Docs folder (default: docs.path in app.json).")
+    parser.add_argument("--db-dir", default=os.path.join(ROOT_DIR, "secrets", "db"))
+    parser.add_argument("--rebuild", action="store_true", help="Drop the index and re-index every file.")
+    parser.add_argument("--query", default=None, help="Print the passages retrieved for this text.")
+    parser.add_argument("--persona", default="default", help="Persona whose top_k and collections apply to --query.")
+    parser.add_argument("--no-refresh", action="store_true", help="Query the index as it is.")
+    args = parser.parse_args()
+
+    with open(APP_PATH, "r") as f:
+        app_config = json.load(f)
+    # The tool works whether or not the bots have docs turned on.
+    options = {**docs_options(app_config), "enabled": True}
+    docs_dir = args.docs_dir or os.path.join(ROOT_DIR, options["path"])
+    os.makedirs(args.db_dir, exist_ok=True)
+    docs = KnowledgeBase(docs_dir, os.path.join(args.db_dir, options["index"]), options, build_context(app_config).count)
+
+    if not args.no_refresh:
+        stats = docs.refresh(rebuild=args.rebuild)
+        print(f"✅ {stats['files']} files: {stats['indexed']} indexed, {stats['unchanged']} unchanged, "
+              f"{stats['removed']} removed, {stats['chunks']} passages written in {stats['seconds']}s")
+    print(f"📚 Index holds {docs.chunks} passages from {docs.files} files ({docs.path})")
+
+    if args.query:
+        top_k, collections = docs.persona_settings(args.persona)
+        started = time.perf_counter()
+        passages = docs.search(args.query, top_k or options["top_k"], collections)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"🔍 {len(passages)} passages in {elapsed:.1f} ms (budget {options['budget_ms']} ms)")
+        for passage in passages:
+            print(f"\n[{passage['score']:.4g}] {passage['title']} ({passage['path']})\n{passage['text']}")
+    docs.close()
+
+
+if __name__ == "__main__":
+    main()
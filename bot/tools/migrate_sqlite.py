@@ -0,0 +1,72 @@
+# bot/tools/migrate_sqlite.py
+# Imports the file-based memory (<scope>.jsonl logs and older <scope>.json files) and
+# users.json from secrets/db into the SQLite database in one go.
+#
+#   python bot/tools/migrate_sqlite.py [--db-dir secrets/db]
+#
+# Handlers also import a scope lazily the first time they use it, so running this is
+# optional; it just avoids the one-off cost on the first message of every channel.
+# Imported files are renamed to *.migrated, so the tool is safe to run twice.
+import os, sys, json, argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from bot.core.memory import MemoryStore
+from bot.core.storage import SQLiteMemoryStore, SQLiteUserStore, import_scope, storage_options
+
+APP_PATH = os.path.join(ROOT_DIR, "config", "app.json")
+
+
+def find_scopes(db_dir):
+    # Every .jsonl log is a scope; .json files are only scopes if they hold a message list.
+    scopes = set()
+    for name in sorted(os.listdir(db_dir)):
+        path = os.path.join(db_dir, name)
+        if name.endswith(".jsonl"):
+            scopes.add(name[:-len(".jsonl")])
+        elif name.endswith(".json"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    if isinstance(json.load(f), list):
+                        scopes.add(name[:-len(".json")])
+            except Exception as e:
+                print(f"⚠️ Skipping unreadable {name}: {e}")
+    return sorted(scopes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import file-based memory and users into SQLite.")
+    parser.add_argument("--db-dir", default=os.path.join(ROOT_DIR, "secrets", "db"))
+    args = parser.parse_args()
+
+    with open(APP_PATH, "r") as f:
+        app_config = json.load(f)
+    memory_config = app_config.get("memory", {})
+    options = storage_options(app_config)
+    log_limit = memory_config.get("log_limit", 100)
+    compact_every = memory_config.get("compact_every")
+    db_path = os.path.join(args.db_dir, options["sqlite_path"])
+
+    source = MemoryStore(args.db_dir, log_limit, compact_every=compact_every)
+    target = SQLiteMemoryStore(db_path, log_limit, compact_every=compact_every, busy_timeout=options["busy_timeout"])
+    total = 0
+    scopes = find_scopes(args.db_dir)
+    for scope in scopes:
+        count = import_scope(target, source, scope)
+        total += count
+        print(f"✅ {scope}: {count} messages")
+    target.close()
+
+    users_path = os.path.join(args.db_dir, "users.json")
+    users = SQLiteUserStore(db_path, import_path=users_path, busy_timeout=options["busy_timeout"])
+    users.close()
+
+    print(f"✅ Imported {total} messages from {len(scopes)} scopes into {db_path}")
+    if options["backend"] != "sqlite":
+        print('⚠️ app.json still selects the "jsonl" backend; set storage.backend to "sqlite" to use the database.')
+
+
+if __name__ == "__main__":
+    main()
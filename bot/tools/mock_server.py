@@ -0,0 +1,173 @@
+# bot/tools/mock_server.py
+# Local stand-in for a model server, for benchmarks and offline testing.  Serves both
+# OpenAI-compatible /v1/chat/completions and Ollama /api/chat, with or without streaming:
+#   python bot/tools/mock_server.py --port 8900 --latency 0.3 --failure-rate 0.05
+# then point route.json at http://127.0.0.1:8900/v1/chat/completions (or /api/chat).
+import os, sys, json, random, asyncio, argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from aiohttp import web
+
+# Mock server settings (all overridable on the command line).
+DEFAULT_MOCK_OPTIONS = {
+    "latency": 0.2,  # Seconds before the reply (or its first chunk) is sent.
+    "jitter": 0.05,  # Random extra latency, up to this many seconds.
+    "reply_words": 40,  # Length of each reply.
+    "chunk_interval": 0.01,  # Seconds between streamed chunks (one word each).
+    "failure_rate": 0.0,  # Share of requests answered with HTTP 500.
+    "timeout_rate": 0.0,  # Share of requests that never answer (to exercise client timeouts).
+    "seed": None,  # Random seed, for repeatable failure injection.
+}
+
+FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+class MockModelServer:
+    """
+    An aiohttp app that answers chat requests like a model server would.
+
+    Every reply starts with "echo: <last user message>" and is padded to
+    `reply_words` words, so replies have a realistic, fixed size.  Requests can be
+    made slow (`latency`, `jitter`), fail (`failure_rate`) or hang
+    (`timeout_rate`).  Counters in `stats` let a benchmark check how many model
+    calls its messages really cost.
+
+    Args:
+        options: Mock settings, see DEFAULT_MOCK_OPTIONS.
+        host: Interface to listen on.
+        port: Port to listen on (0 picks a free one; see `url` after start()).
+    """
+
+    def __init__(self, options=None, host="127.0.0.1", port=0):
+        self.options = {**DEFAULT_MOCK_OPTIONS, **(options or {})}
+        self.host = host
+        self.port = port
+        self.url = None
+        self.stats = {"requests": 0, "streamed": 0, "failed": 0, "timed_out": 0}
+        self._random = random.Random(self.options["seed"])
+        self._runner = None
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self.openai)
+        self.app.router.add_post("/api/chat", self.ollama)
+        # Model lists, which the endpoint router probes to see whether a server is back.
+        self.app.router.add_get("/v1/models", self.models)
+        self.app.router.add_get("/api/tags", self.models)
+
+    async def start(self):
+        # A short shutdown timeout, so requests stuck in timeout_rate don't hold up stop().
+        self._runner = web.AppRunner(self.app, access_log=None, shutdown_timeout=1.0)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        self.url = f"http://{self.host}:{self.port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def reply_words(self, body):
+        messages = body.get("messages") or [{}]
+        words = f"echo: {messages[-1].get('content', '')}".split()
+        while len(words) < self.options["reply_words"]:
+            words.append(FILLER[len(words) % len(FILLER)])
+        return words
+
+    async def _begin(self):
+        # Shared by both APIs: count, wait, and maybe fail.  Returns an error response or None.
+        self.stats["requests"] += 1
+        roll = self._random.random()
+        await asyncio.sleep(self.options["latency"] + self._random.random() * self.options["jitter"])
+        if roll < self.options["timeout_rate"]:
+            self.stats["timed_out"] += 1
+            await asyncio.sleep(3600)
+        if roll < self.options["timeout_rate"] + self.options["failure_rate"]:
+            self.stats["failed"] += 1
+            return web.json_response({"error": "injected failure"}, status=500)
+        return None
+
+    async def models(self, request):
+        return web.json_response({"object": "list", "data": [{"id": "mock", "object": "model"}], "models": [{"name": "mock"}]})
+
+    async def openai(self, request):
+        body = await request.json()
+        error = await self._begin()
+        if error is not None:
+            return error
+        words = self.reply_words(body)
+        if not body.get("stream"):
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": " ".join(words)}}]})
+        response = await self._stream_start(request, "text/event-stream")
+        for i, word in enumerate(words):
+            chunk = {"choices": [{"delta": {"content": word if i == 0 else f" {word}"}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(self.options["chunk_interval"])
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def ollama(self, request):
+        body = await request.json()
+        error = await self._begin()
+        if error is not None:
+            return error
+        words = self.reply_words(body)
+        if body.get("stream") is False:
+            return web.json_response({"message": {"role": "assistant", "content": " ".join(words)}, "done": True})
+        response = await self._stream_start(request, "application/x-ndjson")
+        for i, word in enumerate(words):
+            chunk = {"message": {"role": "assistant", "content": word if i == 0 else f" {word}"}, "done": False}
+            await response.write((json.dumps(chunk) + "\n").encode())
+            await asyncio.sleep(self.options["chunk_interval"])
+        await response.write((json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}) + "\n").encode())
+        return response
+
+    async def _stream_start(self, request, content_type):
+        self.stats["streamed"] += 1
+        response = web.StreamResponse(headers={"Content-Type": content_type})
+        await response.prepare(request)
+        return response
+
+
+def add_mock_arguments(parser):
+    # Command-line flags for every DEFAULT_MOCK_OPTIONS key (shared with the benchmark).
+    parser.add_argument("--latency", type=float, default=DEFAULT_MOCK_OPTIONS["latency"], help="Seconds before each reply.")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_MOCK_OPTIONS["jitter"], help="Random extra latency, in seconds.")
+    parser.add_argument("--reply-words", type=int, default=DEFAULT_MOCK_OPTIONS["reply_words"], help="Words per reply.")
+    parser.add_argument("--chunk-interval", type=float, default=DEFAULT_MOCK_OPTIONS["chunk_interval"], help="Seconds between streamed words.")
+    parser.add_argument("--failure-rate", type=float, default=DEFAULT_MOCK_OPTIONS["failure_rate"], help="Share of requests that fail with HTTP 500.")
+    parser.add_argument("--timeout-rate", type=float, default=DEFAULT_MOCK_OPTIONS["timeout_rate"], help="Share of requests that never answer.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable runs.")
+
+
+def mock_options(args):
+    return {key: getattr(args, key) for key in DEFAULT_MOCK_OPTIONS}
+
+
+async def serve(options, host, port):
+    server = MockModelServer(options, host, port)
+    url = await server.start()
+    print(f"✅ Mock model server on {url}/v1/chat/completions and {url}/api/chat")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock model server (OpenAI-compatible and Ollama APIs).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(mock_options(args), args.host, args.port))
+    except KeyboardInterrupt:
+        print("🛑 Mock model server stopped")
+
+
+if __name__ == "__main__":
+    main()
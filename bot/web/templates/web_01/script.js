@@ -1,5 +1,7 @@
 let token = null;
 let chatId = 1; // simple default chat session
+let historyCursor = null; // "before" cursor for the next older page of history
+let historyLoading = false;
 
 // --- Utility function to set up listeners for the chat input ---
 function setupChatListeners() {
@@ -70,6 +72,8 @@ function login() {
             
             // --- Crucial: Call the chat setup function after successful login ---
             setupChatListeners();
+            setupHistoryListeners();
+            loadHistory();
             
         } else {
             alert("Login failed");
@@ -77,6 +81,92 @@ function login() {
     });
 }
 
+// --- Utility function to read a Server-Sent Events stream from a fetch response ---
+function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    function pump() {
+        return reader.read().then(({ value, done }) => {
+            if (done) return;
+            buffer += decoder.decode(value, { stream: true });
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = "message";
+                let data = "";
+                raw.split("\n").forEach(line => {
+                    if (line.startsWith("event:")) event = line.slice(6).trim();
+                    else if (line.startsWith("data:")) data += line.slice(5).trim();
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
+            return pump();
+        });
+    }
+    return pump();
+}
+
+// --- Utility function to add a message bubble to the history ---
+function appendMessage(role, text) {
+    const historyDiv = document.getElementById("history");
+    const div = document.createElement("div");
+    div.className = role === "user" ? "message-user" : "message-assistant";
+    div.textContent = text;
+    historyDiv.appendChild(div);
+    historyDiv.scrollTop = historyDiv.scrollHeight;
+    return div;
+}
+
+// --- Load one page of older messages and put it above what is already shown ---
+function loadHistory() {
+    if (historyLoading) return;
+    historyLoading = true;
+
+    const historyDiv = document.getElementById("history");
+    const url = historyCursor === null
+        ? `/chat/${chatId}/history`
+        : `/chat/${chatId}/history?before=${historyCursor}`;
+
+    fetch(url, { headers: { "Authorization": `Bearer ${token}` } })
+    .then(res => res.json())
+    .then(data => {
+        const firstLoad = historyCursor === null;
+        const previousHeight = historyDiv.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        data.messages.forEach(m => {
+            const div = document.createElement("div");
+            div.className = m.role === "user" ? "message-user" : "message-assistant";
+            div.textContent = m.content;
+            fragment.appendChild(div);
+        });
+        historyDiv.insertBefore(fragment, historyDiv.firstChild);
+        // Keep the view where it was (or at the bottom on the first page)
+        historyDiv.scrollTop = firstLoad
+            ? historyDiv.scrollHeight
+            : historyDiv.scrollHeight - previousHeight;
+        historyCursor = data.before;
+        historyLoading = data.before === null; // Nothing older left to load
+    })
+    .catch(error => {
+        console.error("Error loading history:", error);
+        historyLoading = false;
+    });
+}
+
+// --- Fetch older messages when the user scrolls to the top ---
+function setupHistoryListeners() {
+    const historyDiv = document.getElementById("history");
+    historyDiv.addEventListener("scroll", function() {
+        if (historyDiv.scrollTop === 0 && historyCursor !== null) {
+            loadHistory();
+        }
+    });
+}
+
 function sendMessage() {
     const message = document.getElementById("message").value;
     
@@ -89,7 +179,12 @@ function sendMessage() {
     document.getElementById("message").value = "";
     document.getElementById("message").focus(); // Keep focus for quick follow-up
 
-    fetch(`/chat/${chatId}`, {
+    const historyDiv = document.getElementById("history");
+    appendMessage("user", message);
+    const replyDiv = appendMessage("assistant", "");
+    let reply = "";
+
+    fetch(`/chat/${chatId}/stream`, {
         method: "POST",
         headers: {
             "Authorization": `Bearer ${token}`,
@@ -97,20 +192,18 @@ function sendMessage() {
         },
         body: JSON.stringify({ message })
     })
-    .then(res => res.json())
-    .then(data => {
-        const historyDiv = document.getElementById("history");
-        // Clear history and append messages
-        historyDiv.innerHTML = ""; 
-        data.history.forEach(entry => {
-            const div = document.createElement("div");
-            div.className = entry.role === "user" ? "message-user" : "message-assistant";
-            // Check if content exists before trying to access it
-            div.textContent = entry.content ? entry.content : `[Empty response]`; 
-            historyDiv.appendChild(div);
+    .then(res => {
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        // Render tokens as they arrive
+        return readEvents(res, (event, data) => {
+            if (event === "done") {
+                reply = data.reply;
+            } else {
+                reply += data.delta;
+            }
+            replyDiv.textContent = reply ? reply : `[Empty response]`;
+            historyDiv.scrollTop = historyDiv.scrollHeight;
         });
-        // Scroll to the bottom
-        historyDiv.scrollTop = historyDiv.scrollHeight; 
     })
     .catch(error => {
         console.error("Error sending message:", error);
@@ -1,5 +1,7 @@
 let token = null;
 let chatId = 1;
+let historyCursor = null; // "before" cursor for the next older page
+let historyLoading = false;
 
 // --- Setup Listeners ---
 function setupChatListeners() {
@@ -63,12 +65,96 @@ function login() {
             document.getElementById("auth").style.display = "none";
             document.getElementById("chat").style.display = "flex"; // Flex for terminal layout
             setupChatListeners();
+            setupHistoryListeners();
+            loadHistory();
         } else {
             alert("ACCESS DENIED: Invalid Credentials");
         }
     });
 }
 
+// --- Stream Helpers ---
+function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    function pump() {
+        return reader.read().then(({ value, done }) => {
+            if (done) return;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = "message";
+                let data = "";
+                raw.split("\n").forEach(line => {
+                    if (line.startsWith("event:")) event = line.slice(6).trim();
+                    else if (line.startsWith("data:")) data += line.slice(5).trim();
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
+            return pump();
+        });
+    }
+    return pump();
+}
+
+function appendLine(className, text) {
+    const historyDiv = document.getElementById("history");
+    const div = document.createElement("div");
+    div.className = className;
+    div.textContent = text; // CSS ::before handles the prefixes
+    historyDiv.appendChild(div);
+    historyDiv.scrollTop = historyDiv.scrollHeight;
+    return div;
+}
+
+// --- History ---
+function loadHistory() {
+    if (historyLoading) return;
+    historyLoading = true;
+
+    const historyDiv = document.getElementById("history");
+    const url = historyCursor === null
+        ? `/chat/${chatId}/history`
+        : `/chat/${chatId}/history?before=${historyCursor}`;
+
+    fetch(url, { headers: { "Authorization": `Bearer ${token}` } })
+    .then(res => res.json())
+    .then(data => {
+        const firstLoad = historyCursor === null;
+        const previousHeight = historyDiv.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        data.messages.forEach(m => {
+            const div = document.createElement("div");
+            div.className = m.role === "user" ? "message-user" : "message-assistant";
+            div.textContent = m.content;
+            fragment.appendChild(div);
+        });
+        historyDiv.insertBefore(fragment, historyDiv.firstChild);
+        historyDiv.scrollTop = firstLoad
+            ? historyDiv.scrollHeight
+            : historyDiv.scrollHeight - previousHeight;
+        historyCursor = data.before;
+        historyLoading = data.before === null; // Stop once the oldest page is in
+    })
+    .catch(error => {
+        console.error("Error:", error);
+        historyLoading = false;
+    });
+}
+
+function setupHistoryListeners() {
+    const historyDiv = document.getElementById("history");
+    historyDiv.addEventListener("scroll", function() {
+        if (historyDiv.scrollTop === 0 && historyCursor !== null) {
+            loadHistory();
+        }
+    });
+}
+
 function sendMessage() {
     const messageInput = document.getElementById("message");
     const message = messageInput.value;
@@ -81,18 +167,15 @@ function sendMessage() {
     messageInput.value = "";
     messageInput.focus();
 
-    // Optimistic UI: Show user message immediately
     const historyDiv = document.getElementById("history");
-    // We wait for server response to render full history to keep it synced
-    
-    // Add temporary loading indicator
-    const loadingDiv = document.createElement("div");
-    loadingDiv.className = "sys-msg";
-    loadingDiv.textContent = "TRANSMITTING DATA...";
-    historyDiv.appendChild(loadingDiv);
-    historyDiv.scrollTop = historyDiv.scrollHeight;
+    appendLine("message-user", message);
 
-    fetch(`/chat/${chatId}`, {
+    // Add temporary loading indicator until the first token arrives
+    const loadingDiv = appendLine("sys-msg", "TRANSMITTING DATA...");
+    let replyDiv = null;
+    let reply = "";
+
+    fetch(`/chat/${chatId}/stream`, {
         method: "POST",
         headers: {
             "Authorization": `Bearer ${token}`,
@@ -100,24 +183,21 @@ function sendMessage() {
         },
         body: JSON.stringify({ message })
     })
-    .then(res => res.json())
-    .then(data => {
-        historyDiv.innerHTML = ""; // Clear for fresh render from server state
-        
-        // Add initial system boot messages
-        const boot1 = document.createElement("div"); boot1.className="sys-msg"; boot1.textContent="CONNECTION ESTABLISHED...";
-        historyDiv.appendChild(boot1);
-        
-        data.history.forEach(entry => {
-            const div = document.createElement("div");
-            div.className = entry.role === "user" ? "message-user" : "message-assistant";
-            div.textContent = entry.content; // CSS ::before handles the prefixes
-            historyDiv.appendChild(div);
+    .then(res => {
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        return readEvents(res, (event, data) => {
+            if (!replyDiv) {
+                loadingDiv.remove();
+                replyDiv = appendLine("message-assistant", "");
+            }
+            reply = event === "done" ? data.reply : reply + data.delta;
+            replyDiv.textContent = reply;
+            historyDiv.scrollTop = historyDiv.scrollHeight;
         });
-        historyDiv.scrollTop = historyDiv.scrollHeight; 
     })
     .catch(error => {
         console.error("Error:", error);
+        loadingDiv.remove();
         alert("CRITICAL ERROR: Connection Lost");
     });
 }
@@ -1,44 +1,37 @@
-import os, json, datetime, hashlib
+import os, sys, json, time, datetime, hashlib, asyncio, contextlib
 from fastapi import FastAPI, Request, Form, Depends, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 import uvicorn
-import requests
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from bot.core.storage import open_user_store
+from bot.core.runtime import shared_runtime, project_root
+from bot.core.inference import ALL_FAILED_REPLY
+from bot.core.turns import TurnPipeline
 
 # --- Configs ---
-PUBLIC_WEB_CONFIG_PATH = os.path.join(ROOT_DIR, "config", "web.json")
-PRIVATE_WEB_CONFIG_PATH = os.path.join(ROOT_DIR, "secrets", "config", "web.json")
-ROUTE_PATH = os.path.join(ROOT_DIR, "secrets", "config", "route.json")
-PERSONA_PATH = os.path.join(ROOT_DIR, "config", "persona.json")
+HOME_DIR = project_root(ROOT_DIR)  # Where config/ and secrets/ live (ROOT_DIR unless a tool set up the runtime elsewhere)
+PUBLIC_WEB_CONFIG_PATH = os.path.join(HOME_DIR, "config", "web.json")
+PRIVATE_WEB_CONFIG_PATH = os.path.join(HOME_DIR, "secrets", "config", "web.json")
 
 with open(PUBLIC_WEB_CONFIG_PATH, "r") as f:
     public_web_config = json.load(f)
 with open(PRIVATE_WEB_CONFIG_PATH, "r") as f:
     private_web_config = json.load(f)
-with open(ROUTE_PATH, "r") as f:
-    route_config = json.load(f)
-try:
-    with open(PERSONA_PATH, "r") as f:
-        persona_config = json.load(f)
-except Exception:
-    persona_config = {
-        "default": {
-            "role": "system",
-            "content": "You are ZIA, a friendly indie dev lounge AI."
-        }
-    }
 
 TEMPLATE_NAME = public_web_config.get("template", "web_01")
 TEMPLATE_DIR = os.path.join(ROOT_DIR, "bot", "web", "templates", TEMPLATE_NAME)
 
 HOST_MODE = private_web_config.get("host", "localhost")
 PORT = private_web_config.get("port", 5000)
+WORKERS = max(1, private_web_config.get("workers", 1))
 if HOST_MODE == "localhost":
     HOST = "127.0.0.1"
 elif HOST_MODE in ["lan", "domain"]:
@@ -46,9 +39,13 @@ elif HOST_MODE in ["lan", "domain"]:
 else:
     HOST = "127.0.0.1"
 
-ENDPOINTS = route_config.get("endpoints", [])
-MODEL = route_config.get("model", "qwen3-v1-4b")
-MAX_TOKENS = route_config.get("tokens", {}).get("max_tokens", 100)
+# Configs, memory, AI client, summarizer and reply cache, shared with the other adapters inside the gateway.
+# Workers are separate processes: they share the logs through file locks, and a per-process
+# cache would serve them stale windows, so it is only used with one worker.
+RUNTIME = shared_runtime(ROOT_DIR, shared=WORKERS > 1)
+app_config = RUNTIME.app_config
+DB_DIR = RUNTIME.memory_dir
+METRICS = RUNTIME.metrics  # Per-worker: with several workers each one serves its own /metrics.
 
 # --- Auth setup ---
 SECRET_KEY = "super-secret-key"  # replace with secure value in secrets
@@ -62,76 +59,86 @@ app.mount("/static", StaticFiles(directory=TEMPLATE_DIR), name="static")
 templates = Jinja2Templates(directory=TEMPLATE_DIR)
 
 # --- Simple user store ---
-USER_DB_PATH = os.path.join(ROOT_DIR, "secrets", "db", "users.json")
-os.makedirs(os.path.dirname(USER_DB_PATH), exist_ok=True)
-if not os.path.exists(USER_DB_PATH):
-    with open(USER_DB_PATH, "w") as f:
-        json.dump({}, f)
+USERS = open_user_store(app_config.get("storage", {}), DB_DIR)  # users.json or the SQLite users table
 
-def load_users():
-    with open(USER_DB_PATH, "r") as f:
-        return json.load(f)
+# These block on disk, so routes run them with asyncio.to_thread.
+def get_user(username):
+    return USERS.get(username)
 
-def save_users(users):
-    with open(USER_DB_PATH, "w") as f:
-        json.dump(users, f, indent=2)
+def add_user(username, password_hash):
+    return USERS.add(username, {"password": password_hash})
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
+def current_user(token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return payload.get("sub")
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
 # --- Memory functions ---
-def memory_path(user_id, chat_id):
-    return os.path.join(ROOT_DIR, "secrets", "db", f"user_{user_id}_chat_{chat_id}.json")
-
-def load_memory(user_id, chat_id, limit=20):
-    path = memory_path(user_id, chat_id)
-    if not os.path.exists(path):
-        return []
-    with open(path, "r") as f:
-        history = json.load(f)
-    return history[-limit:]
-
-def save_memory(user_id, chat_id, role, content):
-    path = memory_path(user_id, chat_id)
-    history = []
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            history = json.load(f)
-    history.append({
-        "role": role,
-        "content": content,
-        "timestamp": datetime.datetime.now().isoformat()
-    })
-    with open(path, "w") as f:
-        json.dump(history, f, indent=2)
-
-# --- AI call ---
-def call_ai(user_message, user_id, chat_id):
-    persona = persona_config.get("default")
-    memory = load_memory(user_id, chat_id)
-    messages = [persona] + memory + [{"role": "user", "content": user_message}]
-
-    for endpoint in ENDPOINTS:
-        try:
-            response = requests.post(
-                endpoint,
-                json={
-                    "model": MODEL,
-                    "messages": messages,
-                    "max_tokens": MAX_TOKENS
-                },
-                timeout=10
-            )
-            if response.status_code != 200:
-                continue
-            reply = response.json()["choices"][0]["message"]["content"]
-            save_memory(user_id, chat_id, "user", user_message)
-            save_memory(user_id, chat_id, "assistant", reply)
-            return reply
-        except Exception as e:
-            print(f"⚠️ Failed on {endpoint}: {e}")
-            continue
-    return "⚠️ All endpoints failed, please try again later."
+HISTORY_PAGE = 20  # Default page size of /chat/{id}/history
+MEMORY = RUNTIME.memory
+TURNS = TurnPipeline(RUNTIME, "web")  # Memory, docs, prompt, reply cache and model call, the same as in the bots.
+CHAT_LOCKS = {}  # scope -> [lock, turns holding or waiting for it]; one turn at a time per chat.
+
+@contextlib.asynccontextmanager
+async def chat_lock(scope):
+    # Serialises a chat's turns in this worker (TURNS.save keeps each turn's two messages
+    # together across workers).  The entry is dropped once no turn holds or waits for it,
+    # so CHAT_LOCKS only has chats with a turn in progress.
+    entry = CHAT_LOCKS.setdefault(scope, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del CHAT_LOCKS[scope]
+
+def memory_scope(user_id, chat_id):
+    return f"user_{user_id}_chat_{chat_id}"
+
+async def call_ai(user_message, user_id, chat_id):
+    return await TURNS.call(memory_scope(user_id, chat_id), user_message)
+
+@app.on_event("startup")
+async def start_runtime():
+    if not RUNTIME.hosted:
+        await RUNTIME.start()  # Config hot reload, and the sampling profiler if app.json turns it on.
+
+@app.on_event("shutdown")
+async def flush_memory():
+    await asyncio.to_thread(USERS.close)
+    if not RUNTIME.hosted:
+        await RUNTIME.aclose()  # The gateway closes the shared runtime itself.
+
+# --- Metrics ---
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    # Labelled by route template, not path, so chat IDs don't each get a series.  Streams are timed to their first byte.
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    METRICS.observe(
+        "zia_http_request_seconds",
+        time.perf_counter() - started,
+        route=route.path if route is not None else "other",
+        status=response.status_code,
+    )
+    return response
+
+if RUNTIME.metrics_options["web_endpoint"]:
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics(request: Request):
+        # Local scrapers only: the labels name the endpoints (LAN hosts, cloud providers) and routes,
+        # and in lan/domain mode the app listens on every interface.
+        if request.client is None or request.client.host not in ("127.0.0.1", "::1"):
+            raise HTTPException(status_code=403, detail="Metrics are only served to localhost")
+        return METRICS.render()
 
 # --- Routes ---
 @app.get("/", response_class=HTMLResponse)
@@ -140,72 +147,85 @@ async def index(request: Request):
 
 @app.post("/register")
 async def register(username: str = Form(...), password: str = Form(...)):
-    users = load_users()
-    if username in users:
+    if not await asyncio.to_thread(add_user, username, hash_password(password)):
         raise HTTPException(status_code=400, detail="User already exists")
-    users[username] = {"password": hash_password(password)}
-    save_users(users)
     return {"msg": "User registered successfully"}
 
 @app.post("/login")
 async def login(username: str = Form(...), password: str = Form(...)):
-    users = load_users()
-    if username not in users or users[username]["password"] != hash_password(password):
+    user = await asyncio.to_thread(get_user, username)
+    if user is None or user["password"] != hash_password(password):
         raise HTTPException(status_code=400, detail="Invalid credentials")
     token_data = {"sub": username, "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)}
     token = jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
     return {"access_token": token, "token_type": "bearer"}
 
 @app.post("/chat/{chat_id}")
-async def chat(chat_id: int, request: Request, token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+async def chat(chat_id: int, request: Request, username: str = Depends(current_user)):
+    data = await request.json()
+    user_message = data.get("message", "")
 
+    async with chat_lock(memory_scope(username, chat_id)):
+        # Persona + memory
+        turn = await TURNS.prepare(memory_scope(username, chat_id), user_message)
+
+        if await TURNS.complete(turn) is None:
+            turn.reply = ALL_FAILED_REPLY
+
+        # Save memory; only the new turn goes back, older turns come from /history
+        saved = await TURNS.finish(turn)
+    return {"reply": turn.reply, "turn": saved, "seq": saved[-1]["seq"]}
+
+@app.get("/chat/{chat_id}/history")
+async def chat_history(chat_id: int, before: int = None, limit: int = HISTORY_PAGE, username: str = Depends(current_user)):
+    # One page of older turns, oldest first.  Pass the returned "before" back to get the page above it.
+    limit = max(1, min(limit, 100))
+    messages, cursor = await asyncio.to_thread(MEMORY.page, memory_scope(username, chat_id), before, limit)
+    return {"messages": messages, "before": cursor}
+
+def sse(data, event=None):
+    # Format one Server-Sent Event.
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/chat/{chat_id}/stream")
+async def chat_stream(chat_id: int, request: Request, username: str = Depends(current_user)):
     data = await request.json()
     user_message = data.get("message", "")
 
-    # Persona + memory
-    persona = persona_config.get("default")
-    memory = load_memory(username, chat_id)
-    messages = [persona] + memory + [{"role": "user", "content": user_message}]
-
-    reply = None
-    for endpoint in ENDPOINTS:
-        try:
-            # First attempt with model
-            payload = {
-                "model": MODEL,
-                "messages": messages,
-                "max_tokens": MAX_TOKENS
-            }
-            response = requests.post(endpoint, json=payload, timeout=10)
-
-            # Retry without model if failed
-            if response.status_code != 200:
-                payload.pop("model", None)
-                response = requests.post(endpoint, json=payload, timeout=10)
-
-            if response.status_code == 200:
-                reply = response.json()["choices"][0]["message"]["content"]
-                break
-        except Exception as e:
-            print(f"⚠️ Failed on {endpoint}: {e}")
-            continue
-
-    if not reply:
-        reply = "⚠️ All endpoints failed, please try again later."
-
-    # Save memory
-    save_memory(username, chat_id, "user", user_message)
-    save_memory(username, chat_id, "assistant", reply)
-
-    history = load_memory(username, chat_id)
-    return {"reply": reply, "history": history}
+    async def events():
+        async with chat_lock(memory_scope(username, chat_id)):
+            # Persona + memory
+            turn = await TURNS.prepare(memory_scope(username, chat_id), user_message)
 
+            # Proxy chunks to the browser as the model generates them (a cached reply is one chunk).
+            async for chunk in TURNS.generate(turn):
+                yield sse({"delta": chunk})
+            if turn.reply is None:
+                turn.reply = ALL_FAILED_REPLY
+                yield sse({"delta": ALL_FAILED_REPLY})
 
-if __name__ == "__main__":
+            # Save memory once, after the stream has completed.
+            saved = await TURNS.finish(turn)
+        yield sse({"reply": turn.reply, "turn": saved, "seq": saved[-1]["seq"]}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def serve():
+    # Run the web chat on the current event loop (used by the gateway; always a single worker there).
     print(f"✅ Web chat running on {HOST}:{PORT}, template={TEMPLATE_NAME}")
-    uvicorn.run(app, host=HOST, port=PORT)
\ No newline at end of file
+    await uvicorn.Server(uvicorn.Config(app, host=HOST, port=PORT)).serve()
+
+
+if __name__ == "__main__":
+    print(f"✅ Web chat running on {HOST}:{PORT}, template={TEMPLATE_NAME}, workers={WORKERS}")
+    if WORKERS > 1:
+        # Each worker process imports the app itself, so uvicorn needs it by name.
+        uvicorn.run("bot.web.zia:app", host=HOST, port=PORT, workers=WORKERS, app_dir=ROOT_DIR)
+    else:
+        uvicorn.run(app, host=HOST, port=PORT)
\ No newline at end of file
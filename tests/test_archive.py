@@ -0,0 +1,106 @@
+# tests/test_archive.py
+import os
+import time
+
+import pytest
+
+from bot.core.archive import Archive
+from bot.core.memory import MemoryStore
+from bot.core.storage import SQLiteMemoryStore
+
+DAY = 86400
+
+
+def make_store(backend, tmp_path, archive):
+    if backend == "jsonl":
+        return MemoryStore(str(tmp_path / "db"), log_limit=100, load_limit=10, archive=archive)
+    return SQLiteMemoryStore(str(tmp_path / "zia.sqlite3"), log_limit=100, load_limit=10, archive=archive)
+
+
+def age(store, scope, seconds):
+    # Makes a scope look idle for `seconds`.
+    then = time.time() - seconds
+    if isinstance(store, MemoryStore):
+        os.utime(store.path(str(scope)), (then, then))
+    else:
+        with store._lock:
+            store._db.execute("UPDATE messages SET timestamp = ? WHERE scope = ?", (int(then), str(scope)))
+
+
+@pytest.fixture(params=["jsonl", "sqlite"])
+def backend(request):
+    return request.param
+
+
+@pytest.mark.parametrize("scope", [123456789012345678, "web_alice_chat1"])
+def test_archive_round_trip(backend, tmp_path, scope):
+    archive = Archive(str(tmp_path / "archive"))
+    store = make_store(backend, tmp_path, archive)
+    store.extend(scope, [("user", "one"), ("assistant", "two"), ("user", "three")])
+    store.save_summary(scope, {"text": "earlier", "through": 0})
+    age(store, scope, 40 * DAY)
+
+    report = store.archive_idle(30 * DAY)
+    assert report["scopes"] == 1
+    assert archive.contains(scope)
+
+    assert [r["content"] for r in store.load(scope)] == ["one", "two", "three"]
+    assert not archive.contains(scope)
+    assert store.load_summary(scope) == {"text": "earlier", "through": 0}
+    assert store.append(scope, "assistant", "four") == 3
+    assert [r["seq"] for r in store.load(scope)] == [0, 1, 2, 3]
+    store.close()
+
+
+def test_int_scope_survives_second_archive_pass(backend, tmp_path):
+    # A restored scope written to again must archive without losing what came back.
+    scope = 987654321
+    archive = Archive(str(tmp_path / "archive"))
+    store = make_store(backend, tmp_path, archive)
+    store.extend(scope, [("user", "a"), ("assistant", "b"), ("user", "c")])
+    age(store, scope, 40 * DAY)
+    store.archive_idle(30 * DAY)
+
+    store.append(scope, "assistant", "d")
+    age(store, scope, 40 * DAY)
+    store.archive_idle(30 * DAY)
+
+    assert archive.stats()["scopes"] == 1
+    assert [r["content"] for r in store.load(scope)] == ["a", "b", "c", "d"]
+    store.close()
+
+
+def test_fresh_store_restores_archived_int_scope(backend, tmp_path):
+    # Another process (or a restart) must find the history the first store archived.
+    scope = 42
+    archive = Archive(str(tmp_path / "archive"))
+    store = make_store(backend, tmp_path, archive)
+    store.extend(scope, [("user", "hi"), ("assistant", "hello")])
+    age(store, scope, 40 * DAY)
+    store.archive_idle(30 * DAY)
+    store.close()
+
+    store = make_store(backend, tmp_path, Archive(str(tmp_path / "archive")))
+    assert store.next_seq(scope) == 2
+    assert [r["content"] for r in store.load(scope)] == ["hi", "hello"]
+    store.close()
+
+
+def test_repack_keeps_live_members(tmp_path):
+    archive = Archive(str(tmp_path / "archive"), repack_ratio=0.3)
+    store = MemoryStore(str(tmp_path / "db"), archive=archive)
+    scopes = [f"scope{i}" for i in range(4)]
+    for scope in scopes:
+        store.extend(scope, [("user", f"{scope} says " + "x" * 200)])
+        age(store, scope, 40 * DAY)
+    store.archive_idle(30 * DAY)
+    assert archive.stats()["segments"] == 1
+
+    store.load(scopes[0])
+    store.load(scopes[1])
+    stats = archive.stats()
+    assert stats["scopes"] == 2
+    assert stats["dead_bytes"] < stats["stored_bytes"]  # Repacked at least once.
+    for scope in scopes[2:]:
+        assert store.load(scope)[0]["content"].startswith(scope)
+    assert archive.stats()["segments"] == 0
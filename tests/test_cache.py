@@ -0,0 +1,68 @@
+# tests/test_cache.py
+from bot.core.cache import MemoryCache
+from bot.core.memory import MemoryStore, make_record
+
+
+class CountingStore(MemoryStore):
+    # Counts reads of the next sequence number.
+    next_seq_calls = 0
+
+    def next_seq(self, scope):
+        self.next_seq_calls += 1
+        return super().next_seq(scope)
+
+
+def test_append_counts_sequence_numbers_in_ram(tmp_path):
+    store = CountingStore(str(tmp_path), log_limit=100, load_limit=10)
+    store.extend("chan", [("user", "a"), ("assistant", "b")])
+    cache = MemoryCache(store, flush_interval=0)
+
+    cache.load("chan")
+    seqs = [cache.append("chan", "user", f"m{i}") for i in range(5)]
+    assert seqs == [2, 3, 4, 5, 6]
+    assert store.next_seq_calls == 0
+    assert [r["seq"] for r in store.load("chan", 20)] == list(range(7))
+    cache.close()
+
+
+def test_new_scope_reads_its_sequence_number_once(tmp_path):
+    store = CountingStore(str(tmp_path), log_limit=100, load_limit=10)
+    cache = MemoryCache(store, flush_interval=60)
+
+    assert cache.load("empty") == []
+    assert [cache.append("empty", "user", str(i)) for i in range(3)] == [0, 1, 2]
+    assert cache.next_seq("empty") == 3
+    assert store.next_seq_calls == 1
+    cache.close()
+    assert [r["content"] for r in store.load("empty")] == ["0", "1", "2"]
+
+
+def test_evicted_scope_is_counted_from_the_store_again(tmp_path):
+    store = CountingStore(str(tmp_path), log_limit=100, load_limit=10)
+    cache = MemoryCache(store, max_entries=1, flush_interval=60)
+
+    cache.load("a")
+    cache.append("a", "user", "a0")
+    cache.load("b")  # Evicts "a" while its message is still pending.
+    assert cache.append("a", "user", "a1") == 1
+    cache.close()
+    assert [r["seq"] for r in store.load("a")] == [0, 1]
+
+
+def test_write_records_flushes_a_batch_in_one_write(tmp_path):
+    class CountingWrites(MemoryStore):
+        writes = []
+
+        def write_records(self, scope, records):
+            self.writes.append(len(records))
+            return super().write_records(scope, records)
+
+    store = CountingWrites(str(tmp_path))
+    cache = MemoryCache(store, flush_interval=60)
+    cache.load("chat")
+    records = [make_record("user", "q"), make_record("assistant", "a")]
+    assert cache.write_records("chat", records) == 0
+    assert [r["seq"] for r in cache.load("chat")] == [0, 1]
+    cache.close()
+    assert store.writes == [2]
+    assert [r["content"] for r in store.load("chat")] == ["q", "a"]
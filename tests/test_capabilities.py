@@ -0,0 +1,175 @@
+# tests/test_capabilities.py
+import asyncio
+
+from aiohttp import web
+
+from bot.core.capabilities import CapabilityCache, OPENAI, candidate_shapes
+from bot.core.inference import AsyncInferenceClient
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class FakeEndpoint:
+    """
+    OpenAI-compatible endpoint that rejects payloads with a "model" field (and
+    with any of `unknown`), and answers with `status` instead while it is set.
+    """
+
+    def __init__(self, unknown=()):
+        self.status = None
+        self.unknown = unknown
+        self.payloads = []
+
+    async def handle(self, request):
+        payload = await request.json()
+        self.payloads.append(payload)
+        if self.status is not None:
+            return web.Response(status=self.status)
+        for field in ("model",) + tuple(self.unknown):
+            if field in payload:
+                return web.Response(status=400, text=f"unknown field: {field}")
+        return web.json_response({"choices": [{"message": {"content": "hello"}}]})
+
+
+async def serve(fake):
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", fake.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}/v1/chat/completions"
+
+
+async def calls(fake, steps, hints=None):
+    # Runs `steps` as [(status to answer with, or None), ...].
+    # Returns the replies, the requests each step made and the learned shape.
+    runner, endpoint = await serve(fake)
+    capabilities = CapabilityCache()
+    client = AsyncInferenceClient(
+        [endpoint], "test-model", 64, capabilities=capabilities, routing={"probe_interval": 0}, hints=hints
+    )
+    replies, requests = [], []
+    try:
+        for status in steps:
+            fake.status = status
+            sent = len(fake.payloads)
+            replies.append(await client.complete(MESSAGES))
+            requests.append(len(fake.payloads) - sent)
+    finally:
+        await client.close()
+        await runner.cleanup()
+    return replies, requests, capabilities.known(endpoint)
+
+
+def test_learns_the_first_accepted_shape():
+    replies, requests, shape = asyncio.run(calls(FakeEndpoint(), [None, None]))
+    assert replies == ["hello", "hello"]
+    assert shape["schema"] == OPENAI and not shape["send_model"] and shape["send_max_tokens"]
+    assert requests == [2, 1]
+
+
+def test_server_errors_keep_the_learned_shape():
+    fake = FakeEndpoint()
+    replies, requests, shape = asyncio.run(calls(fake, [None, 503, 500, None]))
+    assert replies == ["hello", None, None, "hello"]
+    assert shape["send_max_tokens"] and not shape["send_model"]
+    # One request per failed message, and none of them without the learned fields.
+    assert requests[1:] == [1, 1, 1]
+    assert all("max_tokens" in payload for payload in fake.payloads[-3:])
+
+
+def test_server_error_before_learning_tries_one_shape():
+    replies, requests, shape = asyncio.run(calls(FakeEndpoint(), [502]))
+    assert replies == [None]
+    assert shape is None
+    assert requests == [1]
+
+
+def test_stream_server_error_keeps_the_learned_shape():
+    async def run(fake):
+        runner, endpoint = await serve(fake)
+        capabilities = CapabilityCache()
+        client = AsyncInferenceClient([endpoint], "test-model", 64, capabilities=capabilities, routing={"probe_interval": 0})
+        try:
+            first = [chunk async for chunk in client.stream(MESSAGES)]
+            fake.status = 503
+            sent = len(fake.payloads)
+            failed = [chunk async for chunk in client.stream(MESSAGES)]
+            return first, failed, len(fake.payloads) - sent, capabilities.known(endpoint)
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    first, failed, requests, shape = asyncio.run(run(FakeEndpoint()))
+    assert first == ["hello"] and failed == []
+    assert requests == 1
+    assert shape is not None and not shape["send_model"]
+
+
+def test_candidate_shapes_try_each_field_set_once():
+    shapes = candidate_shapes("http://localhost:8080/v1/chat/completions")
+    assert shapes[0]["schema"] == OPENAI
+    assert len(shapes) == 6
+    assert not any(shape.get("send_hints") for shape in shapes)
+
+
+def test_hints_are_tried_on_top_of_the_learned_shape():
+    fake = FakeEndpoint()
+    replies, requests, shape = asyncio.run(calls(fake, [None, None, None], hints={"openai": {"cache_prompt": True}}))
+    assert replies == ["hello"] * 3
+    assert requests == [2, 1, 1]
+    assert shape["send_hints"] is True
+    assert "cache_prompt" not in fake.payloads[1] and fake.payloads[-1]["cache_prompt"] is True
+
+
+def test_rejected_hints_are_tried_once():
+    fake = FakeEndpoint(unknown=("cache_prompt",))
+    replies, requests, shape = asyncio.run(calls(fake, [None, None, None], hints={"openai": {"cache_prompt": True}}))
+    assert replies == ["hello"] * 3
+    assert requests == [2, 2, 1]
+    assert shape["send_hints"] is False
+
+
+def test_saving_learned_shapes_never_fails_a_request(tmp_path):
+    shape = {"schema": OPENAI, "send_model": True, "send_max_tokens": True}
+    path = tmp_path / "capabilities.json"
+    first, second = CapabilityCache(str(path)), CapabilityCache(str(path))
+    first.learn("http://a", shape)
+    second.learn("http://b", shape)  # Another process: its own temporary file.
+    assert CapabilityCache(str(path)).known("http://b") == shape
+    assert not list(tmp_path.glob("*.tmp"))
+
+    unwritable = CapabilityCache(str(tmp_path / "missing" / "capabilities.json"))
+    unwritable.learn("http://a", shape)
+    assert unwritable.known("http://a") == shape
+
+
+def test_cancelled_call_releases_the_endpoint():
+    async def run():
+        async def slow(request):
+            await asyncio.sleep(10)
+            return web.json_response({})
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", slow)
+        runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        endpoint = f"http://127.0.0.1:{runner.addresses[0][1]}/v1/chat/completions"
+        client = AsyncInferenceClient([endpoint], "test-model", 64, routing={"probe_interval": 0})
+        try:
+            task = asyncio.create_task(client.complete(MESSAGES))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return client.router.stats()[endpoint]
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    stats = asyncio.run(run())
+    assert stats["outstanding"] == 0 and stats["failures"] == 0
@@ -0,0 +1,26 @@
+# tests/test_context.py
+from bot.core.context import ApproximateTokenizer, ContextBuilder
+
+PERSONA = {"role": "system", "content": "You are helpful."}
+
+
+def history(count):
+    return [{"seq": i, "role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(count)]
+
+
+def test_scope_state_is_bounded():
+    builder = ContextBuilder(ApproximateTokenizer(), layout="stable", max_scopes=3)
+    for scope in range(10):
+        builder.build(PERSONA, history(4), "hi", scope=scope)
+    assert list(builder._anchors) == [7, 8, 9]
+    assert list(builder._previous) == [7, 8, 9]
+
+
+def test_active_scope_is_kept_over_idle_ones():
+    builder = ContextBuilder(ApproximateTokenizer(), layout="stable", max_scopes=2)
+    builder.build(PERSONA, history(4), "hi", scope="busy")
+    builder.build(PERSONA, history(4), "hi", scope="quiet")
+    builder.build(PERSONA, history(4), "again", scope="busy")
+    builder.build(PERSONA, history(4), "hi", scope="new")
+    assert set(builder._previous) == {"busy", "new"}
+    assert builder.stats()["matched_tokens"] > 0
@@ -0,0 +1,96 @@
+# tests/test_memory.py
+import os
+import json
+
+from bot.core.memory import INDEX_ENTRY, MemoryStore, decode_record, encode_record, read_tail
+
+
+def contents(records):
+    return [r["content"] for r in records]
+
+
+def test_append_load_and_page(tmp_path):
+    store = MemoryStore(str(tmp_path), log_limit=100, load_limit=3)
+    seqs = [store.append("chan", "user" if i % 2 == 0 else "assistant", f"m{i}") for i in range(10)]
+    assert seqs == list(range(10))
+    assert contents(store.load("chan")) == ["m7", "m8", "m9"]
+
+    records, cursor = store.page("chan", None, 4)
+    assert [r["seq"] for r in records] == [6, 7, 8, 9] and cursor == 6
+    records, cursor = store.page("chan", cursor, 4)
+    assert [r["seq"] for r in records] == [2, 3, 4, 5] and cursor == 2
+    records, cursor = store.page("chan", cursor, 4)
+    assert [r["seq"] for r in records] == [0, 1] and cursor is None
+    assert records[0]["role"] == "user" and records[1]["role"] == "assistant"
+
+
+def test_index_holds_base_and_offsets(tmp_path):
+    store = MemoryStore(str(tmp_path))
+    store.extend("chan", [("user", "a"), ("assistant", "bb"), ("user", "ccc")])
+    with open(store.index_path("chan"), "rb") as f:
+        raw = f.read()
+    entries = [INDEX_ENTRY.unpack_from(raw, i)[0] for i in range(0, len(raw), INDEX_ENTRY.size)]
+    with open(store.path("chan"), "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    assert entries[0] == 0  # Sequence number of the first record.
+    assert entries[1:] == [0, len(lines[0]), len(lines[0]) + len(lines[1])]
+
+
+def test_compaction_keeps_sequence_numbers(tmp_path):
+    store = MemoryStore(str(tmp_path), log_limit=5, load_limit=5, compact_every=3)
+    for i in range(8):
+        store.append("chan", "user", f"m{i}")
+    # The eighth record reached log_limit + compact_every: back down to the last five.
+    with open(store.path("chan"), "rb") as f:
+        assert len(f.read().splitlines()) == 5
+    assert [r["seq"] for r in store.load("chan")] == [3, 4, 5, 6, 7]
+    assert store.append("chan", "user", "m8") == 8
+
+    reopened = MemoryStore(str(tmp_path), log_limit=5, load_limit=5, compact_every=3)
+    assert reopened.next_seq("chan") == 9
+    assert contents(reopened.page("chan", 6, 10)[0]) == ["m3", "m4", "m5"]
+
+
+def test_index_is_rebuilt_when_out_of_step(tmp_path):
+    store = MemoryStore(str(tmp_path))
+    store.extend("chan", [("user", "a"), ("assistant", "b")])
+    # A crash between the log append and the index append.
+    with open(store.path("chan"), "a", encoding="utf-8") as f:
+        f.write(encode_record({"role": "user", "content": "c", "timestamp": 0}))
+    reopened = MemoryStore(str(tmp_path))
+    assert [(r["seq"], r["content"]) for r in reopened.load("chan")] == [(0, "a"), (1, "b"), (2, "c")]
+    os.remove(store.index_path("chan"))
+    assert MemoryStore(str(tmp_path)).next_seq("chan") == 3
+
+
+def test_read_tail_skips_a_torn_line(tmp_path):
+    path = tmp_path / "chan.jsonl"
+    lines = [encode_record({"role": "user", "content": "x" * 3000 + str(i), "timestamp": 0}) for i in range(5)]
+    path.write_text("".join(lines) + '["u","torn', encoding="utf-8")
+    records = read_tail(str(path), 3)
+    assert [r["content"][-1] for r in records] == ["2", "3", "4"]
+
+
+def test_records_are_compact_and_old_lines_still_read(tmp_path):
+    line = encode_record({"role": "assistant", "content": "hi", "timestamp": 1700000000, "tokens": {"approximate": 1}})
+    assert json.loads(line) == ["a", "hi", 1700000000, {"approximate": 1}]
+    old = decode_record({"role": "user", "content": "yo", "timestamp": "2024-01-01T00:00:00+00:00"})
+    assert old == {"role": "user", "content": "yo", "timestamp": 1704067200}
+
+
+def test_legacy_json_history_is_migrated(tmp_path):
+    history = [{"role": "user", "content": f"old{i}", "timestamp": "2024-01-01T00:00:00"} for i in range(4)]
+    (tmp_path / "123.json").write_text(json.dumps(history), encoding="utf-8")
+    store = MemoryStore(str(tmp_path), log_limit=3, load_limit=10)
+    assert contents(store.load(123)) == ["old1", "old2", "old3"]
+    assert (tmp_path / "123.json.migrated").exists() and not (tmp_path / "123.json").exists()
+    assert store.append(123, "assistant", "new") == 3
+
+
+def test_shared_stores_see_each_others_writes(tmp_path):
+    first = MemoryStore(str(tmp_path), shared=True)
+    second = MemoryStore(str(tmp_path), shared=True)
+    assert first.append("chan", "user", "a") == 0
+    assert second.append("chan", "assistant", "b") == 1
+    assert first.append("chan", "user", "c") == 2
+    assert contents(second.load("chan")) == ["a", "b", "c"]
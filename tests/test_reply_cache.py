@@ -0,0 +1,30 @@
+# tests/test_reply_cache.py
+from bot.core.reply_cache import ReplyCache
+
+PERSONAS = {"default": {"content": "You are helpful."}, "playful": {"content": "You are playful."}}
+
+
+def test_configure_applies_new_filters():
+    cache = ReplyCache({"enabled": True, "personas": ["default"], "exclude_channels": [7]}, PERSONAS, "model-a")
+    assert cache.key(PERSONAS["default"], 1, "hi") is not None
+    assert cache.key(PERSONAS["playful"], 1, "hi") is None
+    assert cache.key(PERSONAS["default"], 7, "hi") is None
+
+    cache.configure({"enabled": True, "personas": ["playful"], "channels": [7]}, PERSONAS, "model-a")
+    assert cache.key(PERSONAS["default"], 7, "hi") is None
+    assert cache.key(PERSONAS["playful"], 1, "hi") is None
+    assert cache.key(PERSONAS["playful"], 7, "hi") is not None
+
+
+def test_configure_keeps_replies_and_applies_new_limits():
+    cache = ReplyCache({"enabled": True}, PERSONAS, "model-a")
+    keys = [cache.key(PERSONAS["default"], 1, f"question {i}") for i in range(3)]
+    for key in keys:
+        cache.put(key, "answer")
+
+    cache.configure({"enabled": True, "max_entries": 2}, PERSONAS, "model-a")
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == "answer"
+
+    cache.configure({"enabled": False}, PERSONAS, "model-a")
+    assert cache.key(PERSONAS["default"], 1, "question 2") is None
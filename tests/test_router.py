@@ -0,0 +1,51 @@
+# tests/test_router.py
+import asyncio
+import threading
+
+from aiohttp import web
+
+from bot.core.router import health_url, http_probe
+
+
+def test_health_url():
+    assert health_url("http://127.0.0.1:11434/api/chat") == "http://127.0.0.1:11434/api/tags"
+    assert health_url("http://127.0.0.1:8080/v1/chat/completions") == "http://127.0.0.1:8080/v1/models"
+    assert health_url("http://127.0.0.1:8080/generate") == "http://127.0.0.1:8080/generate"
+
+
+def serve(routes):
+    # Runs an aiohttp app with `routes` in a background thread; returns (base URL, stop()).
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", 0).start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return f"http://127.0.0.1:{runner.addresses[0][1]}", stop
+
+
+async def ok(request):
+    return web.json_response({"data": []})
+
+
+async def chat(request):
+    return web.json_response({})
+
+
+def test_probe_needs_a_real_health_route():
+    url, stop = serve([web.get("/v1/models", ok), web.post("/v1/chat/completions", chat), web.post("/generate", chat)])
+    try:
+        assert http_probe(f"{url}/v1/chat/completions")
+        assert not http_probe(f"{url}/api/chat")  # Wrong path: /api/tags is a 404.
+        assert http_probe(f"{url}/generate")  # GET on a POST-only route is a 405.
+        assert not http_probe(f"{url}/wrong")
+    finally:
+        stop()
@@ -0,0 +1,21 @@
+# tests/test_scheduler.py
+import time
+
+from bot.core.scheduler import ChannelScheduler
+
+
+def test_busy_reply_respects_the_cooldown():
+    scheduler = ChannelScheduler(options={"busy_cooldown": 30})
+    assert scheduler.busy_reply(1) == scheduler.options["busy_reply"]
+    assert scheduler.busy_reply(1) is None
+    assert scheduler.busy_reply(2) is not None
+
+
+def test_busy_reply_forgets_channels_past_the_cooldown():
+    scheduler = ChannelScheduler(options={"busy_cooldown": 0.05})
+    for scope in range(100):
+        scheduler.busy_reply(scope)
+    time.sleep(0.06)
+    assert scheduler.busy_reply("other") is not None
+    assert list(scheduler._last_busy) == ["other"]
+    assert scheduler.busy_reply(0) is not None
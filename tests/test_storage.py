@@ -0,0 +1,79 @@
+# tests/test_storage.py
+import os
+import json
+
+from bot.core.memory import MemoryStore
+from bot.core.storage import JsonUserStore, SQLiteMemoryStore, SQLiteUserStore, open_memory_store, open_user_store
+
+
+def contents(records):
+    return [r["content"] for r in records]
+
+
+def test_default_backend_is_jsonl(tmp_path):
+    assert isinstance(open_memory_store({}, str(tmp_path)), MemoryStore)
+    assert isinstance(open_user_store({}, str(tmp_path)), JsonUserStore)
+
+
+def test_sqlite_store_matches_the_jsonl_interface(tmp_path):
+    store = SQLiteMemoryStore(str(tmp_path / "zia.sqlite3"), log_limit=5, load_limit=3, compact_every=3)
+    assert store.extend(7, [("user", "a"), ("assistant", "b")]) == 0
+    assert store.append("7", "user", "c", tokens={"approximate": 1}) == 2
+    records = store.load(7)
+    assert contents(records) == ["a", "b", "c"] and records[-1]["tokens"] == {"approximate": 1}
+    assert store.page(7, 2, 10) == (records[:2], None)
+
+    for i in range(5):
+        store.append(7, "user", f"m{i}")
+    # 8 messages reached log_limit + compact_every: trimmed to the last five, numbers kept.
+    assert [r["seq"] for r in store.load(7, 20)] == [3, 4, 5, 6, 7]
+    assert store.next_seq(7) == 8
+    store.save_summary(7, {"text": "s"})
+    assert store.load_summary("7") == {"text": "s"}
+    store.close()
+
+
+def test_write_many_is_one_batch(tmp_path):
+    store = SQLiteMemoryStore(str(tmp_path / "zia.sqlite3"))
+    failed = store.write_many({
+        "a": [{"role": "user", "content": "1", "timestamp": 0}],
+        "b": [{"role": "user", "content": "2", "timestamp": 0}, {"role": "assistant", "content": "3", "timestamp": 0}],
+    })
+    assert failed == {}
+    assert contents(store.load("b")) == ["2", "3"] and store.next_seq("a") == 1
+    store.close()
+
+
+def test_sqlite_imports_file_history_on_first_use(tmp_path):
+    files = MemoryStore(str(tmp_path), log_limit=100)
+    files.extend(123, [("user", "from jsonl"), ("assistant", "reply")])
+    files.save_summary(123, {"text": "old summary"})
+    legacy = [{"role": "user", "content": "from json", "timestamp": "2024-01-01T00:00:00"}]
+    (tmp_path / "456.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+    store = open_memory_store({"backend": "sqlite"}, str(tmp_path))
+    assert isinstance(store, SQLiteMemoryStore)
+    assert contents(store.load(123)) == ["from jsonl", "reply"]
+    assert store.load_summary(123) == {"text": "old summary"}
+    assert store.append(123, "user", "next") == 2
+    assert contents(store.load(456)) == ["from json"]
+    assert (tmp_path / "123.jsonl.migrated").exists() and not (tmp_path / "123.jsonl").exists()
+    assert not (tmp_path / "123.idx").exists()
+    store.close()
+
+    # Imported once: a fresh store reads the database, not the renamed files.
+    store = open_memory_store({"backend": "sqlite"}, str(tmp_path))
+    assert [r["seq"] for r in store.load(123)] == [0, 1, 2]
+    store.close()
+
+
+def test_sqlite_users_import_users_json(tmp_path):
+    users_json = tmp_path / "users.json"
+    users_json.write_text(json.dumps({"alice": {"password": "hash"}}), encoding="utf-8")
+    users = SQLiteUserStore(str(tmp_path / "zia.sqlite3"), import_path=str(users_json))
+    assert users.get("alice") == {"password": "hash"}
+    assert not users.add("alice", {"password": "other"})
+    assert users.add("bob", {"password": "hash2"})
+    assert set(users.load()) == {"alice", "bob"}
+    assert os.path.exists(str(users_json) + ".migrated")
+    users.close()
@@ -0,0 +1,24 @@
+# tests/test_streaming.py
+from bot.core.streaming import ProgressiveReply, split_message
+
+
+def test_split_message_prefers_line_and_word_breaks():
+    assert split_message("short", 10) == ["short"]
+    assert split_message("aaaa bbbb\ncccc", 10) == ["aaaa bbbb", "cccc"]
+    assert split_message("x" * 25, 10) == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_split_message_never_returns_an_empty_page():
+    assert split_message("x" * 2000 + "\n", 2000) == ["x" * 2000]
+    assert split_message("x" * 2000 + " \n ", 2000) == ["x" * 2000]
+    assert split_message("", 2000) == [""]
+
+
+def test_progressive_reply_sends_no_empty_message():
+    reply = ProgressiveReply(limit=10, interval=0, placeholder="...")
+    reply.feed("x" * 10 + "\n")
+    edits = reply.updates() + reply.updates(final=True)
+    assert all(text for _, text in edits)
+    assert reply.shown == ["x" * 10]
+    reply.feed("more")
+    assert reply.updates(final=True) == [(1, "more")]
@@ -0,0 +1,83 @@
+# tests/test_turns.py
+import asyncio
+from types import SimpleNamespace
+
+from bot.core.context import ApproximateTokenizer, ContextBuilder
+from bot.core.docs import build_docs
+from bot.core.inference import ALL_FAILED_REPLY
+from bot.core.memory import MemoryStore
+from bot.core.metrics import Metrics
+from bot.core.reply_cache import ReplyCache
+from bot.core.summary import Summarizer
+from bot.core.turns import TurnPipeline
+
+PERSONA = {"role": "system", "content": "You are helpful."}
+
+
+class FakeAI:
+    def __init__(self, reply="hello there"):
+        self.reply = reply
+        self.prompts = []
+
+    async def complete(self, messages, max_tokens=None):
+        self.prompts.append(messages)
+        return self.reply
+
+    async def stream(self, messages, max_tokens=None):
+        self.prompts.append(messages)
+        if self.reply is not None:
+            for word in self.reply.split(" "):
+                yield word + " "
+
+
+def make_pipeline(tmp_path, ai, replies=None):
+    memory = MemoryStore(str(tmp_path), log_limit=100, load_limit=10)
+    context = ContextBuilder(ApproximateTokenizer())
+    route = SimpleNamespace(persona=PERSONA, persona_name="default", load_limit=None, max_tokens=50, ai=ai)
+    runtime = SimpleNamespace(
+        memory=memory,
+        context=context,
+        summarizer=Summarizer(memory, context, ai.complete),
+        replies=replies or ReplyCache({"enabled": False}),
+        docs=build_docs({}, str(tmp_path), str(tmp_path)),
+        metrics=Metrics(),
+        table=SimpleNamespace(route=lambda platform, scope: route),
+    )
+    return TurnPipeline(runtime, "test"), runtime
+
+
+def turns_counted(metrics, outcome):
+    return f'zia_turns_total{{outcome="{outcome}",platform="test"}} 1' in metrics.render()
+
+
+def test_call_saves_the_turn_and_uses_history(tmp_path):
+    ai = FakeAI()
+    pipeline, runtime = make_pipeline(tmp_path, ai)
+    assert asyncio.run(pipeline.call(1, "hi")) == "hello there"
+    asyncio.run(pipeline.call(1, "again"))
+    records = runtime.memory.load(1)
+    assert [(r["seq"], r["role"], r["content"]) for r in records] == [
+        (0, "user", "hi"), (1, "assistant", "hello there"), (2, "user", "again"), (3, "assistant", "hello there"),
+    ]
+    assert [m["content"] for m in ai.prompts[-1]] == [PERSONA["content"], "hi", "hello there", "again"]
+
+
+def test_failed_call_is_counted_and_not_saved(tmp_path):
+    pipeline, runtime = make_pipeline(tmp_path, FakeAI(reply=None))
+    assert asyncio.run(pipeline.call(1, "hi")) == ALL_FAILED_REPLY
+    assert runtime.memory.load(1) == []
+    assert turns_counted(runtime.metrics, "failed")
+
+
+def test_stream_saves_the_whole_reply_and_feeds_the_reply_cache(tmp_path):
+    ai = FakeAI()
+    pipeline, runtime = make_pipeline(tmp_path, ai, ReplyCache({"enabled": True, "context_messages": 0, "persist": False}))
+
+    async def collect():
+        return [chunk async for chunk in pipeline.stream(1, "hi")]
+
+    assert "".join(asyncio.run(collect())) == "hello there "
+    assert [r["content"] for r in runtime.memory.load(1)] == ["hi", "hello there "]
+    assert asyncio.run(collect()) == ["hello there "]  # The repeated question comes from the cache, in one piece.
+    assert len(ai.prompts) == 1
+    assert turns_counted(runtime.metrics, "ok") and turns_counted(runtime.metrics, "cached")